@@ -0,0 +1,361 @@
+'''
+Benchmarks of the lexer and parser stages of ctypesgencore.
+
+Each stage runs on its own, on preprocessor output saved earlier, so the
+preprocessor isn't timed and the input is the same on every run:
+
+    pplexer     lex.Lexer with the pplexer rules, turning the preprocessor
+                output into preprocessor tokens
+    bulklexer   the same, with the bulk_lexer option
+    clexer      CLexer, turning preprocessor tokens into C tokens
+    parser      yacc.Parser with the cgrammar rules, given the C tokens
+                CLexer returned in a full parse
+    parseopt    the same, with the parseopt() driver the optimized_parser
+                option uses
+
+A corpus is either a file of saved preprocessor output, or synthetic:N for
+N generated groups of declarations and #defines.  Save the output for the
+bundled FFmpeg headers with
+
+    python benchmark.py --preprocess ffmpeg.i
+
+and run the benchmarks with
+
+    python benchmark.py ffmpeg.i synthetic:2000 > results.json
+
+Every stage runs in a process of its own, so that its peak memory use can
+be told.  For each corpus and stage a line with a JSON object goes to
+stdout, with the number of tokens or reductions, the time of the fastest
+and the median run, the throughput of the fastest run per second, and the
+peak resident set size in kilobytes, once the corpus is read and at the
+end.
+'''
+
+import gc
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import timeit
+
+from ctypesgencore.options import get_default_options
+from ctypesgencore.parser import cparser, ctypesparser
+
+# The headers generate.py makes the bindings for
+headers = ['FFmpeg/include/libavcodec/avcodec.h',
+           'FFmpeg/include/libavdevice/avdevice.h',
+           'FFmpeg/include/libavfilter/avfilter.h',
+           'FFmpeg/include/libavfilter/buffersrc.h',
+           'FFmpeg/include/libavfilter/buffersink.h',
+           'FFmpeg/include/libavformat/avformat.h',
+           'FFmpeg/include/libavutil/avutil.h',
+           'FFmpeg/include/libavutil/audio_fifo.h',
+           'FFmpeg/include/libavutil/imgutils.h',
+           'FFmpeg/include/libpostproc/postprocess.h',
+           'FFmpeg/include/libswresample/swresample.h',
+           'FFmpeg/include/libswscale/swscale.h']
+
+stages = ['pplexer', 'bulklexer', 'clexer', 'parser', 'parseopt']
+
+
+class BenchmarkParser(ctypesparser.CtypesParser):
+    '''A CtypesParser that keeps quiet about errors and progress.'''
+
+    def handle_error(self, message, filename, lineno):
+        pass
+
+    def handle_pp_error(self, message):
+        pass
+
+    def handle_status(self, message):
+        pass
+
+
+class ReplayLexer(object):
+    '''Gives the parser the tokens a CLexer returned in an earlier parse,
+    with the state of the CLexer the grammar looks at.'''
+
+    def __init__(self, clexer, recorded):
+        self.cparser = clexer.cparser
+        self.tokens = clexer.tokens
+        self.line_map = clexer.line_map
+        self.recorded = recorded
+        self.pos = 0
+        self.in_define = False
+
+    def token(self):
+        if self.pos == len(self.recorded):
+            return None
+        t, self.in_define = self.recorded[self.pos]
+        self.pos += 1
+        if t is not None:
+            t.lexer = self
+        return t
+
+    def line_number(self, lexpos):
+        return self.line_map.line(lexpos)
+
+
+def get_options(bulk_lexer=False):
+    options = get_default_options()
+    options.bulk_lexer = bulk_lexer
+    options.include_search_paths = ['./FFmpeg/include']
+    # As in generate.py, where it is set to the tuple (False,)
+    options.no_python_types = True
+    return options
+
+
+def preprocess(path, header_files, options):
+    '''Run the preprocessor on `header_files` and save its output at
+    `path`.'''
+    pp = BenchmarkParser(options).preprocessor_parser
+    text = ''.join(['#include "%s"\n' % os.path.abspath(h)
+                    for h in header_files])
+    job = pp.get_pool().submit(pp.add_input(pp.command(), '<stdin>', text),
+                               text)
+    ppout, pperr = job.result()
+    sys.stderr.write(pperr)
+    f = file(path, 'w')
+    try:
+        f.write(ppout)
+    finally:
+        f.close()
+
+
+def synthetic_corpus(count):
+    '''Return preprocessor output with `count` groups of declarations and
+    #defines, in the form cpp -dD writes it.'''
+    lines = ['# 1 "<synthetic>"']
+    for i in range(count):
+        lines += [
+            'typedef unsigned long size%d_t;' % i,
+            'typedef struct Node%d {' % i,
+            '    int id;',
+            '    const char *name;',
+            '    size%d_t sizes[4];' % i,
+            '    struct Node%d *next;' % i,
+            '    void (*callback)(struct Node%d *node, void *opaque);' % i,
+            '} Node%d;' % i,
+            'enum Kind%d { KIND%d_A = 0, KIND%d_B = 1 << 2, KIND%d_C };'
+                % (i, i, i, i),
+            'extern int node%d_visit(Node%d *node, enum Kind%d kind, '
+                'const char *fmt, ...);' % (i, i, i),
+            'union Value%d { long long i; double d[2]; char s[%d]; };'
+                % (i, i % 64 + 1),
+            'typedef double (*scale%d_fn)(const union Value%d *value, '
+                'float factor);' % (i, i),
+            '#define NODE%d_FLAGS (0x%xU | (1 << %d))' % (i, i, i % 31),
+            '#define NODE%d_NAME "node %d\\n"' % (i, i),
+            '#define NODE%d_MAX(a, b) ((a) > (b) ? (a) : (b))' % i]
+    return '\n'.join(lines) + '\n'
+
+
+def load_corpus(name):
+    if name.startswith('synthetic:'):
+        return synthetic_corpus(int(name[len('synthetic:'):]))
+    f = file(name)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def lex(text, options):
+    '''Return the preprocessor tokens of `text`, and the BenchmarkParser
+    that lexed them.'''
+    parser = BenchmarkParser(options)
+    parser.preprocessor_parser.lex_output(text)
+    parser.lexer.line_map = parser.preprocessor_parser.line_map
+    return list(parser.preprocessor_parser.output), parser
+
+
+def time_lexer(text, runs, options):
+    times = []
+    for i in range(runs):
+        # A new lexer for every run, set up before the timer starts
+        parser = BenchmarkParser(options)
+        pp = parser.preprocessor_parser
+        start = timeit.default_timer()
+        pp.lex_output(text)
+        count = len(list(pp.output))
+        times.append(timeit.default_timer() - start)
+    return count, 'tokens', times
+
+
+def bench_pplexer(text, runs):
+    return time_lexer(text, runs, get_options())
+
+
+def bench_bulklexer(text, runs):
+    return time_lexer(text, runs, get_options(bulk_lexer=True))
+
+
+def bench_clexer(text, runs):
+    options = get_options()
+    tokens, parser = lex(text, options)
+    types = [t.type for t in tokens]
+
+    # A full parse, for the type names the CLexer knows at the end of it
+    parser.lexer.input(tokens)
+    parser.parser.parse(lexer=parser.lexer)
+    type_names = parser.lexer.type_names
+
+    times = []
+    for i in range(runs):
+        for t, type in zip(tokens, types):
+            t.type = type
+        lexer = cparser.CLexer(parser)
+        lexer.type_names = set(type_names)
+        lexer.input(tokens)
+        count = 0
+        start = timeit.default_timer()
+        while lexer.token() is not None:
+            count += 1
+        times.append(timeit.default_timer() - start)
+    return count, 'tokens', times
+
+
+def bench_parser(text, runs, optimized=False):
+    options = get_options()
+    tokens, parser = lex(text, options)
+    clexer = parser.lexer
+
+    # Record the tokens of a full parse, and count its reductions
+    recorded = []
+    def token():
+        t = cparser.CLexer.token(clexer)
+        recorded.append((t, clexer.in_define))
+        return t
+    clexer.token = token
+    reductions = [0]
+    productions = parser.parser.productions
+    counting = []
+    for p in productions:
+        if p is not None and getattr(p, 'func', None):
+            p = counting_production(p, reductions)
+        counting.append(p)
+    parser.parser.productions = counting
+    clexer.input(tokens)
+    parser.parser.parse(lexer=clexer)
+    parser.parser.productions = productions
+    del clexer.token
+
+    if optimized:
+        parse = parser.parser.parseopt
+    else:
+        parse = parser.parser.parse
+    times = []
+    for i in range(runs):
+        lexer = ReplayLexer(clexer, recorded)
+        start = timeit.default_timer()
+        parse(lexer=lexer)
+        times.append(timeit.default_timer() - start)
+    return reductions[0], 'reductions', times
+
+
+def bench_parseopt(text, runs):
+    return bench_parser(text, runs, optimized=True)
+
+
+def counting_production(production, counter):
+    '''Return a copy of `production` whose function counts its calls in
+    counter[0].'''
+    class CountingProduction(object):
+        pass
+    copy = CountingProduction()
+    copy.__dict__.update(production.__dict__)
+    func = production.func
+    def count(p):
+        counter[0] += 1
+        func(p)
+    copy.func = count
+    return copy
+
+
+def peak_rss():
+    '''Return the peak resident set size of the process in kilobytes.'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def run_stage(stage, corpus, runs):
+    text = load_corpus(corpus)
+    base_rss = peak_rss()
+    gc.collect()
+    count, unit, times = globals()['bench_' + stage](text, runs)
+    best = min(times)
+    return {'corpus': corpus,
+            'stage': stage,
+            'unit': unit,
+            'count': count,
+            'runs': runs,
+            'best_seconds': best,
+            'median_seconds': sorted(times)[len(times) // 2],
+            'per_second': best and count / best,
+            'base_rss_kb': base_rss,
+            'peak_rss_kb': peak_rss()}
+
+
+def main():
+    op = optparse.OptionParser(usage='%prog [options] CORPUS...')
+    op.add_option('--preprocess', metavar='FILE',
+                  help='save the preprocessor output for the FFmpeg headers '
+                       'to FILE, and stop')
+    op.add_option('--stage', action='append', dest='stages',
+                  choices=stages,
+                  help='only run this stage; may be given more than once '
+                       '(%s)' % ', '.join(stages))
+    op.add_option('--runs', type='int', default=5,
+                  help='timed runs of each stage [default: %default]')
+    # Without -undef, newer versions of gcc define macros with float
+    # suffixes pplexer doesn't know
+    op.add_option('--cpp', default='gcc -E -undef -D__x86_64__ -D__linux__',
+                  help='preprocessor command for --preprocess '
+                       '[default: %default]')
+    op.add_option('--in-process', action='store_true',
+                  help="don't run each stage in a process of its own; peak "
+                       "memory is then for all stages so far")
+    opts, corpora = op.parse_args()
+
+    # Paths are taken relative to the current directory, but the headers
+    # are found from the directory of this script
+    corpora = [c.startswith('synthetic:') and c or os.path.abspath(c)
+               for c in corpora]
+    script = os.path.abspath(__file__)
+    os.chdir(os.path.dirname(script))
+    if opts.preprocess:
+        options = get_options()
+        options.cpp = opts.cpp
+        preprocess(os.path.abspath(opts.preprocess), headers, options)
+        return
+    if not corpora:
+        op.error('no corpus given')
+
+    for corpus in corpora:
+        for stage in opts.stages or stages:
+            if opts.in_process:
+                result = run_stage(stage, corpus, opts.runs)
+            else:
+                child = subprocess.Popen([sys.executable, script,
+                                          '--child', stage, corpus,
+                                          str(opts.runs)],
+                                         stdout=subprocess.PIPE)
+                output = child.communicate()[0]
+                if child.returncode:
+                    sys.exit('%s failed on %s' % (stage, corpus))
+                result = json.loads(output.splitlines()[-1])
+            print json.dumps(result, sort_keys=True)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        stage, corpus, runs = sys.argv[2:5]
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        print json.dumps(run_stage(stage, corpus, int(runs)))
+    else:
+        main()
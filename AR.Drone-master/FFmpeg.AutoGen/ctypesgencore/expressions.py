@@ -67,19 +67,27 @@ class ConstantExpressionNode(ExpressionNode):
         ExpressionNode.__init__(self)
         self.value = value
 
-    def evaluate(self, context):
-        if isinstance(self.value, basestring) and len(self.value) is 1:
-            return ord(self.value)
+    def constant(self):
+        # String literals from the lexer are only unescaped when needed
+        if hasattr(self.value, 'decoded'):
+            return self.value.decoded()
         return self.value
 
+    def evaluate(self, context):
+        value = self.constant()
+        if isinstance(value, basestring) and len(value) is 1:
+            return ord(value)
+        return value
+
     def py_string(self, can_be_ctype):
+        value = self.constant()
         if sys.platform != 'win32' or (sys.platform == 'win32' and sys.version_info >= (2, 6)):
             # Windows python did not get infinity support until 2.6
-            if self.value == float('inf'):
+            if value == float('inf'):
                 return "float('inf')"
-            elif self.value == float('-inf'):
+            elif value == float('-inf'):
                 return "float('-inf')"
-        return repr(self.value)
+        return repr(value)
 
 class IdentifierExpressionNode(ExpressionNode):
     def __init__(self, name):
@@ -17,7 +17,27 @@ default_values={
     "compile_libdirs": [],
     "runtime_libdirs": [],
     "cpp": "gcc -E",
+    "cpp_defines": [],
     "save_preprocessed_headers": None,
+    "save_token_snapshot": None,
+    "token_snapshot": None,
+    "preprocessor_cache_dir": None,
+    "stream_preprocessor_output": False,
+    "bulk_lexer": False,
+    "lazy_line_numbers": False,
+    "preprocessor_jobs": 4,
+    "preprocessor_engine": "cpp",
+    "system_include_paths": [],
+    "preprocessor_predefines": None,
+    "incremental_manifest": None,
+    "incremental_declarations": False,
+    "system_header_prelude_dir": None,
+    "table_cache_dir": None,
+    "optimized_parser": False,
+    "parser_jobs": 1,
+    "skip_function_bodies": False,
+    "early_path_filter": False,
+    "output_only_from_paths": [],
     "all_headers": False,
     "builtin_symbols": False,
     "include_symbols": None,
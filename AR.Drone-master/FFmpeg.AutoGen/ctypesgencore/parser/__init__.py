@@ -12,13 +12,67 @@ where "options" is an optparse.Values object.
 parse() returns a DescriptionCollection object. See ctypesgencore.descriptions
 for more information.
 
+To parse several sets of headers, preprocessing them in parallel, use
+>>> results = parse_many([(headers1, options1), (headers2, options2)])
+
+To parse the same headers with several sets of extra defines, use
+>>> results = parse_configurations(headers, options,
+...     [("default", []), ("no-deprecated", ["FF_API_OLD_DECODE_AUDIO=0"])])
+
 """
 
+import copy
+
 from datacollectingparser import DataCollectingParser
+from pppool import PreprocessorPool
+from incremental import SegmentCache
 
 def parse(headers, options):
     parser=DataCollectingParser(headers, options)
     parser.parse()
     return parser.data()
 
-__all__ = ["parse"]
+def parse_many(jobs):
+    """Parse several sets of headers, given as a list of (headers, options)
+    pairs, and return a list of their DescriptionCollection objects. The
+    headers of all sets are preprocessed in parallel, running up to
+    preprocessor_jobs processes (from the options of the first set) at
+    once. The parts of the headers that the sets have in common are only
+    lexed and parsed once."""
+    if not jobs:
+        return []
+    pool=PreprocessorPool(jobs[0][1].preprocessor_jobs)
+    segments=SegmentCache()
+    parsers=[DataCollectingParser(headers, options, segments)
+             for headers, options in jobs]
+    for parser in parsers:
+        parser.start(pool)
+    result=[]
+    for parser in parsers:
+        parser.parse()
+        result.append(parser.data())
+    return result
+
+def parse_configurations(headers, options, configurations):
+    """Parse `headers` once for each configuration, given as a list of
+    (name, defines) pairs, and return a list of their DescriptionCollection
+    objects. The defines of a configuration are added to
+    options.cpp_defines. Like parse_many, the parts of the preprocessed
+    headers that are the same in several configurations are only lexed and
+    parsed once.
+
+    Files that options name for one run, such as the incremental manifest,
+    get the name of the configuration appended."""
+    jobs=[]
+    for name, defines in configurations:
+        config=copy.copy(options)
+        config.cpp_defines=list(options.cpp_defines)+list(defines)
+        for attr in ("incremental_manifest", "save_token_snapshot",
+                     "token_snapshot", "save_preprocessed_headers"):
+            path=getattr(options, attr)
+            if path:
+                setattr(config, attr, "%s.%s" % (path, name))
+        jobs.append((headers, config))
+    return parse_many(jobs)
+
+__all__ = ["parse", "parse_many", "parse_configurations"]
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+
+'''
+Lex the preprocessor output in bulk into parallel arrays.
+
+PreprocessorLexer goes through PLY's generic lexer, which for every token
+tries the master regexes of the lexer state one after the other, copies the
+groups of the match into a new LexToken and calls the rule function for it.
+`lex_text` instead matches each token with a single regex that has all the
+rules of the state in the order pplexer gives them, handles the rules inline
+and stores the result in a TokenBuffer: an array of type codes, a list of
+values, an array of line numbers and an array of file codes.  No LexToken is
+created while lexing; iterating over the buffer creates them one at a time,
+as CLexer reads them, so the whole token stream never exists as objects.
+
+The tokens are the same as the ones PreprocessorLexer makes for the same
+text, except that their lexpos is always 0.
+
+Most of the tokens are never asked for their line number, but keeping track
+of it means handling every newline on its own.  A TokenBuffer made with
+lazy_lines=True skips newlines with the whitespace instead, and keeps the
+position of each token.  Its tokens have a lineno of None and their position
+as lexpos; `TokenBuffer.line` finds the line number of a position when it is
+needed, from the line numbers known at a few positions (the start of each
+text, the line number directives and the places where lines were left out)
+and the number of newlines between the closest of them and the position.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import array, bisect, re
+
+import lex
+import pplexer
+from pplexer import RawStringLiteral, punctuators
+
+# The type of every token in a TokenBuffer is an index into TYPES
+TYPES = list(pplexer.tokens) + \
+    sorted(set([p[1] for p in punctuators.values()]) - set(pplexer.tokens))
+TYPES.append('(')
+TYPE_CODES = dict([(type, code) for code, type in enumerate(TYPES)])
+
+class TokenBuffer(object):
+    '''Preprocessor tokens in parallel arrays: `types` holds the code of the
+    type of each token, `values` its value, `lines` its line number and
+    `files` the index of its file name in `filenames`.
+
+    With `lazy_lines`, `lines` holds the position of each token instead,
+    counted over all the texts lexed into the buffer one after the other.
+    `anchor_positions` and `anchor_lines` then hold the positions whose line
+    number is known, in order, and the line numbers at them.'''
+
+    def __init__(self, lazy_lines=False):
+        self.types = array.array('B')
+        self.values = []
+        self.lines = array.array('l')
+        self.files = array.array('H')
+        self.filenames = []
+        self.file_codes = {}
+        self.lazy_lines = lazy_lines
+        self.texts = []
+        self.text_starts = array.array('l')
+        self.length = 0
+        self.anchor_positions = array.array('l')
+        self.anchor_lines = array.array('l')
+
+    def file_code(self, filename):
+        code = self.file_codes.get(filename)
+        if code is None:
+            code = self.file_codes[filename] = len(self.filenames)
+            self.filenames.append(filename)
+        return code
+
+    def line(self, position):
+        '''Return the line number at `position` of a buffer with
+        lazy_lines.'''
+        i = bisect.bisect_right(self.anchor_positions, position) - 1
+        anchor = self.anchor_positions[i]
+        # Each text starts with an anchor, so it is in the same text
+        text = bisect.bisect_right(self.text_starts, position) - 1
+        start = self.text_starts[text]
+        return self.anchor_lines[i] + \
+            self.texts[text].count('\n', anchor - start, position - start)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        types = self.types
+        values = self.values
+        lines = self.lines
+        files = self.files
+        filenames = self.filenames
+        lazy = self.lazy_lines
+        for i in xrange(len(types)):
+            t = lex.LexToken()
+            t.type = TYPES[types[i]]
+            t.value = values[i]
+            if lazy:
+                t.lineno = None
+                t.lexpos = lines[i]
+            else:
+                t.lineno = lines[i]
+                t.lexpos = 0
+            t.filename = filenames[files[i]]
+            yield t
+
+# The rules of each lexer state, in the order of the master regexes of
+# PLY's lexer
+_rules = {
+    'INITIAL': [('directive', pplexer.DIRECTIVE),
+                ('punctuator', pplexer.punctuator_regex(punctuators)),
+                ('identifier', pplexer.IDENTIFIER),
+                ('float', pplexer.FLOAT_LITERAL),
+                ('int', pplexer.INT_LITERAL),
+                ('character_constant', pplexer.CHARACTER_CONSTANT),
+                ('string_literal', pplexer.STRING_LITERAL),
+                ('lparen', r'\('),
+                ('newline', r'\n'),
+                ('pp_define', r'\#define')],
+    'DEFINE': [('directive', pplexer.DIRECTIVE),
+               ('punctuator', pplexer.punctuator_regex(punctuators)),
+               ('define_identifier', pplexer.IDENTIFIER),
+               ('float', pplexer.FLOAT_LITERAL),
+               ('int', pplexer.INT_LITERAL),
+               ('character_constant', pplexer.CHARACTER_CONSTANT),
+               ('string_literal', pplexer.STRING_LITERAL),
+               ('lparen', r'\('),
+               ('define_newline', r'\n'),
+               ('pp_param_op', r'(\#\#)|(\#)')],
+}
+
+_ignore = '[%s]*' % re.escape(pplexer.t_ANY_ignore)
+# Outside a #define, lazy_lines skips newlines like whitespace
+_ignore_newlines = '[%s]*' % re.escape(pplexer.t_ANY_ignore + '\n')
+
+def _state_regex(rules, ignore=_ignore):
+    return re.compile(ignore + '(?:%s)' %
+                      '|'.join(['(?P<%s>%s)' % rule for rule in rules]))
+
+_initial_re = _state_regex(_rules['INITIAL'])
+_define_re = _state_regex(_rules['DEFINE'])
+_ignore_re = re.compile(_ignore)
+_lazy_initial_re = _state_regex([rule for rule in _rules['INITIAL']
+                                  if rule[0] != 'newline'], _ignore_newlines)
+_lazy_ignore_re = re.compile(_ignore_newlines)
+
+# The groups of DIRECTIVE, the same in both states
+_directive_line = _initial_re.groupindex['directive'] + 1
+_directive_file = _directive_line + 1
+
+def lex_text(lexer, data, line_skips, buffer):
+    '''Lex `data` into the TokenBuffer `buffer`, as the PreprocessorLexer
+    `lexer` would after lexer.input(data, line_skips=line_skips).  The file
+    name and line number start from, and are left in, `lexer`.'''
+    skips = line_skips or {}
+    graph = lexer.include_graph
+    filename = lexer.filename
+    lineno = lexer.lineno + skips.get(0, 0)
+
+    types = buffer.types
+    values = buffer.values
+    lines = buffer.lines
+    files = buffer.files
+    file_code = buffer.file_code(filename)
+
+    lazy = buffer.lazy_lines
+    if lazy:
+        base = buffer.length
+        buffer.texts.append(data)
+        buffer.text_starts.append(base)
+        buffer.length += len(data)
+        start_line = lineno
+        # The ends of the line number directives, with their line numbers,
+        # and the tokens with newlines in them, which don't count
+        directives = []
+        multiline = []
+        initial_re = _lazy_initial_re
+        ignore_re = _lazy_ignore_re
+    else:
+        initial_re = _initial_re
+        ignore_re = _ignore_re
+
+    codes = TYPE_CODES
+    IDENTIFIER = codes['IDENTIFIER']
+    PP_NUMBER = codes['PP_NUMBER']
+    punctuator_codes = dict([(value, codes[type])
+                             for value, (regex, type) in punctuators.items()])
+
+    match = initial_re.match
+    next_is_define_name = False
+    macro_params = ()
+    pos = 0
+    end = len(data)
+    while pos < end:
+        m = match(data, pos)
+        if m is None:
+            if match != _define_re.match:
+                pos = ignore_re.match(data, pos).end()
+                if pos == end:
+                    break
+                lexer.filename = filename
+                if lazy:
+                    _add_anchors(buffer, data, base, start_line, directives,
+                                 multiline, skips)
+                    lineno = buffer.line(base + pos)
+                lexer.lineno = lineno
+                raise lex.LexError("Scanning error. Illegal character '%s'" %
+                                   data[pos], data[pos:])
+            pos = _ignore_re.match(data, pos).end()
+            if pos == end:
+                break
+            # An error in a #define: skip the character
+            types.append(codes['OTHER'])
+            values.append(data[pos])
+            if lazy:
+                lines.append(base + pos)
+            else:
+                lines.append(lineno)
+            files.append(file_code)
+            pos += 1
+            continue
+
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'identifier':
+            types.append(IDENTIFIER)
+            values.append(intern(m.group(kind)))
+
+        elif kind == 'punctuator':
+            value = m.group(kind)
+            types.append(punctuator_codes[value])
+            values.append(value)
+
+        elif kind == 'newline':
+            lineno += 1 + skips.get(pos, 0)
+            continue
+
+        elif kind == 'directive':
+            value = m.group(kind)
+            name = m.group(_directive_file)
+            if graph is not None and \
+               '1' in value[value.rindex('"')+1:].split():
+                graph.add(filename, name)
+            filename = name
+            file_code = buffer.file_code(filename)
+            lineno = int(m.group(_directive_line)) + skips.get(pos, 0)
+            if lazy:
+                directives.append((pos, lineno))
+            continue
+
+        elif kind == 'define_identifier':
+            value = intern(m.group(kind))
+            if next_is_define_name:
+                type, params = pplexer.define_name(data, pos)
+                if params is not None:
+                    macro_params = params
+                next_is_define_name = False
+                types.append(codes[type])
+            elif value in macro_params:
+                types.append(codes['PP_MACRO_PARAM'])
+            else:
+                types.append(IDENTIFIER)
+            values.append(value)
+
+        elif kind == 'float':
+            types.append(PP_NUMBER)
+            values.append(pplexer.float_value(m, m.group(kind)))
+
+        elif kind == 'int':
+            types.append(PP_NUMBER)
+            values.append(pplexer.int_value(m.group('ip1'), m.group('isuf')))
+
+        elif kind == 'lparen':
+            start = m.start(kind)
+            if start == 0:
+                previous = None
+            else:
+                previous = data[start-1]
+            if previous is None or previous not in (' \t\f\v\n'):
+                types.append(codes['LPAREN'])
+            else:
+                types.append(codes['('])
+            values.append('(')
+
+        elif kind == 'string_literal':
+            value = m.group(kind)
+            types.append(codes['STRING_LITERAL'])
+            values.append(RawStringLiteral(value))
+            if lazy and '\n' in value:
+                multiline.append((m.start(kind), pos))
+
+        elif kind == 'character_constant':
+            value = m.group(kind)
+            types.append(codes['CHARACTER_CONSTANT'])
+            values.append(value)
+            if lazy and '\n' in value:
+                multiline.append((m.start(kind), pos))
+
+        elif kind == 'pp_define':
+            types.append(codes['PP_DEFINE'])
+            values.append(m.group(kind))
+            match = _define_re.match
+            next_is_define_name = True
+            macro_params = set()
+
+        elif kind == 'define_newline':
+            types.append(codes['PP_END_DEFINE'])
+            values.append('\n')
+            if lazy:
+                lines.append(base + pos - 1)
+            else:
+                lines.append(lineno)
+            files.append(file_code)
+            lineno += 1 + skips.get(pos, 0)
+            match = initial_re.match
+            next_is_define_name = False
+            continue
+
+        elif kind == 'pp_param_op':
+            value = m.group(kind)
+            if value == '#':
+                types.append(codes['PP_STRINGIFY'])
+            else:
+                types.append(codes['PP_IDENTIFIER_PASTE'])
+            values.append(value)
+
+        # A token has no newline in it, except in the rare case noted in
+        # `multiline`, so its end is on the line it starts on
+        if lazy:
+            lines.append(base + pos)
+        else:
+            lines.append(lineno)
+        files.append(file_code)
+
+    if lazy:
+        lineno = _add_anchors(buffer, data, base, start_line, directives,
+                              multiline, skips)
+    lexer.filename = filename
+    lexer.lineno = lineno
+
+def _add_anchors(buffer, data, base, line, directives, multiline, skips):
+    '''Add the positions of a text of a buffer with lazy_lines whose line
+    numbers are known, from the start of the text at `base`, the
+    `directives` and `multiline` tokens lex_text found in it and the
+    `skips`.  Return the line number at the end of the text.'''
+    events = list(directives)
+    directive_ends = set([pos for pos, value in directives])
+    # Like the lexer, only count left out lines after a newline
+    events += [(pos, None) for pos in skips
+               if pos and pos not in directive_ends and data[pos-1] == '\n']
+    events += [(end, start) for start, end in multiline]
+    events.sort()
+
+    positions = buffer.anchor_positions
+    lines = buffer.anchor_lines
+    positions.append(base)
+    lines.append(line)
+    last = 0
+    for pos, value in events:
+        if pos in directive_ends:
+            line = value
+        elif value is None:
+            # Lines were left out after the newline before `pos`
+            line += data.count('\n', last, pos) + skips[pos]
+        else:
+            # Newlines in the token that ended at `pos` aren't counted
+            line += data.count('\n', last, value)
+        positions.append(base + pos)
+        lines.append(line)
+        last = pos
+    return line + data.count('\n', last, len(data))
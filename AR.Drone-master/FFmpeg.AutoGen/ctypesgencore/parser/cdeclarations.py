@@ -172,3 +172,9 @@ def apply_specifiers(specifiers, declaration):
             declaration.type.specifiers.append(s)
         elif type(s) == TypeQualifier:
             declaration.type.qualifiers.append(s)
+
+def declarator_name(declarator):
+    '''Return the identifier `declarator` declares.'''
+    while declarator.pointer:
+        declarator = declarator.pointer
+    return declarator.identifier
@@ -53,6 +53,31 @@ keywords = [
     'while', '__asm__'
 ]
 
+# The token type of each keyword, for looking up identifiers in one step
+keyword_types = dict([(keyword, keyword.upper()) for keyword in keywords])
+
+# Operations of expression nodes that the operator module doesn't have.
+# Expression nodes only refer to module-level functions so that they can be
+# pickled.
+
+def identity(x):
+    return x
+
+def increment(x):
+    return x + 1
+
+def decrement(x):
+    return x - 1
+
+def logical_and(x, y):
+    return x and y
+
+def logical_or(x, y):
+    return x or y
+
+def contents_getattr(x, a):
+    return getattr(x.contents, a)
+
 def p_translation_unit(p):
     '''translation_unit :
                         | translation_unit external_declaration
@@ -89,21 +114,12 @@ def p_constant(p):
     '''
     constant = p[1]
 
-    if constant[0]=="'":
-        # Character constant
-        value = constant[1:-1]
+    if p.slice[1].type == 'CHARACTER_CONSTANT':
+        value = constant[constant.index("'")+1:-1]
     else:
-        # This is a value formatted the way that the preprocessor formats
-        # numeric constants. It puts a prefix "l", "i", or "f" to indicate
-        # if it should be converted into an integer, long or float.
-        prefix = constant[0]
-        constant = constant[1:]
-        if prefix=="i":
-            value = int(constant)
-        elif prefix=="l":
-            value = long(constant)
-        else:
-            value = float(constant)
+        # The preprocessor lexer gives numeric constants their value, an
+        # int, long or float.
+        value = constant
 
     p[0] = expressions.ConstantExpressionNode(value)
 
@@ -121,7 +137,7 @@ def p_multi_string_literal(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("string concatenation",
-            (lambda x,y: x+y), "(%s + %s)", (False,False), p[1], p[2])
+            operator.add, "(%s + %s)", (False,False), p[1], p[2])
 
 def p_macro_param(p):
     '''macro_param : PP_MACRO_PARAM
@@ -159,7 +175,7 @@ def p_postfix_expression(p):
 
     elif p[2]=='[':
         p[0] = expressions.BinaryExpressionNode("array access",
-            (lambda a,b: a[b]), "(%s [%s])", (True,False), p[1], p[3])
+            operator.getitem, "(%s [%s])", (True,False), p[1], p[3])
 
     elif p[2]=='(':
         if p[3]==')':
@@ -169,18 +185,18 @@ def p_postfix_expression(p):
 
     elif p[2]=='.':
         p[0] = expressions.AttributeExpressionNode( \
-            (lambda x,a: getattr(x,a)), "(%s.%s)", p[1],p[3])
+            getattr, "(%s.%s)", p[1],p[3])
 
     elif p[2]=='->':
         p[0] = expressions.AttributeExpressionNode( \
-            (lambda x,a: getattr(x.contents,a)), "(%s.contents.%s)", p[1],p[3])
+            contents_getattr, "(%s.contents.%s)", p[1],p[3])
 
     elif p[2]=='++':
-        p[0] = expressions.UnaryExpressionNode("increment",(lambda x: x+1),
+        p[0] = expressions.UnaryExpressionNode("increment",increment,
                                                "(%s + 1)", False,p[1])
 
     elif p[2]=='--':
-        p[0] = expressions.UnaryExpressionNode("decrement",(lambda x: x-1),
+        p[0] = expressions.UnaryExpressionNode("decrement",decrement,
                                                "(%s - 1)", False,p[1])
 
 def p_argument_expression_list(p):
@@ -225,14 +241,14 @@ def p_volatile_opt(p):
     '''
 
 prefix_ops_dict = {
-    "++": ("increment",(lambda x: x+1),"(%s + 1)",False),
-    "--": ("decrement",(lambda x: x-1),"(%s - 1)",False),
+    "++": ("increment",increment,"(%s + 1)",False),
+    "--": ("decrement",decrement,"(%s - 1)",False),
     '&': ("reference ('&')",None,"pointer(%s)",True),
     '*': ("dereference ('*')",None,"(%s[0])",True),
-    '+': ("unary '+'",(lambda x: x),"%s",True),
-    '-': ("negation",(lambda x: -x),"(-%s)",False),
-    '~': ("inversion",(lambda x: ~x),"(~%s)",False),
-    '!': ("logical not",(lambda x: not x),"(not %s)",True)
+    '+': ("unary '+'",identity,"%s",True),
+    '-': ("negation",operator.neg,"(-%s)",False),
+    '~': ("inversion",operator.invert,"(~%s)",False),
+    '!': ("logical not",operator.not_,"(not %s)",True)
 }
 
 def p_unary_expression(p):
@@ -278,9 +294,9 @@ def p_cast_expression(p):
         p[0] = expressions.TypeCastExpressionNode(p[4],p[2])
 
 mult_ops_dict = {
-    '*': ("multiplication", (lambda x,y: x*y), "(%s * %s)"),
-    '/': ("division", (lambda x,y: x/y), "(%s / %s)"),
-    '%': ("modulo", (lambda x,y: x%y), "(%s %% %s)")
+    '*': ("multiplication", operator.mul, "(%s * %s)"),
+    '/': ("division", operator.div, "(%s / %s)"),
+    '%': ("modulo", operator.mod, "(%s %% %s)")
 }
 
 def p_multiplicative_expression(p):
@@ -297,8 +313,8 @@ def p_multiplicative_expression(p):
             p[1], p[3])
 
 add_ops_dict = {
-    '+': ("addition", (lambda x,y: x+y), "(%s + %s)"),
-    '-': ("subtraction", (lambda x,y: x-y), "(%s - %s)")
+    '+': ("addition", operator.add, "(%s + %s)"),
+    '-': ("subtraction", operator.sub, "(%s - %s)")
 }
 
 def p_additive_expression(p):
@@ -314,8 +330,8 @@ def p_additive_expression(p):
             p[1], p[3])
 
 shift_ops_dict = {
-    '>>': ("right shift", (lambda x,y: x>>y), "(%s >> %s)"),
-    '<<': ("left shift", (lambda x,y: x<<y), "(%s << %s)")
+    '>>': ("right shift", operator.rshift, "(%s >> %s)"),
+    '<<': ("left shift", operator.lshift, "(%s << %s)")
 }
 
 def p_shift_expression(p):
@@ -331,10 +347,10 @@ def p_shift_expression(p):
             p[1], p[3])
 
 rel_ops_dict = {
-    '>': ("greater-than", (lambda x,y: x>y), "(%s > %s)"),
-    '<': ("less-than", (lambda x,y: x<y), "(%s < %s)"),
-    '>=': ("greater-than-equal", (lambda x,y: x>=y), "(%s >= %s)"),
-    '<=': ("less-than-equal", (lambda x,y: x<=y), "(%s <= %s)")
+    '>': ("greater-than", operator.gt, "(%s > %s)"),
+    '<': ("less-than", operator.lt, "(%s < %s)"),
+    '>=': ("greater-than-equal", operator.ge, "(%s >= %s)"),
+    '<=': ("less-than-equal", operator.le, "(%s <= %s)")
 }
 
 def p_relational_expression(p):
@@ -352,8 +368,8 @@ def p_relational_expression(p):
             p[1], p[3])
 
 equality_ops_dict = {
-    '==': ("equals", (lambda x,y: x==y), "(%s == %s)"),
-    '!=': ("not equals", (lambda x,y: x!=y), "(%s != %s)")
+    '==': ("equals", operator.eq, "(%s == %s)"),
+    '!=': ("not equals", operator.ne, "(%s != %s)")
 }
 
 def p_equality_expression(p):
@@ -376,7 +392,7 @@ def p_and_expression(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("bitwise and",
-            (lambda x,y: x&y), "(%s & %s)", (False,False), p[1], p[3])
+            operator.and_, "(%s & %s)", (False,False), p[1], p[3])
 
 def p_exclusive_or_expression(p):
     '''exclusive_or_expression : and_expression
@@ -386,7 +402,7 @@ def p_exclusive_or_expression(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("bitwise xor",
-            (lambda x,y: x^y), "(%s ^ %s)", (False,False), p[1], p[3])
+            operator.xor, "(%s ^ %s)", (False,False), p[1], p[3])
 
 def p_inclusive_or_expression(p):
     '''inclusive_or_expression : exclusive_or_expression
@@ -396,7 +412,7 @@ def p_inclusive_or_expression(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("bitwise or",
-            (lambda x,y: x|y), "(%s | %s)", (False,False), p[1], p[3])
+            operator.or_, "(%s | %s)", (False,False), p[1], p[3])
 
 def p_logical_and_expression(p):
     '''logical_and_expression : inclusive_or_expression
@@ -406,7 +422,7 @@ def p_logical_and_expression(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("logical and",
-            (lambda x,y: x and y), "(%s and %s)", (True,True), p[1], p[3])
+            logical_and, "(%s and %s)", (True,True), p[1], p[3])
 
 def p_logical_or_expression(p):
     '''logical_or_expression : logical_and_expression
@@ -416,7 +432,7 @@ def p_logical_or_expression(p):
         p[0] = p[1]
     else:
         p[0] = expressions.BinaryExpressionNode("logical and",
-            (lambda x,y: x or y), "(%s or %s)", (True,True), p[1], p[3])
+            logical_or, "(%s or %s)", (True,True), p[1], p[3])
 
 def p_conditional_expression(p):
     '''conditional_expression : logical_or_expression
@@ -428,16 +444,16 @@ def p_conditional_expression(p):
         p[0] = expressions.ConditionalExpressionNode(p[1], p[3], p[5])
 
 assign_ops_dict = {
-    '*=': ("multiply", (lambda x,y: x*y), "(%s * %s)"),
-    '/=': ("divide", (lambda x,y: x/y), "(%s / %s)"),
-    '%=': ("modulus", (lambda x,y: x%y), "(%s % %s)"),
-    '+=': ("addition", (lambda x,y: x+y), "(%s + %s)"),
-    '-=': ("subtraction", (lambda x,y: x-y), "(%s - %s)"),
-    '<<=': ("left shift", (lambda x,y: x<<y), "(%s << %s)"),
-    '>>=': ("right shift",(lambda x,y: x>>y),"(%s >> %s)"),
-    '&=': ("bitwise and", (lambda x,y: x&y), "(%s & %s)"),
-    '^=': ("bitwise xor", (lambda x,y: x^y), "(%s ^ %s)"),
-    '|=': ("bitwise or", (lambda x,y: x|y), "(%s | %s)")
+    '*=': ("multiply", operator.mul, "(%s * %s)"),
+    '/=': ("divide", operator.div, "(%s / %s)"),
+    '%=': ("modulus", operator.mod, "(%s % %s)"),
+    '+=': ("addition", operator.add, "(%s + %s)"),
+    '-=': ("subtraction", operator.sub, "(%s - %s)"),
+    '<<=': ("left shift", operator.lshift, "(%s << %s)"),
+    '>>=': ("right shift",operator.rshift,"(%s >> %s)"),
+    '&=': ("bitwise and", operator.and_, "(%s & %s)"),
+    '^=': ("bitwise xor", operator.xor, "(%s ^ %s)"),
+    '|=': ("bitwise or", operator.or_, "(%s | %s)")
 }
 
 def p_assignment_expression(p):
@@ -499,12 +515,12 @@ def p_declaration_impl(p):
 
     if len(p) == 2:
         filename = p.slice[1].filename
-        lineno = p.slice[1].lineno
+        lineno = p.lineno(1)
         p.parser.cparser.impl_handle_declaration(declaration, filename, lineno)
         return
 
     filename = p.slice[2].filename
-    lineno = p.slice[2].lineno
+    lineno = p.lineno(2)
     for declarator in p[2]:
         declaration.declarator = declarator
         p.parser.cparser.impl_handle_declaration(declaration, filename, lineno)
@@ -593,7 +609,7 @@ def p_struct_or_union_specifier(p):
         p[0] = cdeclarations.StructTypeSpecifier(p[1], p[2], p[4])
 
     p[0].filename = p.slice[0].filename
-    p[0].lineno = p.slice[0].lineno
+    p[0].lineno = p.lineno(0)
 
 def p_struct_or_union(p):
     '''struct_or_union : STRUCT
@@ -678,7 +694,7 @@ def p_enum_specifier(p):
         p[0] = cdeclarations.EnumSpecifier(p[2], ())
 
     p[0].filename = p.slice[0].filename
-    p[0].lineno = p.slice[0].lineno
+    p[0].lineno = p.lineno(0)
 
 def p_enumerator_list(p):
     '''enumerator_list : enumerator_list_iso
@@ -1017,7 +1033,7 @@ def p_define(p):
     '''
 
     filename = p.slice[1].filename
-    lineno = p.slice[1].lineno
+    lineno = p.lineno(1)
 
     if p[3] != '(':
         if len(p) == 4:
@@ -1041,7 +1057,7 @@ def p_define(p):
                 expr = p[6]
 
         filename = p.slice[1].filename
-        lineno = p.slice[1].lineno
+        lineno = p.lineno(1)
 
         p.parser.cparser.handle_define_macro(p[2], params, expr, filename, lineno)
 
@@ -1058,7 +1074,7 @@ def p_define_error(p):
     name = clexdata[start+1].value
     if clexdata[start+1].type == 'PP_DEFINE_NAME':
         params = None
-        contents = [t.value for t in clexdata[start+2:end]]
+        contents = [str(t.value) for t in clexdata[start+2:end]]
     else:
         end_of_param_list = start
         while clexdata[end_of_param_list].value != ')' and \
@@ -1066,10 +1082,11 @@ def p_define_error(p):
             end_of_param_list += 1
         params = [t.value for t in clexdata[start+3:end_of_param_list] if \
                     t.value != ',']
-        contents = [t.value for t in clexdata[end_of_param_list+1:end]]
+        contents = [str(t.value) for t in
+                    clexdata[end_of_param_list+1:end]]
 
     filename = p.slice[1].filename
-    lineno = p.slice[1].lineno
+    lineno = p.lineno(1)
 
     p[2].lexer.cparser.handle_define_unparseable(name, params, contents, \
                                                  filename, lineno)
@@ -1085,16 +1102,19 @@ def p_macro_parameter_list(p):
         p[0] = p[1]
 
 def p_error(t):
-    if t.lexer.in_define:
+    # The $end symbol has no lexer
+    if t.type == '$end':
+        t.parser.cparser.handle_error('Syntax error at end of file.',
+             t.filename, 0)
+    elif t.lexer.in_define:
         # p_define_error will generate an error message.
         pass
     else:
-        if t.type == '$end':
-            t.parser.cparser.handle_error('Syntax error at end of file.',
-                 t.filename, 0)
-        else:
-            t.lexer.cparser.handle_error('Syntax error at %r' % t.value,
-                 t.filename, t.lineno)
+        lineno = t.lineno
+        if lineno is None:
+            lineno = t.lexer.line_number(t.lexpos)
+        t.lexer.cparser.handle_error('Syntax error at %r' % t.value,
+             t.filename, lineno)
     # Don't alter lexer: default behaviour is to pass error production
     # up until it hits the catch-all at declaration, at which point
     # parsing continues (synchronisation).
@@ -20,53 +20,591 @@ import preprocessor
 import yacc
 import cgrammar
 import cdeclarations
+import incremental
+import prelude
+import tokensnapshot
+import tablecache
 
 # --------------------------------------------------------------------------
 # Lexer
 # --------------------------------------------------------------------------
 
+class TokenWindow(object):
+    '''A list-like view of a token stream that only holds on to the tokens
+    still needed.
+
+    Tokens are indexed by their position in the whole stream, and read from
+    the underlying iterator by `fetch`.  Tokens before the position given to
+    `release` are dropped.'''
+
+    # Dropping tokens from the front of the list is linear in the number of
+    # tokens kept, so only do it once this many can go
+    release_size = 256
+
+    def __init__(self, tokens):
+        self.iterator = iter(tokens)
+        self.buffer = []
+        self.offset = 0
+
+    def __len__(self):
+        return self.offset + len(self.buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.buffer[index.start - self.offset:
+                               index.stop - self.offset]
+        return self.buffer[index - self.offset]
+
+    def fetch(self):
+        '''Read the next token into the window.  Return False at the end of
+        the stream.'''
+        for t in self.iterator:
+            self.buffer.append(t)
+            return True
+        return False
+
+    def release(self, index):
+        if index - self.offset >= self.release_size:
+            del self.buffer[:index - self.offset]
+            self.offset = index
+
+class CToken(object):
+    '''A token for the parser, made by CLexer from a preprocessor token.
+
+    The preprocessor tokens are left as they are, so that they can be looked
+    at again (see p_define_error and IncrementalCLexer) or shared.'''
+    __slots__ = ['type', 'value', 'lineno', 'lexpos', 'filename', 'lexer',
+                 'clexpos']
+
+    def __str__(self):
+        return "CToken(%s,%r,%r,%d)" % (self.type, self.value, self.lineno,
+                                         self.lexpos)
+
+    def __repr__(self):
+        return str(self)
+
+# Preprocessor token types that stand for another C token type
+pp_token_types = {'LPAREN': '(', 'PP_NUMBER': 'CONSTANT'}
+
+# Keywords before which a type name is the tag of a struct, union or enum
+tag_keywords = ('enum', 'struct', 'union')
+
+# GCC extensions left out with their parenthesised arguments when function
+# bodies are skipped, and the words that may come between an asm and its
+# arguments
+skipped_extensions = ('__attribute__', '__attribute', '__asm__', '__asm',
+                      'asm')
+asm_qualifiers = ('volatile', '__volatile__', '__volatile', 'goto', 'inline')
+
+# Preprocessor tokens a skipped run of tokens never goes past
+skip_barriers = ('PP_DEFINE', 'PP_END_DEFINE', 'PP_PRELUDE')
+
 class CLexer(object):
     def __init__(self, cparser):
         self.cparser = cparser
+        self.handlers = cparser
         self.type_names = set()
         self.in_define = False
+        # The Prelude of the system headers left out of the input, if any
+        self.prelude = None
+        # What looks up the line numbers of tokens whose lineno is None
+        self.line_map = None
+        # Whether to give the parser function bodies as {}, and leave out
+        # __attribute__ and asm outside #defines
+        self.skip_bodies = False
 
     def input(self, tokens):
+        '''Start lexing `tokens`, which is either a list or any other
+        iterable of preprocessor tokens, read as they are needed.'''
+        if not isinstance(tokens, list):
+            tokens = TokenWindow(tokens)
         self.tokens = tokens
         self.pos = 0
+        self.define_start = None
+        self.define_end = None
+        # Handler calls to make at the next call of `token`
+        self.replaying = []
+        # Returns the next token for the parser, without making the calls
+        # that are due first
+        self.next_token = self.classify().next
+
+    def release(self):
+        '''Let go of the tokens of a streamed input that won't be looked at
+        again.'''
+        # p_define_error looks back at the tokens of a #define when the
+        # token after it has been read, so keep them until the next one.
+        if self.define_start is not None and \
+           self.define_end > self.define_start and \
+           self.pos > self.define_end + 1:
+            self.define_start = None
+        if self.define_start is None:
+            self.tokens.release(self.pos - 2)
+        else:
+            self.tokens.release(min(self.pos - 2, self.define_start))
 
     def token(self):
-        while self.pos < len(self.tokens):
-            t = self.tokens[self.pos]
-
-            self.pos += 1
+        if self.replaying:
+            self.replay()
+        return self.next_token()
+
+    def classify(self):
+        '''Generate the tokens for the parser from the preprocessor tokens
+        at self.pos on, and None at the end of them.'''
+        tokens = self.tokens
+        streaming = isinstance(tokens, TokenWindow)
+        keyword_types = cgrammar.keyword_types
+        type_names = self.type_names
+        skip = self.skip_bodies
+        # For telling function bodies: the depth of braces of the tokens
+        # given to the parser, whether there was an = at the top level of
+        # the declaration, and the type of the last token
+        braces = 0
+        initializer = False
+        previous = None
+
+        while True:
+            if streaming:
+                self.release()
+            pos = self.pos
+            if pos >= len(tokens) and not (streaming and tokens.fetch()):
+                yield None
+                continue
+            t = tokens[pos]
+            self.pos = pos + 1
 
             if not t:
-                break
+                yield None
+                continue
 
-            if t.type == 'PP_DEFINE':
+            # Transform PP tokens into C tokens
+            type = t.type
+            if skip and not self.in_define:
+                if type == 'IDENTIFIER' and t.value in skipped_extensions:
+                    end = self.extension_end(pos)
+                    if end is not None:
+                        self.pos = end
+                        continue
+                elif type == '{':
+                    if not braces and previous == ')' and not initializer:
+                        end = self.balanced_end(pos)
+                        if end is not None:
+                            # The parser is given the { and the } only
+                            self.pos = end - 1
+                    braces += 1
+                elif type == '}':
+                    if braces:
+                        braces -= 1
+                    if not braces:
+                        initializer = False
+                elif not braces:
+                    if type == ';':
+                        initializer = False
+                    elif type == '=':
+                        initializer = True
+                previous = type
+
+            if type == 'IDENTIFIER':
+                value = t.value
+                if value in keyword_types:
+                    type = keyword_types[value]
+                elif value in type_names and not self.after_tag(pos):
+                    type = 'TYPE_NAME'
+            elif type in pp_token_types:
+                type = pp_token_types[type]
+            elif type == 'PP_DEFINE':
                 self.in_define = True
-            elif t.type == 'PP_END_DEFINE':
+                self.define_start = pos
+                self.define_end = -1
+            elif type == 'PP_END_DEFINE':
                 self.in_define = False
+                self.define_end = pos
+            elif type == 'PP_PRELUDE':
+                self.prelude_part(t.value)
+                continue
+
+            c = CToken()
+            c.type = type
+            c.value = t.value
+            c.lineno = t.lineno
+            c.lexpos = t.lexpos
+            c.filename = t.filename
+            c.lexer = self
+            c.clexpos = pos
+            yield c
+
+    def balanced_end(self, pos):
+        '''Return the position after the bracket that closes the one at
+        `pos`, or None if there is none before the end of the file or
+        #define it is in.'''
+        tokens = self.tokens
+        streaming = isinstance(tokens, TokenWindow)
+        first = tokens[pos]
+        if first.type == '{':
+            opening, closing = ('{',), '}'
+        else:
+            opening, closing = ('(', 'LPAREN'), ')'
+        depth = 0
+        while pos < len(tokens) or (streaming and tokens.fetch()):
+            t = tokens[pos]
+            if not t or t.filename != first.filename or \
+               t.type in skip_barriers:
+                return None
+            if t.type in opening:
+                depth += 1
+            elif t.type == closing:
+                depth -= 1
+                if not depth:
+                    return pos + 1
+            pos += 1
+        return None
 
-            # Transform PP tokens into C tokens
-            elif t.type == 'LPAREN':
-                t.type = '('
-            elif t.type == 'PP_NUMBER':
-                t.type = 'CONSTANT'
-            elif t.type == 'IDENTIFIER' and t.value in cgrammar.keywords:
-                t.type = t.value.upper()
-            elif t.type == 'IDENTIFIER' and t.value in self.type_names:
-                if (self.pos < 2 or self.tokens[self.pos-2].type not in
-                    ('ENUM', 'STRUCT', 'UNION')):
-                    t.type = 'TYPE_NAME'
-
-            t.lexer = self
-            t.clexpos = self.pos - 1
-
-            return t
+    def extension_end(self, pos):
+        '''Return the position after the __attribute__ or asm at `pos` and
+        its arguments, or None if they don't end in the same file.'''
+        tokens = self.tokens
+        streaming = isinstance(tokens, TokenWindow)
+        pos += 1
+        while pos < len(tokens) or (streaming and tokens.fetch()):
+            t = tokens[pos]
+            if not t:
+                return None
+            if t.type in ('(', 'LPAREN'):
+                return self.balanced_end(pos)
+            if t.type != 'IDENTIFIER' or t.value not in asm_qualifiers:
+                return None
+            pos += 1
         return None
 
+    def line_number(self, lexpos):
+        '''Return the line number of a token that left it to be looked up
+        from its lexpos.'''
+        return self.line_map.line(lexpos)
+
+    def finish(self):
+        '''Make the calls still due after the parser is done.'''
+        self.replay()
+
+    def close(self):
+        '''Let go of the input once the parser is done with it.'''
+        self.tokens = []
+        self.next_token = None
+        self.line_map = None
+
+    def replay(self):
+        calls, self.replaying = self.replaying, []
+        for name, args in calls:
+            getattr(self.handlers, name)(*args)
+
+    def prelude_part(self, index):
+        '''Declare the type names of a part of the prelude, which stands for
+        system header lines left out of the input, and make its calls once
+        the parser is done with the declaration before them.'''
+        type_names, calls = self.prelude.part(index)
+        self.type_names.update(type_names)
+        self.replaying.extend(calls)
+
+    def after_tag(self, pos):
+        '''Return True if the preprocessor token before `pos` is struct,
+        union or enum.'''
+        if pos < 1:
+            return False
+        t = self.tokens[pos-1]
+        return t.type == 'IDENTIFIER' and t.value in tag_keywords
+
+    def c_type(self, t, pos):
+        '''Return the type of C token the preprocessor token `t` at `pos`
+        turns into.'''
+        if t.type == 'IDENTIFIER':
+            if t.value in cgrammar.keyword_types:
+                return cgrammar.keyword_types[t.value]
+            elif t.value in self.type_names and not self.after_tag(pos):
+                return 'TYPE_NAME'
+        return pp_token_types.get(t.type, t.type)
+
+class DeclarationSplitter(object):
+    '''Tells where the top-level declarations and #defines in a run of
+    preprocessor tokens end, going by the tokens alone: at a ; outside
+    braces and parentheses, at the } that closes a function body, and at
+    the end of a #define.  `braces` is the depth of braces at the token
+    last given to `ends`.'''
+
+    def __init__(self):
+        self.braces = 0
+        self.parens = 0
+        self.function_body = False
+        self.define = False
+        self.previous = None
+
+    def ends(self, t):
+        '''Return True if the token `t` ends a declaration or #define.'''
+        type = t.type
+        end = False
+        if self.define:
+            # Macro bodies may have any tokens in them
+            if type == 'PP_END_DEFINE':
+                self.define = False
+                end = not self.braces and not self.parens
+        elif type == 'PP_DEFINE':
+            self.define = True
+        elif type == '{':
+            if not self.braces and self.previous == ')':
+                self.function_body = True
+            self.braces += 1
+        elif type == '}':
+            # Closing braces of a declaration that started in another file
+            # are passed over
+            if self.braces:
+                self.braces -= 1
+                end = not self.braces and self.function_body
+        elif self.braces:
+            pass
+        elif type in ('(', 'LPAREN'):
+            self.parens += 1
+        elif type == ')':
+            if self.parens:
+                self.parens -= 1
+        elif type == ';':
+            end = not self.parens
+        self.previous = type
+
+        if end:
+            self.braces = self.parens = 0
+            self.function_body = False
+        return end
+
+class Segment(object):
+    '''A run of tokens from one file that the parser is given, and the
+    handler calls made for it.'''
+    def __init__(self, key, clean_start, lineno=None):
+        self.key = key
+        self.clean_start = clean_start
+        self.lineno = lineno
+        self.clean_end = False
+        self.errors = False
+        self.calls = []
+
+class IncrementalCLexer(CLexer):
+    '''A CLexer that leaves out the segments of the token stream whose
+    handler calls are saved in the manifest of an earlier run, or in a
+    SegmentCache shared with other parsers, and makes those calls instead.
+
+    A segment is only left out if the parser is between two top-level
+    declarations where it starts.  Likewise the calls of a segment are only
+    saved if the parser was between declarations where it started and where
+    it ended, and there were no syntax errors in it.
+
+    The parser finishes a #define only after it has read the token after
+    it, so the calls of the segments left out are made at the next call of
+    `token`, and the calls the parser makes while a token is the lookahead
+    belong to the segment of the token before it.
+
+    If `declarations` is True, every top-level declaration and #define is
+    a segment of its own, and its key is made from the lines of its tokens
+    relative to the first.  A declaration that was only moved then keeps
+    its key, and the line numbers in its calls are moved with it, so an
+    edit to a header only has the declarations it touches parsed again.'''
+
+    def __init__(self, cparser, shared=None, declarations=False):
+        super(IncrementalCLexer, self).__init__(cparser)
+        self.parser = cparser.parser
+        self.manifest = incremental.Manifest()
+        # The header_names of the headers to parse again
+        self.changed = set()
+        # A SegmentCache shared with other parsers, or None
+        self.shared = shared
+        self.declarations = declarations
+
+    def input(self, tokens):
+        super(IncrementalCLexer, self).input(tokens)
+        self.segments = {}
+        # Whether each file of the tokens is in self.changed
+        self.changed_files = {}
+        # The first line of each segment, if declarations is True
+        self.lines = {}
+        self.segment_end = 0
+        self.current = None
+        self.lookahead_segment = None
+        self.previous_segment = None
+        self.closing = []
+        self.parsed = 0
+        self.skipped = 0
+
+    def token(self):
+        self.replay()
+        for segment in self.closing:
+            self.close_segment(segment)
+        self.closing = []
+
+        while self.pos >= self.segment_end and self.start_segment():
+            pass
+
+        t = self.next_token()
+        self.previous_segment = self.lookahead_segment
+        self.lookahead_segment = self.current
+        return t
+
+    def finish(self):
+        '''Make the calls still due after the parser is done, and collect
+        the segments that can be saved.'''
+        self.replay()
+        self.end_segment(False)
+        for segment in self.closing:
+            self.close_segment(segment)
+        self.closing = []
+
+    def start_segment(self):
+        '''Find the end of the segment starting at self.pos and leave it out
+        if its calls are known.  Return False at the end of the stream.'''
+        streaming = isinstance(self.tokens, TokenWindow)
+        start = self.pos
+        if start < len(self.tokens) or (streaming and self.tokens.fetch()):
+            first = self.tokens[start]
+        else:
+            first = None
+        if not first:
+            self.end_segment(self.idle('$end'))
+            self.segment_end = sys.maxint
+            return False
+        if first.type == 'PP_PRELUDE':
+            # Left out system header lines, see prelude.py
+            self.pos = self.segment_end = start + 1
+            self.prelude_part(first.value)
+            return True
+
+        end = self.find_segment_end(start)
+        self.segment_end = end
+
+        clean = self.idle(self.c_type(first, start))
+        self.end_segment(clean)
+        key = self.segment_key(start, end)
+        calls = None
+        # The keys of declarations cover all there is to them, so they can
+        # be reused from a changed header
+        if clean and (self.declarations or
+                      not self.file_changed(first.filename)):
+            found = self.manifest
+            calls = found.segments.get(key)
+            if calls is None and self.shared is not None:
+                found = self.shared
+                calls = found.segments.get(key)
+        if calls is None:
+            self.current = Segment(key, clean, first.lineno)
+            self.parsed += 1
+            return True
+
+        self.segments[key] = calls
+        calls = self.load_calls(calls)
+        if self.declarations:
+            lineno = found.lines[key]
+            self.lines[key] = lineno
+            if first.lineno != lineno:
+                calls = incremental.move_lines(calls, first.lineno - lineno)
+        for name, args in calls:
+            # The tokens after the segment have to be lexed knowing the
+            # types it defines
+            if name == 'impl_handle_declaration' and \
+               args[0].storage == 'typedef' and args[0].declarator:
+                self.type_names.add(
+                    cdeclarations.declarator_name(args[0].declarator))
+        self.replaying.extend(calls)
+        self.pos = end
+        self.skipped += 1
+        return True
+
+    def file_changed(self, filename):
+        changed = self.changed_files.get(filename)
+        if changed is None:
+            changed = incremental.header_name(filename) in self.changed
+            self.changed_files[filename] = changed
+        return changed
+
+    def find_segment_end(self, start):
+        '''Return the end of the segment starting at `start`: the next
+        token from another file, or the start of the #defines.'''
+        streaming = isinstance(self.tokens, TokenWindow)
+        first = self.tokens[start]
+        splitter = None
+        if self.declarations:
+            splitter = DeclarationSplitter()
+            if splitter.ends(first):
+                return start + 1
+        end = start + 1
+        while end < len(self.tokens) or (streaming and self.tokens.fetch()):
+            t = self.tokens[end]
+            if not t or t.filename != first.filename or \
+               t.type == 'PP_PRELUDE':
+                break
+            # The #defines of a file come after all source lines
+            if t.type == 'PP_DEFINE' and \
+               self.tokens[end-1].type != 'PP_END_DEFINE':
+                break
+            end += 1
+            if splitter is not None and splitter.ends(t):
+                break
+        return end
+
+    def segment_key(self, start, end):
+        first = self.tokens[start]
+        if self.declarations:
+            base = first.lineno
+        else:
+            base = None
+        return incremental.segment_key(first.filename,
+                                       self.tokens[start:end],
+                                       self.type_names, base,
+                                       self.skip_bodies)
+
+    def load_calls(self, calls):
+        '''Return the (name, args) pairs of the saved calls `calls`.'''
+        return [incremental.load_call(call) for call in calls]
+
+    def end_segment(self, clean):
+        if self.current is not None:
+            self.current.clean_end = clean
+            self.closing.append(self.current)
+            self.current = None
+
+    def close_segment(self, segment):
+        if segment.clean_start and segment.clean_end and not segment.errors:
+            self.segments[segment.key] = segment.calls
+            if self.declarations:
+                self.lines[segment.key] = segment.lineno
+            if self.shared is not None:
+                self.shared.segments[segment.key] = segment.calls
+                if self.declarations:
+                    self.shared.lines[segment.key] = segment.lineno
+
+    def record(self, name, args):
+        '''Called by the EventRecorder for each handler call.'''
+        if name == 'handle_error':
+            for segment in (self.previous_segment, self.lookahead_segment):
+                if segment is not None:
+                    segment.errors = True
+            return
+        segment = self.previous_segment or self.lookahead_segment
+        if segment is not None:
+            segment.calls.append(incremental.save_call(name, args))
+
+    def idle(self, type):
+        '''Return True if the parser is between two top-level declarations
+        once it has made the reductions it makes before a token of `type`.'''
+        parser = self.parser
+        if parser.errorcount:
+            return False
+        code = parser.codes.get(type, 0)
+        stack = parser.statestack[:]
+        while True:
+            action = parser.action_table[stack[-1]][code]
+            if action is None or action >= 0:
+                break
+            production = parser.productions[-action]
+            if production.len:
+                del stack[-production.len:]
+            stack.append(parser.goto_table[stack[-1]][
+                parser.prodcodes[-action]])
+        start = parser.goto_table[0][parser.codes['translation_unit']]
+        return action is not None and stack == [0, start]
+
 # --------------------------------------------------------------------------
 # Parser
 # --------------------------------------------------------------------------
@@ -77,23 +615,48 @@ class CParser(object):
     Subclass and override the handle_* methods.  Call `parse` with a string
     to parse.
     '''
-    def __init__(self, options):
+    def __init__(self, options, segment_cache=None):
         self.preprocessor_parser = preprocessor.PreprocessorParser(options,self)
+        self.preprocessor_parser.segment_cache = segment_cache
         self.parser = yacc.Parser()
-        prototype = yacc.yacc(method        = 'LALR',
-                              debug         = False,
-                              module        = cgrammar,
-                              write_tables  = True,
-                              outputdir     = os.path.dirname(__file__),
-                              optimize      = True)
+        if options.table_cache_dir:
+            cache = tablecache.get_table_cache(options.table_cache_dir)
+            prototype = cache.parser_prototype()
+        else:
+            prototype = yacc.yacc(method        = 'LALR',
+                                  debug         = False,
+                                  module        = cgrammar,
+                                  write_tables  = True,
+                                  outputdir     = os.path.dirname(__file__),
+                                  optimize      = True)
 
         # If yacc is reading tables from a file, then it won't find the error
         # function... need to set it manually
         prototype.errorfunc = cgrammar.p_error
         prototype.init_parser(self.parser)
         self.parser.cparser = self
-
-        self.lexer = CLexer(self)
+        self.optimized_parser = options.optimized_parser
+
+        # Objects that are told about the handler calls of the grammar
+        listeners = []
+        self.manifest_path = options.incremental_manifest
+        if self.manifest_path or segment_cache is not None:
+            self.lexer = IncrementalCLexer(self, segment_cache,
+                                           options.incremental_declarations)
+            listeners.append(self.lexer)
+        elif options.parser_jobs > 1:
+            # Imported here as it builds on IncrementalCLexer
+            import parallel
+            if parallel.can_fork():
+                self.lexer = parallel.ParallelCLexer(self,
+                                                     options.parser_jobs)
+            else:
+                self.handle_status("Can't parse in parallel without " \
+                    "fork(); parsing in one process.")
+                self.lexer = CLexer(self)
+        else:
+            self.lexer = CLexer(self)
+        self.lexer.skip_bodies = options.skip_function_bodies
         if not options.no_stddef_types:
             self.lexer.type_names.add('wchar_t')
             self.lexer.type_names.add('ptrdiff_t')
@@ -103,17 +666,170 @@ class CParser(object):
         if sys.platform == 'win32' and not options.no_python_types:
             self.lexer.type_names.add('__int64')
 
-    def parse(self, filename, debug=False):
+        self.snapshot_path = options.token_snapshot
+        self.save_snapshot_path = options.save_token_snapshot
+
+        self.prelude = None
+        if options.system_header_prelude_dir:
+            if options.preprocessor_engine == 'python' or \
+               options.stream_preprocessor_output:
+                self.handle_status("Can't use a system header prelude " \
+                    "with streamed or in-process preprocessing.")
+            else:
+                # The calls depend on the type names known at the start,
+                # and on whether function bodies are skipped
+                salt = ' '.join(sorted(self.lexer.type_names))
+                if self.lexer.skip_bodies:
+                    salt += ' skip_bodies'
+                self.prelude = prelude.Prelude(
+                    options.system_header_prelude_dir, salt)
+                listeners.append(self.prelude)
+
+        if listeners:
+            # The grammar makes its handler calls through this, so that they
+            # can be saved
+            recorder = incremental.EventRecorder(self, listeners)
+            self.parser.cparser = self.lexer.cparser = recorder
+
+    def parse(self, filename, debug=False, text=None):
         '''Parse a file.
 
-        If `debug` is True, parsing state is dumped to stdout.
+        If `debug` is True, parsing state is dumped to stdout.  If `text` is
+        given, it is parsed as the content of `filename`.
         '''
 
-        self.handle_status('Preprocessing %s' % filename)
-        self.preprocessor_parser.parse(filename)
-        self.lexer.input(self.preprocessor_parser.output)
+        snapshot = None
+        if self.snapshot_path:
+            snapshot = self.load_token_snapshot(filename)
+
+        if self.manifest_path:
+            self.load_manifest()
+        if snapshot is not None:
+            tokens = snapshot
+        else:
+            self.handle_status('Preprocessing %s' % filename)
+            self.preprocessor_parser.prelude = self.prelude
+            self.preprocessor_parser.parse(filename, text)
+            if self.prelude is not None:
+                self.start_prelude()
+            tokens = self.preprocessor_parser.output
+            self.lexer.line_map = self.preprocessor_parser.line_map
+            if self.save_snapshot_path:
+                tokens = self.save_token_snapshot(tokens)
+
+        self.lexer.input(tokens)
         self.handle_status('Parsing %s' % filename)
-        self.parser.parse(lexer=self.lexer, debug=debug)
+        if self.optimized_parser and not debug:
+            self.parser.parseopt(lexer=self.lexer)
+        else:
+            self.parser.parse(lexer=self.lexer, debug=debug)
+        self.lexer.finish()
+        # The tokens aren't needed any more, and would otherwise stay around
+        # for as long as the parser, as the ones of parse_many do
+        tokens = None
+        self.lexer.close()
+        self.preprocessor_parser.release_output()
+        if snapshot is not None:
+            snapshot.close()
+        if isinstance(self.lexer, IncrementalCLexer):
+            self.handle_status('Reused the declarations of %d of %d ' \
+                'segments.' % (self.lexer.skipped,
+                               self.lexer.skipped + self.lexer.parsed))
+        if self.manifest_path:
+            self.save_manifest(filename)
+        if self.prelude is not None:
+            self.save_prelude()
+
+    def load_manifest(self):
+        '''Read the manifest of the last run, and start recording the include
+        graph for the next one.'''
+        manifest = incremental.Manifest.load(self.manifest_path)
+        changed = manifest.changed_headers()
+        if not manifest.headers:
+            self.handle_status('No usable manifest at %s; parsing all ' \
+                'headers.' % self.manifest_path)
+        elif changed:
+            self.handle_status('%d of %d headers changed since the last ' \
+                'run: %s' % (len(changed), len(manifest.headers),
+                             ', '.join(sorted(changed))))
+        else:
+            self.handle_status('No headers changed since the last run.')
+        self.lexer.manifest = manifest
+        self.lexer.changed = changed
+
+        self.include_graph = incremental.IncludeGraph()
+        self.preprocessor_parser.lexer.include_graph = self.include_graph
+
+    def save_manifest(self, filename):
+        manifest = incremental.Manifest()
+        manifest.set_include_graph(self.include_graph, filename)
+        manifest.segments = self.lexer.segments
+        manifest.lines = self.lexer.lines
+        try:
+            manifest.save(self.manifest_path)
+        except (IOError, OSError):
+            self.handle_status("Couldn't save manifest to %s." % \
+                self.manifest_path)
+        self.preprocessor_parser.lexer.include_graph = None
+
+    def load_token_snapshot(self, filename):
+        '''Open the token snapshot to parse instead of preprocessing
+        `filename`.  Return None if it can't be read.'''
+        self.handle_status('Reading the tokens of %s from %s.' % \
+            (filename, self.snapshot_path))
+        try:
+            return tokensnapshot.TokenSnapshot(self.snapshot_path)
+        except (IOError, OSError, ValueError, EOFError), e:
+            self.handle_status("Couldn't read token snapshot: %s" % e)
+            return None
+
+    def save_token_snapshot(self, tokens):
+        '''Save the preprocessor tokens, and return them as a list.'''
+        tokens = list(tokens)
+        if self.prelude is not None and self.prelude.usable:
+            self.handle_status("Can't save a token snapshot of output " \
+                "that uses a system header prelude.")
+            return tokens
+        self.handle_status('Saving tokens to %s.' % self.save_snapshot_path)
+        try:
+            tokensnapshot.save(self.save_snapshot_path, tokens)
+        except (IOError, OSError, ValueError), e:
+            self.handle_status("Couldn't save token snapshot: %s" % e)
+        return tokens
+
+    def start_prelude(self):
+        '''Let the lexer make the calls of the system headers if there is a
+        prelude for them, or get ready to record them.'''
+        if not self.prelude.matched:
+            return
+        if self.prelude.usable:
+            self.handle_status('Using the prelude of %d system headers.' % \
+                len(self.prelude.files))
+            self.lexer.prelude = self.prelude
+            return
+
+        self.handle_status('No prelude for these %d system headers; ' \
+            'parsing them.' % len(self.prelude.files))
+        # They have to be parsed for their calls to be recorded
+        if isinstance(self.lexer, IncrementalCLexer):
+            self.lexer.changed.update([incremental.header_name(name)
+                                       for name in self.prelude.files])
+
+    def save_prelude(self):
+        self.preprocessor_parser.prelude = None
+        self.lexer.prelude = None
+        matched, self.prelude.matched = self.prelude.matched, False
+        if not matched or self.prelude.usable:
+            return
+        if self.prelude.failed:
+            self.handle_status("Couldn't tell which system header lines " \
+                "some calls belong to; not saving the prelude.")
+            return
+        try:
+            self.prelude.save()
+        except (IOError, OSError):
+            self.handle_status("Couldn't save system header prelude to " \
+                "%s." % self.prelude.directory)
 
     # ----------------------------------------------------------------------
     # Parser interface.  Override these methods in your subclass.
@@ -167,6 +883,16 @@ class CParser(object):
         value is an ExpressionNode or None
         '''
 
+    def handle_define_unparseable(self, name, params, value, filename,
+                                  lineno):
+        '''#define `name` `value` or #define `name`(`params`) `value`, where
+        `value` couldn't be parsed
+
+        name is a string
+        params is None or a list of strings
+        value is a list of the strings of the tokens
+        '''
+
     def impl_handle_declaration(self, declaration, filename, lineno):
         '''Internal method that calls `handle_declaration`.  This method
         also adds any new type definitions to the lexer's list of valid type
@@ -177,9 +903,7 @@ class CParser(object):
             if not declarator:
                 # XXX TEMPORARY while struct etc not filled
                 return
-            while declarator.pointer:
-                declarator = declarator.pointer
-            self.lexer.type_names.add(declarator.identifier)
+            self.lexer.type_names.add(cdeclarations.declarator_name(declarator))
         self.handle_declaration(declaration, filename, lineno)
 
     def handle_declaration(self, declaration, filename, lineno):
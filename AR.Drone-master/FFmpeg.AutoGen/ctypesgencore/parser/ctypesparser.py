@@ -12,6 +12,7 @@ __docformat__ = 'restructuredtext'
 
 __all__ = ["CtypesParser"]
 
+import operator
 from cparser import *
 from ctypesgencore.ctypedescs import *
 from cdeclarations import *
@@ -27,7 +28,7 @@ def make_enum_from_specifier(specifier):
             value = e.expression
         else:
             if last_name:
-                value = BinaryExpressionNode("addition", (lambda x,y:x+y),
+                value = BinaryExpressionNode("addition", operator.add,
                     "(%s + %s)", (False,False),
                     IdentifierExpressionNode(last_name),
                     ConstantExpressionNode(1))
@@ -55,8 +56,8 @@ class CtypesParser(CParser):
     Subclass and override the handle_ctypes_* methods.
     '''
 
-    def __init__ (self, options):
-        super(CtypesParser, self).__init__(options)
+    def __init__ (self, options, segment_cache=None):
+        super(CtypesParser, self).__init__(options, segment_cache)
         self.type_map = ctypes_type_map
         if not options.no_python_types:
             self.type_map.update(ctypes_type_map_python_builtin)
@@ -213,7 +214,8 @@ class CtypesParser(CParser):
     def handle_ctypes_typedef(self, name, ctype, filename, lineno):
         pass
 
-    def handle_ctypes_function(self, name, restype, argtypes, filename, lineno):
+    def handle_ctypes_function(self, name, restype, argtypes, variadic,
+                               filename, lineno):
         pass
 
     def handle_ctypes_variable(self, name, ctype, filename, lineno):
@@ -8,11 +8,12 @@ calling DataCollectingParser.data().
 """
 
 import ctypesparser
+import pathfilter
+from ctypesgencore import ctypedescs
 from ctypesgencore.descriptions import *
 from ctypesgencore.ctypedescs import *
 from ctypesgencore.expressions import *
 from ctypesgencore.messages import *
-from tempfile import mkstemp
 import os
 
 class DataCollectingParser(ctypesparser.CtypesParser,
@@ -22,8 +23,8 @@ class DataCollectingParser(ctypesparser.CtypesParser,
     p.parse()
     data=p.data() #A dictionary of constants, enums, structs, functions, etc.
     """
-    def __init__(self,headers,options):
-        ctypesparser.CtypesParser.__init__(self,options)
+    def __init__(self,headers,options,segment_cache=None):
+        ctypesparser.CtypesParser.__init__(self,options,segment_cache)
         self.headers=headers
         self.options=options
 
@@ -57,28 +58,112 @@ class DataCollectingParser(ctypesparser.CtypesParser,
         # A dict of enums that have only been seen in opaque form
         self.already_seen_opaque_enums={}
 
-    def parse(self):
-        fd, fname = mkstemp(suffix=".h")
-        f = os.fdopen(fd, 'w')
+        # With early_path_filter, the Stubs of declarations and macros of
+        # files outside output_only_from_paths, by the names they declare,
+        # and the names descriptions have referred to; see pathfilter
+        self.path_filter = None
+        if options.early_path_filter:
+            self.path_filter = pathfilter.PathFilter(
+                options.output_only_from_paths)
+        self.stubs = {}
+        self.wanted = set()
+
+    def wrapper(self):
+        """Return the text of a header that includes all the headers to
+        parse. It is piped into the preprocessor, which calls it <stdin>."""
+        lines = []
         for header in self.options.other_headers:
-            print >>f, '#include <%s>' % header
+            lines.append('#include <%s>\n' % header)
         for header in self.headers:
-            print >>f, '#include "%s"' % os.path.abspath(header)
-        f.flush()
-        f.close()
-        ctypesparser.CtypesParser.parse(self, fname, None)
-        os.unlink(fname)
+            lines.append('#include "%s"\n' % os.path.abspath(header))
+        return "".join(lines)
+
+    def start(self, pool=None):
+        """Start preprocessing in the background. Processes of parsers
+        given the same PreprocessorPool `pool` run in parallel."""
+        if pool is not None:
+            self.preprocessor_parser.pool = pool
+        self.preprocessor_parser.start("<stdin>", self.wrapper())
+
+    def parse(self):
+        ctypesparser.CtypesParser.parse(self, "<stdin>", text=self.wrapper())
 
         for name, params, expr, (filename,lineno) in self.saved_macros:
             self.handle_macro(name, params, expr, filename, lineno)
 
+    def excluded(self, filename):
+        return self.path_filter is not None and \
+            self.path_filter.excluded(filename)
+
+    def add_stub(self, names, call, args, anonymous=0):
+        """Put off `call` with `args` until a description refers to one of
+        `names`. `anonymous` is how many anonymous structs and enums it
+        makes."""
+        stub = pathfilter.Stub(call, args, ctypedescs.last_tagnum)
+        ctypedescs.last_tagnum += anonymous
+        for name in names:
+            if name in self.wanted:
+                self.make_stub(stub)
+                return
+        for name in names:
+            self.stubs.setdefault(name, []).append(stub)
+
+    def make_stub(self, stub):
+        if stub.made:
+            return
+        stub.made = True
+        tagnum = ctypedescs.last_tagnum
+        ctypedescs.last_tagnum = stub.tagnum
+        try:
+            stub.call(*stub.args)
+        finally:
+            ctypedescs.last_tagnum = tagnum
+
+    def want(self, name):
+        """Make the stubs that declare `name`, and those declared later."""
+        if self.path_filter is None:
+            return
+        self.wanted.add(name)
+        for stub in self.stubs.pop(name, ()):
+            self.make_stub(stub)
+
+    def handle_declaration(self, declaration, filename, lineno):
+        # Called by CParser
+        if self.excluded(filename):
+            self.add_stub(pathfilter.declared_names(declaration),
+                          ctypesparser.CtypesParser.handle_declaration,
+                          (self, declaration, filename, lineno),
+                          pathfilter.anonymous_types(declaration.type,
+                                                     declaration.declarator))
+        else:
+            ctypesparser.CtypesParser.handle_declaration(self, declaration,
+                                                         filename, lineno)
+
+    def save_macro(self, name, params, expr, filename, lineno):
+        macro = (name, params, expr, (filename, lineno))
+        if self.excluded(filename):
+            # Made while the saved macros are handled, it is handled with
+            # them
+            self.add_stub(pathfilter.macro_names(name),
+                          self.saved_macros.append, (macro,))
+        else:
+            self.saved_macros.append(macro)
+
     def handle_define_constant(self, name, expr, filename, lineno):
         # Called by CParser
         # Save to handle later
-        self.saved_macros.append((name, None, expr, (filename, lineno)))
+        self.save_macro(name, None, expr, filename, lineno)
 
     def handle_define_unparseable(self, name, params, value, filename, lineno):
         # Called by CParser
+        if self.excluded(filename):
+            self.add_stub(pathfilter.macro_names(name),
+                          self.add_unparseable_macro,
+                          (name, params, value, filename, lineno))
+        else:
+            self.add_unparseable_macro(name, params, value, filename, lineno)
+
+    def add_unparseable_macro(self, name, params, value, filename, lineno):
         if params:
             original_string = "#define %s(%s) %s" % \
                 (name, ",".join(params), " ".join(value))
@@ -97,7 +182,7 @@ class DataCollectingParser(ctypesparser.CtypesParser,
     def handle_define_macro(self, name, params, expr, filename, lineno):
         # Called by CParser
         # Save to handle later
-        self.saved_macros.append((name, params, expr, (filename,lineno)))
+        self.save_macro(name, params, expr, filename, lineno)
 
     def handle_ctypes_typedef(self, name, ctype, filename, lineno):
         # Called by CtypesParser
@@ -157,6 +242,7 @@ class DataCollectingParser(ctypesparser.CtypesParser,
         # move the opaque struct to the end of the struct list.
 
         name = "%s %s"%(ctypestruct.variety,ctypestruct.tag)
+        self.want((ctypestruct.variety, ctypestruct.tag))
 
         if name in self.already_seen_structs:
             return
@@ -212,6 +298,7 @@ class DataCollectingParser(ctypesparser.CtypesParser,
         # structs. See handle_struct() for more details.
 
         tag = ctypeenum.tag
+        self.want(('enum', tag))
         if tag in self.already_seen_enums:
             return
 
@@ -253,6 +340,9 @@ class DataCollectingParser(ctypesparser.CtypesParser,
             self.already_seen_enums.add(tag)
 
             for (enumname,expr) in ctypeenum.enumerators:
+                if self.path_filter is not None:
+                    # For the identifiers of other headers in the values
+                    expr.visit(self)
                 constant=ConstantDescription(enumname, expr,
                                              src=(filename,lineno))
 
@@ -317,6 +407,12 @@ class DataCollectingParser(ctypesparser.CtypesParser,
     def visit_enum(self,enum):
         self.handle_enum(enum, enum.src[0], enum.src[1])
 
+    def visit_typedef(self, name):
+        self.want(('typedef', name))
+
+    def visit_identifier(self, name):
+        self.want(('identifier', name))
+
     def data(self):
         return DescriptionCollection(self.constants,
                                      self.typedefs,
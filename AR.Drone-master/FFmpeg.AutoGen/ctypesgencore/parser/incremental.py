@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+'''
+Support for regenerating bindings incrementally.
+
+While the preprocessor output is lexed, IncludeGraph records which header
+included which, from the flags of the line number directives.  After a parse
+the graph is written to a Manifest, together with a content hash of every
+header in it and the handler calls (declarations, #defines) that the parser
+made for each segment of the token stream.  A segment is a run of tokens
+from one file, or with the incremental_declarations option, a single
+top-level declaration or #define.
+
+The next run loads the manifest, compares the hashes to find the headers that
+changed, and only feeds the parser the segments that are new or come from a
+changed header.  For every other segment the saved handler calls are made
+again instead.  See cparser.IncrementalCLexer for how segments are skipped.
+
+Parsers of several sets of headers in one run can also share a SegmentCache.
+The headers they have in common are then lexed and parsed only once.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os, marshal, tempfile, cPickle
+
+try:
+    import hashlib
+    _digest = hashlib.sha1
+except ImportError:
+    import sha
+    _digest = sha.new
+
+import ppcache
+import pplexer
+
+# Bump this if the layout of a manifest or of the saved calls changes
+MANIFEST_FORMAT = 6
+
+# Handler methods of CParser whose calls are saved with the segments.  These
+# are all the methods cgrammar calls on the parser as it reads declarations.
+RECORDED_METHODS = ('impl_handle_declaration',
+                    'handle_define_constant',
+                    'handle_define_macro',
+                    'handle_define_unparseable',
+                    'handle_error')
+
+def is_pseudo_file(name):
+    '''Return True for names like <built-in> that aren't real files.'''
+    return name.startswith('<') and name.endswith('>')
+
+def header_name(name):
+    '''Return the name a header is kept under in a manifest.  cpp spells
+    the same header differently depending on how it was found, say
+    ./FFmpeg/include/libavutil/rational.h or the absolute path, so real
+    files go by their normalised absolute path.'''
+    if is_pseudo_file(name):
+        return name
+    return os.path.normpath(os.path.abspath(name))
+
+class IncludeGraph(object):
+    '''Which file included which, in order of first inclusion.'''
+
+    def __init__(self):
+        self.includes = {}
+
+    def add(self, parent, child):
+        children = self.includes.setdefault(parent, [])
+        if child not in children:
+            children.append(child)
+
+    def files(self):
+        '''Return all files in the graph, in no particular order.'''
+        result = set(self.includes)
+        for children in self.includes.values():
+            result.update(children)
+        return result
+
+class Manifest(object):
+    '''The include graph, header hashes and saved handler calls of a run.
+
+    `segments` maps the key of a segment (see segment_key) to the list of
+    handler calls made for it, each pickled on its own.  `lines` maps the
+    key of a declaration segment to the line it started at.'''
+
+    def __init__(self):
+        self.headers = {}
+        self.includes = {}
+        self.segments = {}
+        self.lines = {}
+
+    def load(cls, path):
+        '''Read the manifest at `path`.  Return an empty manifest if there is
+        none or it can't be used.'''
+        manifest = cls()
+        try:
+            f = open(path, 'rb')
+            try:
+                entry = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return manifest
+
+        if entry.get('format') != MANIFEST_FORMAT:
+            return manifest
+        manifest.headers = dict(entry['headers'])
+        manifest.includes = dict(entry['includes'])
+        manifest.segments = entry['segments']
+        manifest.lines = entry['lines']
+        return manifest
+    load = classmethod(load)
+
+    def changed_headers(self):
+        '''Return the set of headers whose content is no longer what it was
+        when the manifest was saved, by header_name.'''
+        changed = set()
+        for name, digest in self.headers.items():
+            if ppcache.file_digest(name) != digest:
+                changed.add(name)
+        return changed
+
+    def set_include_graph(self, graph, root):
+        '''Take the includes and header hashes from `graph`.  `root` is the
+        file that was preprocessed; it is left out of the hashes and shows up
+        as <input> in the graph, as its name changes from run to run.  All
+        other names are made header_names.'''
+        self.headers = {}
+        for name in graph.files():
+            if name == root or is_pseudo_file(name):
+                continue
+            name = header_name(name)
+            if name not in self.headers:
+                digest = ppcache.file_digest(name)
+                if digest is not None:
+                    self.headers[name] = digest
+
+        self.includes = {}
+        for parent, children in graph.includes.items():
+            if parent == root:
+                parent = '<input>'
+            else:
+                parent = header_name(parent)
+            names = self.includes.setdefault(parent, [])
+            for child in children:
+                child = header_name(child)
+                if child not in names:
+                    names.append(child)
+
+    def save(self, path):
+        save_entry(path, {'format': MANIFEST_FORMAT,
+                          'headers': self.headers.items(),
+                          'includes': self.includes.items(),
+                          'segments': self.segments,
+                          'lines': self.lines})
+
+def save_entry(path, entry):
+    '''Marshal `entry` to the file at `path`.'''
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Write to a temporary file first so that an interrupted run never
+    # leaves a partially written file behind.
+    fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    f = os.fdopen(fd, 'wb')
+    try:
+        marshal.dump(entry, f)
+    finally:
+        f.close()
+    os.chmod(tmpname, 0644)
+    try:
+        os.rename(tmpname, path)
+    except OSError:
+        # Windows refuses to rename over an existing file
+        try:
+            os.remove(path)
+            os.rename(tmpname, path)
+        except OSError:
+            os.remove(tmpname)
+
+class SegmentCache(object):
+    '''Segments shared by the parsers of several sets of headers in one run.
+
+    `tokens` maps the body_key of the text between two line number
+    directives to the tokens lexed from it (see
+    PreprocessorParser.lex_shared), and `segments` and `lines` are like those
+    of a Manifest.'''
+
+    def __init__(self):
+        self.tokens = {}
+        self.segments = {}
+        self.lines = {}
+
+def body_key(body, skips):
+    '''Return the key of SegmentCache.tokens for the text `body` with the
+    (offset, lines) pairs `skips`.  It is a digest so that the text itself
+    isn't kept for the rest of the run.'''
+    h = _digest(body)
+    for offset, lines in skips:
+        h.update('\0%d\0%d' % (offset, lines))
+    return h.digest()
+
+def save_call(name, args):
+    return cPickle.dumps((name, args), cPickle.HIGHEST_PROTOCOL)
+
+def load_call(data):
+    return cPickle.loads(data)
+
+class EventRecorder(object):
+    '''Stands in for a CParser in the grammar, and tells each of
+    `listeners` about every call of one of the RECORDED_METHODS before making
+    it.  A listener has a method record(name, args).'''
+
+    def __init__(self, cparser, listeners):
+        self.cparser = cparser
+        self.listeners = listeners
+
+    def __getattr__(self, name):
+        method = getattr(self.cparser, name)
+        if name not in RECORDED_METHODS:
+            return method
+        listeners = self.listeners
+        def record(*args):
+            for listener in listeners:
+                listener.record(name, args)
+            return method(*args)
+        return record
+
+def segment_key(filename, tokens, type_names, base=None, skip_bodies=False):
+    '''Return the key a segment of `tokens` from `filename` is saved under.
+
+    The parser only does the same with the same tokens if the same ones of
+    them are type names, so `type_names` goes into the key as well.  If
+    `base` is given, the lines of the tokens go into the key relative to
+    it, so that the key stays the same if the tokens are moved.  A CLexer
+    that skips function bodies gives the parser other tokens, so whether it
+    does is part of the key too.
+
+    Values go into the key in an exact form: str() of a float keeps only 12
+    digits, and would unescape a RawStringLiteral.'''
+    h = _digest()
+    h.update(filename)
+    if skip_bodies:
+        h.update('\3')
+    if base is None:
+        base = 0
+    else:
+        h.update('\2')
+    identifiers = set()
+    for t in tokens:
+        value = t.value
+        kind = type(value)
+        if kind is pplexer.RawStringLiteral:
+            value = value.text
+        elif kind is float:
+            value = repr(value)
+        h.update('\0%s\0%s\0%d' % (t.type, value, t.lineno - base))
+        if t.type == 'IDENTIFIER':
+            identifiers.add(t.value)
+    for name in sorted(identifiers & type_names):
+        h.update('\1' + name)
+    return h.hexdigest()
+
+def move_lines(calls, delta):
+    '''Return the (name, args) calls `calls` with the line numbers in them
+    moved by `delta` lines.  The last argument of every recorded call is a
+    line number; struct and enum specifiers, and the ctypes types made from
+    them in casts and sizeof expressions, have lines of their own.  The
+    objects in `calls` are changed, so they mustn't be shared.'''
+    seen = set()
+    moved = []
+    for name, args in calls:
+        for arg in args[:-1]:
+            _move_object_lines(arg, delta, seen)
+        moved.append((name, args[:-1] + (args[-1] + delta,)))
+    return moved
+
+def _move_object_lines(obj, delta, seen):
+    if isinstance(obj, (list, tuple)):
+        for item in obj:
+            _move_object_lines(item, delta, seen)
+        return
+    attributes = getattr(obj, '__dict__', None)
+    if not attributes or id(obj) in seen:
+        return
+    seen.add(id(obj))
+    for name, value in attributes.items():
+        if name == 'lineno' and isinstance(value, (int, long)):
+            attributes[name] = value + delta
+        elif name == 'src' and isinstance(value, tuple) and \
+             len(value) == 2 and isinstance(value[1], (int, long)):
+            attributes[name] = (value[0], value[1] + delta)
+        else:
+            _move_object_lines(value, delta, seen)
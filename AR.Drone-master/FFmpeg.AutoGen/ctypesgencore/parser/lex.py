@@ -141,17 +141,11 @@ class Lexer:
         return c
 
     # ------------------------------------------------------------
-    # writetab() - Write lexer information to a table file
+    # tables() - Return the lexer information as a dictionary of
+    # strings, numbers, lists and dictionaries, with the names of
+    # the rule functions in place of the functions
     # ------------------------------------------------------------
-    # <tm> 25 June 2008 added 'outputdir'
-    def writetab(self,tabfile,outputdir=''):
-        tf = open(os.path.join(outputdir,tabfile)+".py","w")
-        tf.write("# %s.py. This file automatically created by PLY (version %s). Don't edit!\n" % (tabfile,__version__))
-        tf.write("_lextokens    = %s\n" % repr(self.lextokens))
-        tf.write("_lexreflags   = %s\n" % repr(self.lexreflags))
-        tf.write("_lexliterals  = %s\n" % repr(self.lexliterals))
-        tf.write("_lexstateinfo = %s\n" % repr(self.lexstateinfo))
-
+    def tables(self):
         tabre = { }
         for key, lre in self.lexstatere.items():
             titem = []
@@ -159,43 +153,66 @@ class Lexer:
                 titem.append((self.lexstateretext[key][i],_funcs_to_names(lre[i][1])))
             tabre[key] = titem
 
-        tf.write("_lexstatere   = %s\n" % repr(tabre))
-        tf.write("_lexstateignore = %s\n" % repr(self.lexstateignore))
-
         taberr = { }
         for key, ef in self.lexstateerrorf.items():
             if ef:
                 taberr[key] = ef.__name__
             else:
                 taberr[key] = None
-        tf.write("_lexstateerrorf = %s\n" % repr(taberr))
-        tf.close()
+
+        return { '_lextokens'      : self.lextokens,
+                 '_lexreflags'     : self.lexreflags,
+                 '_lexliterals'    : self.lexliterals,
+                 '_lexstateinfo'   : self.lexstateinfo,
+                 '_lexstatere'     : tabre,
+                 '_lexstateignore' : self.lexstateignore,
+                 '_lexstateerrorf' : taberr }
 
     # ------------------------------------------------------------
-    # readtab() - Read lexer information from a tab file
+    # settables() - Set up the lexer from a dictionary returned by
+    # tables(), looking up the rule functions in fdict
     # ------------------------------------------------------------
-    def readtab(self,tabfile,fdict):
-        exec "import %s as lextab" % tabfile
-        self.lextokens      = lextab._lextokens
-        self.lexreflags     = lextab._lexreflags
-        self.lexliterals    = lextab._lexliterals
-        self.lexstateinfo   = lextab._lexstateinfo
-        self.lexstateignore = lextab._lexstateignore
+    def settables(self,tables,fdict):
+        self.lextokens      = tables['_lextokens']
+        self.lexreflags     = tables['_lexreflags']
+        self.lexliterals    = tables['_lexliterals']
+        self.lexstateinfo   = tables['_lexstateinfo']
+        self.lexstateignore = tables['_lexstateignore']
         self.lexstatere     = { }
         self.lexstateretext = { }
-        for key,lre in lextab._lexstatere.items():
+        for key,lre in tables['_lexstatere'].items():
             titem = []
             txtitem = []
             for i in range(len(lre)):
-                titem.append((re.compile(lre[i][0],lextab._lexreflags),_names_to_funcs(lre[i][1],fdict)))
+                titem.append((re.compile(lre[i][0],self.lexreflags),_names_to_funcs(lre[i][1],fdict)))
                 txtitem.append(lre[i][0])
             self.lexstatere[key] = titem
             self.lexstateretext[key] = txtitem
         self.lexstateerrorf = { }
-        for key,ef in lextab._lexstateerrorf.items():
+        for key,ef in tables['_lexstateerrorf'].items():
             self.lexstateerrorf[key] = fdict[ef]
         self.begin('INITIAL')
 
+    # ------------------------------------------------------------
+    # writetab() - Write lexer information to a table file
+    # ------------------------------------------------------------
+    # <tm> 25 June 2008 added 'outputdir'
+    def writetab(self,tabfile,outputdir=''):
+        tables = self.tables()
+        tf = open(os.path.join(outputdir,tabfile)+".py","w")
+        tf.write("# %s.py. This file automatically created by PLY (version %s). Don't edit!\n" % (tabfile,__version__))
+        for name in ('_lextokens', '_lexreflags', '_lexliterals', '_lexstateinfo',
+                     '_lexstatere', '_lexstateignore', '_lexstateerrorf'):
+            tf.write("%s = %s\n" % (name, repr(tables[name])))
+        tf.close()
+
+    # ------------------------------------------------------------
+    # readtab() - Read lexer information from a tab file
+    # ------------------------------------------------------------
+    def readtab(self,tabfile,fdict):
+        exec "import %s as lextab" % tabfile
+        self.settables(lextab.__dict__,fdict)
+
     # ------------------------------------------------------------
     # input() - Push a new string into the lexer
     # ------------------------------------------------------------
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+'''
+Parse the token stream in several processes at once.
+
+The only state the parser carries from one top-level declaration to the next
+is the set of type names the lexer knows, which typedefs add to.  So before
+the parse, a quick pass over the preprocessor tokens splits them into chunks
+that end between two top-level declarations, and works out from the tokens
+alone which type names each typedef declares.  Worker processes then parse
+the chunks, each starting with the type names of the typedefs before it,
+and record the handler calls the grammar makes for it.
+
+The parser of the main process is given a ParallelCLexer, an
+IncrementalCLexer whose segments are the chunks.  Where the parser is
+between two declarations at the start of a chunk, and the chunk has the
+same type names in it as the worker assumed, the calls the worker recorded
+are made instead of parsing it; see chunk_key.  Every other chunk, say
+after a typedef the quick pass missed, or with a syntax error in it, is
+parsed there and then.  So the handler calls, and the descriptions made
+from them, are the same as those of a parse in one process.
+
+Worker processes are forked from the main process once the chunks are
+known, and read the tokens from its memory, so only the calls they record
+are passed back, pickled all at once.  Where there is no fork(), the parse
+is done in one process.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os
+
+import cparser
+import cgrammar
+import cdeclarations
+import incremental
+from ctypesgencore import ctypedescs
+
+# A chunk is ended at the first top-level declaration boundary after this
+# many tokens
+CHUNK_SIZE = 250
+
+# Tasks given to each worker process; more than one evens out the load
+TASKS_PER_JOB = 4
+
+def can_fork():
+    return hasattr(os, 'fork')
+
+class Chunk(object):
+    '''The tokens from `start` to `end`, which a worker parses knowing the
+    type names of all chunks before it.  `type_names` are the names the
+    typedefs in it declare, and `identifiers` the set of its identifiers.'''
+    __slots__ = ['start', 'end', 'type_names', 'identifiers']
+
+    def __init__(self, start, end, type_names, identifiers):
+        self.start = start
+        self.end = end
+        self.type_names = type_names
+        self.identifiers = identifiers
+
+def chunk_key(chunk, type_names):
+    '''Return the key the calls of `chunk` are kept under, if it is parsed
+    with the type names `type_names`.
+
+    As in incremental.segment_key, the parser only does the same with the
+    same tokens if the same ones of them are type names.  Here the tokens
+    are told by where the chunk starts, as the workers parse the tokens of
+    the same run.'''
+    return (chunk.start, frozenset(chunk.identifiers & type_names))
+
+def split_chunks(tokens, type_names, prelude=None, size=CHUNK_SIZE):
+    '''Return the Chunks of the preprocessor tokens `tokens`, given the
+    type names the lexer knows at the start.
+
+    A chunk ends at the end of a top-level declaration or #define once it
+    has `size` tokens, and always where the tokens go from one file to
+    another, as the segments of an IncrementalCLexer do.  PP_PRELUDE tokens
+    are left out of the chunks; `prelude` is the Prelude they stand for, if
+    any.'''
+    chunks = []
+    known = set(type_names)
+    names = []
+    identifiers = set()
+    start = 0
+    item = 0                # Start of the current declaration
+    typedef = False         # Whether it is a typedef
+    splitter = cparser.DeclarationSplitter()
+    filename = None
+
+    for i, t in enumerate(tokens):
+        type = t.type
+        if type == 'PP_PRELUDE':
+            if start < i:
+                chunks.append(Chunk(start, i, names, identifiers))
+                names = []
+                identifiers = set()
+            if prelude is not None:
+                names.extend(prelude.parts[t.value][0])
+                known.update(prelude.parts[t.value][0])
+            start = item = i + 1
+            splitter = cparser.DeclarationSplitter()
+            continue
+        if t.filename != filename:
+            if start < i:
+                chunks.append(Chunk(start, i, names, identifiers))
+                names = []
+                identifiers = set()
+                start = i
+            filename = t.filename
+
+        if type == 'IDENTIFIER':
+            identifiers.add(t.value)
+            if t.value == 'typedef' and not splitter.braces and \
+               not splitter.define:
+                typedef = True
+
+        if splitter.ends(t):
+            if typedef:
+                declared = typedef_names(tokens[item:i], known)
+                names.extend(declared)
+                known.update(declared)
+            item = i + 1
+            typedef = False
+            if item - start >= size:
+                chunks.append(Chunk(start, item, names, identifiers))
+                names = []
+                identifiers = set()
+                start = item
+
+    if start < len(tokens):
+        chunks.append(Chunk(start, len(tokens), names, identifiers))
+    return chunks
+
+def typedef_names(tokens, known):
+    '''Return the names the typedef declaration `tokens` declares, going by
+    the tokens alone: in each declarator, the first identifier that isn't a
+    keyword, a tag or a type name in the set `known`.'''
+    names = []
+    keyword_types = cgrammar.keyword_types
+    braces = 0
+    parens = 0
+    tag = False
+    found = False
+    for t in tokens:
+        type = t.type
+        if type == '{':
+            braces += 1
+        elif type == '}':
+            braces -= 1
+        elif braces:
+            continue
+        elif type in ('(', 'LPAREN'):
+            parens += 1
+        elif type == ')':
+            parens -= 1
+        elif type == ',' and not parens:
+            found = False
+        elif type == 'IDENTIFIER' and not found:
+            value = t.value
+            if value in keyword_types:
+                tag = value in cparser.tag_keywords
+                continue
+            if not tag and value not in known and value not in names:
+                names.append(value)
+                found = True
+        tag = False
+    return names
+
+class ChunkRecorder(object):
+    '''Stands in for the CParser in the grammar while a worker parses a
+    chunk.  It saves the handler calls the grammar makes, and adds the
+    names typedefs declare to the lexer, as CParser.impl_handle_declaration
+    does.  Other methods are those of `cparser`.'''
+
+    def __init__(self, cparser, lexer):
+        self.cparser = cparser
+        self.lexer = lexer
+        self.calls = []
+        self.errors = False
+
+    def __getattr__(self, name):
+        return getattr(self.cparser, name)
+
+    def record(self, name, args):
+        self.calls.append((name, args))
+
+    def impl_handle_declaration(self, declaration, filename, lineno):
+        if declaration.storage == 'typedef' and declaration.declarator:
+            self.lexer.type_names.add(
+                cdeclarations.declarator_name(declaration.declarator))
+        self.record('impl_handle_declaration',
+                    (declaration, filename, lineno))
+
+    def handle_define_constant(self, *args):
+        self.record('handle_define_constant', args)
+
+    def handle_define_macro(self, *args):
+        self.record('handle_define_macro', args)
+
+    def handle_define_unparseable(self, *args):
+        self.record('handle_define_unparseable', args)
+
+    def handle_error(self, message, filename, lineno):
+        self.errors = True
+
+# What worker processes are forked with: the ParallelCLexer, its tokens and
+# its chunks.  Only set while they run.
+_job = None
+
+def _parse_task(task):
+    '''Parse the chunks from index `first` to `last` of the job, and return
+    a list of the key and the (name, args) calls of each that was parsed without
+    errors.'''
+    first, last = task
+    lexer, tokens, chunks, initial = _job
+    # The CParser itself, not the EventRecorder the grammar may be given
+    cp = lexer.handlers
+    chunk_lexer = cparser.CLexer(cp)
+    chunk_lexer.line_map = lexer.line_map
+    chunk_lexer.skip_bodies = lexer.skip_bodies
+    parser = lexer.parser
+    if cp.optimized_parser:
+        parse = parser.parseopt
+    else:
+        parse = parser.parse
+
+    names = set(initial)
+    for chunk in chunks[:first]:
+        names.update(chunk.type_names)
+
+    result = []
+    for chunk in chunks[first:last]:
+        recorder = ChunkRecorder(cp, chunk_lexer)
+        parser.cparser = chunk_lexer.cparser = recorder
+        chunk_lexer.type_names = set(names)
+        chunk_tokens = tokens[chunk.start:chunk.end]
+        key = chunk_key(chunk, names)
+        tagnum = ctypedescs.last_tagnum
+        chunk_lexer.input(chunk_tokens)
+        parse(lexer=chunk_lexer)
+        chunk_lexer.finish()
+        # A #define cut short isn't reported as an error.  Anonymous
+        # structs are numbered in the order they are made, so only the main
+        # process may make them.
+        if not recorder.errors and not chunk_lexer.in_define and \
+           ctypedescs.last_tagnum == tagnum:
+            result.append((key, recorder.calls))
+        names.update(chunk.type_names)
+    return result
+
+def parse_chunks(lexer, tokens, chunks, jobs):
+    '''Parse `chunks` of `tokens` in `jobs` worker processes, and return a
+    dict of the calls of those that had no errors, by chunk_key.
+    `lexer` is the ParallelCLexer the chunks are for.'''
+    import multiprocessing
+
+    # Tasks of about the same number of tokens
+    count = max(jobs * TASKS_PER_JOB, 1)
+    per_task = len(tokens) // count + 1
+    tasks = []
+    first = 0
+    for i, chunk in enumerate(chunks):
+        if chunk.end >= per_task * (len(tasks) + 1) or i == len(chunks) - 1:
+            tasks.append((first, i + 1))
+            first = i + 1
+
+    global _job
+    _job = (lexer, tokens, chunks, frozenset(lexer.type_names))
+    try:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(_parse_task, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _job = None
+
+    segments = {}
+    for result in results:
+        for key, calls in result:
+            segments[key] = calls
+    return segments
+
+class ParallelCLexer(cparser.IncrementalCLexer):
+    '''An IncrementalCLexer whose segments are the chunks of a parallel
+    parse, and which makes the calls the worker processes saved for them.
+    Nothing is saved for a later run.'''
+
+    def __init__(self, cparser, jobs):
+        super(ParallelCLexer, self).__init__(cparser,
+                                             incremental.SegmentCache())
+        self.jobs = jobs
+        self.chunks = {}
+
+    def input(self, tokens):
+        # The workers need all tokens at once
+        if not isinstance(tokens, list):
+            tokens = list(tokens)
+        super(ParallelCLexer, self).input(tokens)
+
+        chunks = split_chunks(tokens, self.type_names, self.prelude)
+        self.chunks = dict([(chunk.start, chunk) for chunk in chunks])
+        if chunks:
+            self.shared.segments = parse_chunks(self, tokens, chunks,
+                                                self.jobs)
+        else:
+            self.shared.segments = {}
+
+    def find_segment_end(self, start):
+        chunk = self.chunks.get(start)
+        if chunk is None:
+            return super(ParallelCLexer, self).find_segment_end(start)
+        return chunk.end
+
+    def segment_key(self, start, end):
+        chunk = self.chunks.get(start)
+        if chunk is None or chunk.end != end:
+            return super(ParallelCLexer, self).segment_key(start, end)
+        return chunk_key(chunk, self.type_names)
+
+    def load_calls(self, calls):
+        # Never pickled on their own
+        return calls
+
+    def close_segment(self, segment):
+        pass
+
+    def close(self):
+        super(ParallelCLexer, self).close()
+        self.shared.segments = {}
+        self.chunks = {}
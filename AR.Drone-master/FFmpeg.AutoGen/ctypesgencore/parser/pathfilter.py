@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+'''
+Only build the types of declarations from other headers where needed.
+
+The output of generate.py only has the descriptions whose source is under
+one of output_only_from_paths, but most of the declarations the parser sees
+come from the C library, and CtypesParser builds a CtypesType tree and a
+description for every one of them.
+
+With the early_path_filter option, DataCollectingParser keeps a Stub for
+each declaration and #define of a file outside those paths instead: the
+handler call to make for it, under the names it declares.  CParser still
+adds the names typedefs declare to the lexer, as they change how the rest
+is parsed.  Where a description refers to a name, that is where a visit of
+its CtypesType or expression comes to it, the stubs for the name are made
+there and then, along with the ones they refer to in turn.  Stubs of names
+referred to before they were declared, such as structs only seen in opaque
+form so far, are made as soon as they are declared.  Descriptions of other
+headers that nothing refers to are never made.
+
+Anonymous structs and enums are numbered in the order their CtypesType is
+made, and their tags end up in the output, so a Stub keeps the numbers its
+declaration would have taken and is made with those.  Only the order of the
+descriptions from other headers in the DescriptionCollection changes.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os
+
+import cdeclarations
+
+class PathFilter(object):
+    '''Tells whether a file is outside `paths`, the way
+    WrapperGenerator.type_was_included does.'''
+
+    def __init__(self, paths):
+        self.paths = [os.path.abspath(path).lower() for path in paths]
+        self.results = {}
+
+    def excluded(self, filename):
+        result = self.results.get(filename)
+        if result is None:
+            path = os.path.abspath(filename).lower()
+            result = True
+            for p in self.paths:
+                if path.startswith(p):
+                    result = False
+                    break
+            self.results[filename] = result
+        return result
+
+class Stub(object):
+    '''A handler call put off until a description needs what it declares.
+    `tagnum` is the value ctypedescs.last_tagnum had when it was put off.'''
+    __slots__ = ['call', 'args', 'tagnum', 'made']
+
+    def __init__(self, call, args, tagnum):
+        self.call = call
+        self.args = args
+        self.tagnum = tagnum
+        self.made = False
+
+def declared_names(declaration):
+    '''Return the names `declaration` declares, as keys of the form
+    ('typedef', name), ('identifier', name), ('struct', tag),
+    ('union', tag) or ('enum', tag).
+
+    Where the declaration is of a struct or enum itself, as in ``struct
+    foo;``, it declares the tag even if it is opaque.'''
+    names = []
+    declarator = declaration.declarator
+    opaque = declarator is None or (not declarator.pointer and
+                                    declarator.parameters is None and
+                                    not declarator.array)
+    _tag_names(declaration.type, names, opaque)
+    if declarator is not None:
+        name = cdeclarations.declarator_name(declarator)
+        if declaration.storage == 'typedef':
+            names.append(('typedef', name))
+        else:
+            names.append(('identifier', name))
+    return names
+
+def macro_names(name):
+    '''Return the keys of the names a #define of `name` declares.  A macro
+    can stand for a type as well as for a value.'''
+    return [('identifier', name), ('typedef', name)]
+
+def _tag_names(type, names, opaque=False):
+    for specifier in type.specifiers:
+        if isinstance(specifier, cdeclarations.StructTypeSpecifier):
+            if specifier.tag and (opaque or specifier.declarations):
+                variety = specifier.is_union and 'union' or 'struct'
+                names.append((variety, specifier.tag))
+            if specifier.declarations:
+                for member in specifier.declarations:
+                    _tag_names(member.type, names)
+        elif isinstance(specifier, cdeclarations.EnumSpecifier):
+            if specifier.tag and (opaque or specifier.enumerators):
+                names.append(('enum', specifier.tag))
+            if specifier.enumerators:
+                for enumerator in specifier.enumerators:
+                    names.append(('identifier', enumerator.name))
+
+def anonymous_types(type, declarator):
+    '''Return how many anonymous structs and enums
+    CtypesParser.get_ctypes_type makes for `type` and `declarator`.'''
+    count = 0
+    for specifier in type.specifiers:
+        if isinstance(specifier, cdeclarations.StructTypeSpecifier):
+            if not specifier.tag:
+                count += 1
+            if specifier.declarations:
+                for member in specifier.declarations:
+                    count += anonymous_types(member.type, member.declarator)
+        elif isinstance(specifier, cdeclarations.EnumSpecifier):
+            if not specifier.tag:
+                count += 1
+
+    while declarator:
+        if declarator.parameters is not None:
+            for param in declarator.parameters:
+                if param == '...':
+                    break
+                count += anonymous_types(param.type, param.declarator)
+        declarator = declarator.pointer
+    return count
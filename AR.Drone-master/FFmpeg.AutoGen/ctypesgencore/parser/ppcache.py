@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+'''
+On-disk cache for the output of the C preprocessor.
+
+Running the preprocessor means spawning a process and rereading every header
+in the include tree, even if none of them changed since the previous run.
+PreprocessorCache stores the preprocessed text under a key derived from the
+preprocessor invocation and the content of the input file. Together with the
+text it stores a content hash of every file named in the line number
+directives of that output, so a cached entry is only used when none of the
+files that went into it has changed.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os, re, marshal, tempfile
+from distutils.spawn import find_executable
+
+try:
+    import hashlib
+    _digest = hashlib.sha1
+except ImportError:
+    import sha
+    _digest = sha.new
+
+# Bump this if the layout of a cache entry changes
+CACHE_FORMAT = 2
+
+# Line number directives, as in pplexer.DIRECTIVE
+_directive_re = re.compile(r'^\#\s+\d+\s+"([^"]+)"', re.MULTILINE)
+
+def file_digest(filename):
+    '''Return the content hash of `filename`, or None if it can't be read.'''
+    try:
+        f = open(filename, 'rb')
+        try:
+            return _digest(f.read()).hexdigest()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+_program_stamps = {}
+
+def program_stamp(program):
+    '''Return a string that changes when the executable `program`, looked
+    up on the PATH like subprocess does, is replaced, as by a compiler
+    upgrade.  It is empty if the program can't be found.'''
+    stamp = _program_stamps.get(program)
+    if stamp is None:
+        stamp = ''
+        path = find_executable(program)
+        if path is not None:
+            try:
+                st = os.stat(path)
+                stamp = '%s %d %d' % (os.path.realpath(path), st.st_size,
+                                      st.st_mtime)
+            except OSError:
+                pass
+        _program_stamps[program] = stamp
+    return stamp
+
+def referenced_files(text):
+    '''Return the names of all real files mentioned in the line number
+    directives of preprocessed `text`, in order of first appearance.
+    Pseudo-files such as <built-in> and <command-line> are left out.'''
+    seen = set()
+    result = []
+    for m in _directive_re.finditer(text):
+        name = m.group(1)
+        if name in seen:
+            continue
+        seen.add(name)
+        if name.startswith('<') and name.endswith('>'):
+            continue
+        result.append(name)
+    return result
+
+class PreprocessorCache(object):
+    '''A directory of cached preprocessor runs.
+
+    Use `key` to compute the cache key of a run, then `load` to look it up.
+    After running the preprocessor, `store` saves its output.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, cmd, defines, include_search_paths, filename, text=None,
+            program=None):
+        '''Compute the key for preprocessing `filename` with `cmd`.
+
+        `cmd` is the preprocessor command line without the input file name,
+        and `program` the executable it runs.  The program_stamp of that
+        goes into the key, since its predefined macros and its own headers
+        can change while the command stays the same.
+        The input file enters the key by content rather than by name, because
+        it is normally a freshly created temporary file.  If `text` is given,
+        it is the content of the input, which is piped into the
+        preprocessor.'''
+        h = _digest()
+        h.update('format %d\0' % CACHE_FORMAT)
+        h.update(cmd + '\0')
+        if program is not None:
+            h.update(program_stamp(program) + '\0')
+        for define in defines:
+            h.update('-D%s\0' % define)
+        for path in include_search_paths:
+            h.update('-I%s\0' % os.path.abspath(path))
+        if text is None:
+            h.update(str(file_digest(filename)))
+        else:
+            h.update(_digest(text).hexdigest())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.ppcache')
+
+    def load(self, key, filename):
+        '''Return the cached (output, errors) pair for `key`, or None if there
+        is no entry or one of the files it depends on has changed.
+
+        Line number directives naming the input file of the cached run are
+        rewritten to name `filename` instead.'''
+        try:
+            f = open(self._path(key), 'rb')
+            try:
+                entry = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+        if entry.get('format') != CACHE_FORMAT:
+            return None
+        for name, digest in entry['depends']:
+            if file_digest(name) != digest:
+                return None
+
+        output = entry['output']
+        if entry['filename'] != filename:
+            output = output.replace('"%s"' % entry['filename'],
+                                    '"%s"' % filename)
+        return output, entry['errors']
+
+    def store(self, key, filename, output, errors):
+        '''Save the output of preprocessing `filename` under `key`.'''
+        depends = []
+        for name in referenced_files(output):
+            if name == filename:
+                continue
+            digest = file_digest(name)
+            if digest is not None:
+                depends.append((name, digest))
+
+        entry = {'format': CACHE_FORMAT,
+                 'filename': filename,
+                 'output': output,
+                 'errors': errors,
+                 'depends': depends}
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # Write to a temporary file first so that concurrent runs never see
+        # a partially written entry.
+        fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        f = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump(entry, f)
+        finally:
+            f.close()
+        os.chmod(tmpname, 0644)
+        path = self._path(key)
+        try:
+            os.rename(tmpname, path)
+        except OSError:
+            # Windows refuses to rename over an existing file
+            try:
+                os.remove(path)
+                os.rename(tmpname, path)
+            except OSError:
+                os.remove(tmpname)
@@ -0,0 +1,1246 @@
+#!/usr/bin/env python
+
+'''An in-process C preprocessor.
+
+PreprocessorEngine does the work of running `cpp -dD` and lexing its output
+with pplexer, but without the round trip through a child process and the
+text it prints.  Headers are tokenized once per run and kept in memory, and
+a header whose include guard (or #pragma once) has already been seen is not
+opened again.
+
+The token stream it returns is laid out the way PreprocessorParser lays out
+the output of cpp: first the expanded source, then every #define that was
+processed, in order.
+
+Reference is C99:
+  * http://www.open-std.org/JTC1/SC22/WG14/www/docs/n1124.pdf
+
+Macro expansion follows Dave Prosser's algorithm, as described in
+  * http://www.spinellis.gr/blog/20060626/cpp.algo.pdf
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os, re, sys, platform
+import lex
+
+# --------------------------------------------------------------------------
+# Preprocessing tokens
+# --------------------------------------------------------------------------
+
+# Splits a file into logical lines.  Comments are replaced by a space and
+# escaped newlines are removed; both may span physical lines.
+_scan_re = re.compile(r'''
+    (?P<newline>\n)
+  | (?P<splice>\\\n)
+  | (?P<block>/\*.*?\*/)
+  | (?P<comment>//[^\n]*)
+  | (?P<text>"(?:\\[^\n]|[^\\"\n])*"|'(?:\\[^\n]|[^\\'\n])*'|[^\n\\/"']+|.)
+''', re.DOTALL | re.VERBOSE)
+
+# Splits a logical line into preprocessing tokens
+_token_re = re.compile(r'''
+    (?P<space>[ \t\f\v\r]+)
+  | (?P<string>L?"(?:\\.|[^\\"])*")
+  | (?P<char>L?'(?:\\.|[^\\'])*')
+  | (?P<ident>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<number>\.?[0-9](?:[eEpP][+-]|[.\w])*)
+  | (?P<punct>%:%:|\.\.\.|<<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\|
+              |[*/%+\-&^|]=|\#\#|<:|:>|<%|%>|%:|[][(){}.&*+\-~!/%<>^|?:;=,\#])
+  | (?P<other>.)
+''', re.VERBOSE)
+
+class PPToken(object):
+    '''A preprocessing token.
+
+    `kind` is one of 'ident', 'number', 'string', 'char', 'punct' or
+    'other'.  `space` is True if the token was preceded by white space.
+    `hideset` is None or a frozenset of the names of the macros whose
+    expansion produced this token.'''
+    __slots__ = ('kind', 'text', 'space', 'lineno', 'hideset')
+
+    def __init__(self, kind, text, space, lineno, hideset=None):
+        self.kind = kind
+        self.text = text
+        self.space = space
+        self.lineno = lineno
+        self.hideset = hideset
+
+    def copy(self):
+        return PPToken(self.kind, self.text, self.space, self.lineno,
+                       self.hideset)
+
+    def __repr__(self):
+        return 'PPToken(%r, %r)' % (self.kind, self.text)
+
+# Stands in for an empty macro argument next to ##
+PLACEMARKER = 'placemarker'
+
+def tokenize_line(text, lineno, breaks=None):
+    '''Return the list of PPTokens in the logical line `text`, which starts
+    on physical line `lineno`.  `breaks` is a list of (offset, lineno) pairs
+    marking where later physical lines begin within `text`.'''
+    result = []
+    space = True
+    for m in _token_re.finditer(text):
+        kind = m.lastgroup
+        if kind == 'space':
+            space = True
+            continue
+        if breaks:
+            start = m.start()
+            for offset, line in breaks:
+                if offset <= start:
+                    lineno = line
+        text = m.group()
+        if kind == 'ident':
+            text = intern(text)
+        result.append(PPToken(kind, text, space, lineno))
+        space = False
+    return result
+
+def split_lines(text):
+    '''Return the logical lines of a source file as a list of
+    (lineno, tokens) pairs.  Empty lines are left out.'''
+    lines = []
+    pieces = []
+    length = 0
+    breaks = None
+    lineno = start = 1
+    for m in _scan_re.finditer(text):
+        kind = m.lastgroup
+        if kind == 'text':
+            s = m.group()
+            pieces.append(s)
+            length += len(s)
+        elif kind == 'newline':
+            if pieces:
+                tokens = tokenize_line(''.join(pieces), start, breaks)
+                if tokens:
+                    lines.append((start, tokens))
+            pieces = []
+            length = 0
+            breaks = None
+            lineno += 1
+            start = lineno
+        else:
+            if kind == 'splice':
+                lineno += 1
+            else:
+                pieces.append(' ')
+                length += 1
+                if kind == 'block':
+                    lineno += m.group().count('\n')
+            if lineno != start:
+                if breaks is None:
+                    breaks = []
+                breaks.append((length, lineno))
+    if pieces:
+        tokens = tokenize_line(''.join(pieces), start, breaks)
+        if tokens:
+            lines.append((start, tokens))
+    return lines
+
+def is_directive(tokens):
+    return tokens[0].kind == 'punct' and tokens[0].text in ('#', '%:')
+
+def directive_name(tokens):
+    if len(tokens) > 1 and tokens[1].kind == 'ident':
+        return tokens[1].text
+    return None
+
+def find_include_guard(lines):
+    '''Return the name of the include guard macro of a file, or None if the
+    file isn't entirely wrapped in #ifndef NAME ... #endif.'''
+    if not lines or not is_directive(lines[0][1]) or \
+       not is_directive(lines[-1][1]) or \
+       directive_name(lines[-1][1]) != 'endif':
+        return None
+
+    first = lines[0][1]
+    d = directive_name(first)
+    texts = [t.text for t in first[2:]]
+    if d == 'ifndef' and len(texts) == 1:
+        name = texts[0]
+    elif d == 'if' and len(texts) == 3 and texts[:2] == ['!', 'defined']:
+        name = texts[2]
+    elif d == 'if' and len(texts) == 5 and \
+         texts[:3] == ['!', 'defined', '('] and texts[4] == ')':
+        name = texts[3]
+    else:
+        return None
+    if not _ident_re.match(name):
+        return None
+
+    # The #endif on the last line has to be the one matching the first line
+    depth = 0
+    last = len(lines) - 1
+    for i, (lineno, tokens) in enumerate(lines):
+        if not is_directive(tokens):
+            continue
+        d = directive_name(tokens)
+        if d in ('if', 'ifdef', 'ifndef'):
+            depth += 1
+        elif d == 'endif':
+            depth -= 1
+            if depth == 0 and i != last:
+                return None
+        elif depth == 1 and d in ('else', 'elif', 'elifdef', 'elifndef'):
+            return None
+    return name
+
+_ident_re = re.compile(r'[A-Za-z_][A-Za-z_0-9]*$')
+
+# --------------------------------------------------------------------------
+# Macros
+# --------------------------------------------------------------------------
+
+class Macro(object):
+    '''A macro definition.
+
+    `params` is None for an object-like macro, and the list of parameter
+    names of a function-like macro, with a trailing '__VA_ARGS__' (or the
+    GNU-style name) if it is variadic.  `spellings` are the parameters as
+    cpp prints them in a #define line.'''
+    __slots__ = ('name', 'params', 'variadic', 'body', 'spellings',
+                 'param_index')
+
+    def __init__(self, name, params, variadic, body, spellings):
+        self.name = name
+        self.params = params
+        self.variadic = variadic
+        self.body = body
+        self.spellings = spellings
+        self.param_index = {}
+        if params:
+            for i, param in enumerate(params):
+                self.param_index[param] = i
+
+# Identifiers that behave like macros for `defined`, although they can only
+# be used in #if expressions
+_builtin_operators = ('__has_include', '__has_include_next',
+                      '__has_attribute', '__has_cpp_attribute',
+                      '__has_c_attribute', '__has_builtin')
+
+# Attributes and builtins __has_attribute and __has_builtin report as
+# supported, to give the same answers as gcc for what the system headers ask.
+_gnu_attributes = set('''
+    access alias aligned alloc_align alloc_size always_inline artificial
+    assume_aligned cold const constructor copy deprecated destructor error
+    externally_visible fallthrough flatten format format_arg gnu_inline hot
+    ifunc indirect_return leaf malloc may_alias mode no_instrument_function
+    no_profile_instrument_function no_reorder no_sanitize
+    no_sanitize_address no_sanitize_thread no_stack_protector noclone
+    noinline noipa nonnull nonstring noplt noreturn nothrow optimize packed
+    pure returns_nonnull returns_twice scalar_storage_order section sentinel
+    simd target target_clones transparent_union unavailable unused used
+    vector_size visibility warn_unused_result warning weak weakref
+'''.split())
+
+_gnu_builtins = set('''
+    __builtin_FILE __builtin_FUNCTION __builtin_LINE __builtin_add_overflow
+    __builtin_assume_aligned __builtin_bswap16 __builtin_bswap32
+    __builtin_bswap64 __builtin_bswap128 __builtin_clz __builtin_clzll
+    __builtin_constant_p __builtin_ctz __builtin_ctzll
+    __builtin_dynamic_object_size __builtin_expect __builtin_frame_address
+    __builtin_isinf __builtin_memcmp __builtin_memcpy __builtin_memset
+    __builtin_mul_overflow __builtin_nan __builtin_object_size
+    __builtin_popcount __builtin_sadd_overflow __builtin_smul_overflow
+    __builtin_sprintf __builtin_ssub_overflow __builtin_strcmp
+    __builtin_strlen __builtin_sub_overflow __builtin_trap
+    __builtin_uadd_overflow __builtin_unreachable
+'''.split())
+
+# Predefined macros whose value depends on where they are used
+_dynamic_macros = ('__FILE__', '__LINE__')
+
+def default_predefines():
+    '''Return the macros an in-process run defines before reading any file,
+    as 'NAME=VALUE' strings.  These stand in for the (far longer) list of
+    macros built into gcc; more can be added with the
+    `preprocessor_predefines` option.'''
+    result = ['__STDC__=1', '__STDC_HOSTED__=1', '__STDC_VERSION__=199901L']
+    if sys.platform.startswith('linux'):
+        result += ['__linux__=1', '__unix__=1']
+    elif sys.platform == 'darwin':
+        result += ['__APPLE__=1', '__MACH__=1']
+    elif sys.platform == 'win32':
+        result += ['_WIN32=1']
+    machine = platform.machine().lower()
+    if machine in ('x86_64', 'amd64'):
+        result += ['__x86_64__=1']
+        if sys.platform == 'win32':
+            result += ['_WIN64=1']
+        else:
+            result += ['__LP64__=1']
+    elif re.match(r'i\d86$', machine):
+        result += ['__i386__=1']
+    return result
+
+# --------------------------------------------------------------------------
+# #if expressions
+# --------------------------------------------------------------------------
+
+class ExpressionError(Exception):
+    pass
+
+_MASK = (1 << 64) - 1
+_SIGN = 1 << 63
+
+def _wrap(value, unsigned):
+    value &= _MASK
+    if not unsigned and value & _SIGN:
+        value -= 1 << 64
+    return value
+
+_integer_re = re.compile(r'(0[xX][0-9a-fA-F]+|0[bB][01]+|[0-9]+)([uUlL]*)$')
+
+def _integer_value(text):
+    m = _integer_re.match(text)
+    if not m:
+        raise ExpressionError('invalid integer constant "%s" in #if' % text)
+    digits, suffix = m.groups()
+    if digits[:2] in ('0x', '0X'):
+        value = long(digits[2:], 16)
+    elif digits[:2] in ('0b', '0B'):
+        value = long(digits[2:], 2)
+    elif digits[0] == '0':
+        try:
+            value = long(digits, 8)
+        except ValueError:
+            raise ExpressionError('invalid digit in octal constant "%s"' % \
+                text)
+    else:
+        value = long(digits)
+    unsigned = 'u' in suffix or 'U' in suffix or value >= _SIGN
+    return _wrap(value, unsigned), unsigned
+
+def _character_value(text):
+    if text.startswith('L'):
+        text = text[1:]
+    try:
+        chars = text[1:-1].decode('string_escape')
+    except ValueError:
+        raise ExpressionError('invalid character constant %s' % text)
+    if not chars:
+        raise ExpressionError('empty character constant')
+    value = 0
+    for c in chars:
+        value = (value << 8) | ord(c)
+    if len(chars) == 1 and value >= 0x80:
+        value -= 0x100
+    return value, False
+
+_binary_precedence = {
+    '||': 1, '&&': 2, '|': 3, '^': 4, '&': 5,
+    '==': 6, '!=': 6, '<': 7, '>': 7, '<=': 7, '>=': 7,
+    '<<': 8, '>>': 8, '+': 9, '-': 9, '*': 10, '/': 10, '%': 10
+}
+
+class ExpressionEvaluator(object):
+    '''Evaluates the macro-expanded tokens of an #if line.
+
+    Values are (value, unsigned) pairs that wrap around at 64 bits, like
+    intmax_t and uintmax_t do.'''
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        # Greater than 0 while evaluating an operand whose value doesn't
+        # matter, like the right side of 0 && x
+        self.unevaluated = 0
+
+    def evaluate(self):
+        if not self.tokens:
+            raise ExpressionError('#if with no expression')
+        value, unsigned = self.comma()
+        if self.pos < len(self.tokens):
+            raise ExpressionError('missing binary operator before token ' \
+                '"%s"' % self.tokens[self.pos].text)
+        return value
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            t = self.tokens[self.pos]
+            if t.kind == 'punct':
+                return t.text
+        return None
+
+    def expect(self, text):
+        if self.peek() != text:
+            raise ExpressionError("expected '%s' in #if expression" % text)
+        self.pos += 1
+
+    def comma(self):
+        result = self.conditional()
+        while self.peek() == ',':
+            self.pos += 1
+            result = self.conditional()
+        return result
+
+    def conditional(self):
+        condition = self.binary(1)
+        if self.peek() != '?':
+            return condition
+        self.pos += 1
+        if not condition[0]:
+            self.unevaluated += 1
+        true = self.comma()
+        if not condition[0]:
+            self.unevaluated -= 1
+        self.expect(':')
+        if condition[0]:
+            self.unevaluated += 1
+        false = self.conditional()
+        if condition[0]:
+            self.unevaluated -= 1
+        unsigned = true[1] or false[1]
+        if condition[0]:
+            return _wrap(true[0], unsigned), unsigned
+        return _wrap(false[0], unsigned), unsigned
+
+    def binary(self, min_precedence):
+        lhs = self.unary()
+        while True:
+            op = self.peek()
+            precedence = _binary_precedence.get(op)
+            if precedence is None or precedence < min_precedence:
+                return lhs
+            self.pos += 1
+            skip = op == '&&' and not lhs[0] or op == '||' and lhs[0]
+            if skip:
+                self.unevaluated += 1
+            rhs = self.binary(precedence + 1)
+            if skip:
+                self.unevaluated -= 1
+            lhs = self.apply(op, lhs, rhs)
+
+    def apply(self, op, lhs, rhs):
+        a, a_unsigned = lhs
+        b, b_unsigned = rhs
+        if op == '&&':
+            return int(bool(a and b)), False
+        if op == '||':
+            return int(bool(a or b)), False
+        if op in ('<<', '>>'):
+            unsigned = a_unsigned
+            if b < 0:
+                op = op == '<<' and '>>' or '<<'
+                b = -b
+            if op == '<<':
+                return _wrap(a << min(b, 64), unsigned), unsigned
+            return _wrap(a >> min(b, 64), unsigned), unsigned
+
+        unsigned = a_unsigned or b_unsigned
+        if unsigned:
+            a &= _MASK
+            b &= _MASK
+        if op == '+':
+            value = a + b
+        elif op == '-':
+            value = a - b
+        elif op == '*':
+            value = a * b
+        elif op in ('/', '%'):
+            if b == 0:
+                if self.unevaluated:
+                    return 0, unsigned
+                raise ExpressionError('division by zero in #if')
+            # C truncates toward zero
+            q = abs(a) // abs(b)
+            if (a < 0) != (b < 0):
+                q = -q
+            if op == '/':
+                value = q
+            else:
+                value = a - q * b
+        elif op == '&':
+            value = a & b
+        elif op == '^':
+            value = a ^ b
+        elif op == '|':
+            value = a | b
+        else:
+            return int({'==': a == b, '!=': a != b, '<': a < b, '>': a > b,
+                        '<=': a <= b, '>=': a >= b}[op]), False
+        return _wrap(value, unsigned), unsigned
+
+    def unary(self):
+        op = self.peek()
+        if op in ('+', '-', '~', '!'):
+            self.pos += 1
+            value, unsigned = self.unary()
+            if op == '-':
+                return _wrap(-value, unsigned), unsigned
+            elif op == '~':
+                return _wrap(~value, unsigned), unsigned
+            elif op == '!':
+                return int(not value), False
+            return value, unsigned
+        return self.primary()
+
+    def primary(self):
+        if self.pos >= len(self.tokens):
+            raise ExpressionError('#if with incomplete expression')
+        t = self.tokens[self.pos]
+        self.pos += 1
+        if t.kind == 'number':
+            return _integer_value(t.text)
+        elif t.kind == 'char':
+            return _character_value(t.text)
+        elif t.kind == 'ident':
+            # Identifiers that aren't macros evaluate to 0
+            return 0, False
+        elif t.kind == 'punct' and t.text == '(':
+            result = self.comma()
+            self.expect(')')
+            return result
+        raise ExpressionError('token "%s" is not valid in preprocessor ' \
+            'expressions' % t.text)
+
+# --------------------------------------------------------------------------
+# Engine
+# --------------------------------------------------------------------------
+
+class SourceFile(object):
+    '''The tokenized lines of a file, kept for the rest of the run.'''
+    __slots__ = ('mtime', 'lines', 'guard')
+
+    def __init__(self, mtime, lines):
+        self.mtime = mtime
+        self.lines = lines
+        self.guard = find_include_guard(lines)
+
+class PreprocessorEngine(object):
+    '''Preprocess C source files without running an external preprocessor.
+
+    `lexer` is a PreprocessorLexer; it is used to turn the spelling of
+    numbers, strings and punctuators into exactly the tokens it would have
+    produced from the output of cpp.  `handle_error` is called with an error
+    message (in the format gcc uses) whenever something goes wrong.
+
+    An engine can be reused for several calls to `preprocess`; files read
+    by one are not read again by the next unless they changed.'''
+
+    max_include_depth = 200
+
+    def __init__(self, lexer, handle_error, system_include_paths=(),
+                 predefines=None):
+        self.lexer = lexer
+        self.handle_error = handle_error
+        self.system_include_paths = list(system_include_paths)
+        if predefines is None:
+            predefines = default_predefines()
+        self.predefines = list(predefines)
+
+        self.files = {}
+        self.file_exists = {}
+        self.spellings = {}
+
+    # ----------------------------------------------------------------------
+    # Entry point
+    # ----------------------------------------------------------------------
+
+    def preprocess(self, filename, include_search_paths=(), defines=(),
+                   text=None):
+        '''Preprocess `filename` and return the list of LexTokens the
+        pplexer would produce from the rearranged output of `cpp -dD`.
+
+        `include_search_paths` are searched as with -I, and `defines` are
+        'NAME=VALUE' strings defined as with -D.  If `text` is given, it is
+        used as the content of `filename` instead of reading the file.'''
+        self.search_path = list(include_search_paths) + \
+                           self.system_include_paths
+        self.macros = {}
+        self.once = set()
+        self.source = []
+        self.defines = []
+        self.depth = 0
+        self.filename = None
+        self.index = None
+
+        for filename_, definitions in (('<built-in>', self.predefines),
+                                       ('<command-line>', defines)):
+            self.filename = filename_
+            # cpp puts all of these on line 0
+            for definition in definitions:
+                name, sep, value = definition.partition('=')
+                if not sep:
+                    value = '1'
+                self.do_define(tokenize_line('%s %s' % (name, value), 0), 0)
+
+        if text is None:
+            self.include(filename, None)
+        else:
+            self.include(filename, None,
+                         source=SourceFile(None, split_lines(text)))
+
+        result = self.source + self.defines
+        for i, t in enumerate(result):
+            t.lexpos = i
+        self.source = self.defines = None
+        return result
+
+    def error(self, lineno, message):
+        self.handle_error('%s:%d: error: %s' % (self.filename, lineno,
+                                                  message))
+
+    # ----------------------------------------------------------------------
+    # Files
+    # ----------------------------------------------------------------------
+
+    def load(self, path):
+        '''Return the SourceFile for `path`, reading it if it isn't cached
+        or has changed since it was read.'''
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        source = self.files.get(path)
+        if source is None or source.mtime != mtime:
+            try:
+                f = open(path, 'rU')
+                try:
+                    text = f.read()
+                finally:
+                    f.close()
+            except IOError:
+                return None
+            source = SourceFile(mtime, split_lines(text))
+            self.files[path] = source
+        return source
+
+    def exists(self, path):
+        result = self.file_exists.get(path)
+        if result is None:
+            result = self.file_exists[path] = os.path.isfile(path)
+        return result
+
+    def find_include(self, name, quoted, next_index=None):
+        '''Return (path, index) for the header `name`, where `index` is the
+        position in the search path at which it was found (None if it
+        wasn't found through the search path), or (None, None).'''
+        if os.path.isabs(name):
+            if self.exists(name):
+                return name, None
+            return None, None
+        if quoted and next_index is None:
+            directory = os.path.dirname(self.filename)
+            path = directory and os.path.join(directory, name) or name
+            if self.exists(path):
+                return path, None
+        if next_index is None:
+            start = 0
+        else:
+            start = next_index + 1
+        for index in xrange(start, len(self.search_path)):
+            path = os.path.join(self.search_path[index], name)
+            if self.exists(path):
+                return path, index
+        return None, None
+
+    def include(self, path, index, lineno=0, source=None):
+        if source is None:
+            source = self.load(path)
+        if source is None:
+            if self.filename is None:
+                self.filename = path
+            self.error(lineno, '%s: No such file or directory' % path)
+            return
+        if source.guard is not None and source.guard in self.macros:
+            return
+        if self.once and os.path.realpath(path) in self.once:
+            return
+        if self.depth >= self.max_include_depth:
+            self.error(lineno, '#include nested too deeply')
+            return
+
+        graph = self.lexer.include_graph
+        if graph is not None and self.depth:
+            graph.add(self.filename, path)
+
+        saved = self.filename, self.index
+        self.filename, self.index = path, index
+        self.depth += 1
+        try:
+            self.process(source.lines)
+        finally:
+            self.depth -= 1
+            self.filename, self.index = saved
+
+    # ----------------------------------------------------------------------
+    # Directives
+    # ----------------------------------------------------------------------
+
+    def process(self, lines):
+        '''Run the lines of a file through the preprocessor.'''
+        # Each entry is [parent is active, a branch was taken, #else seen]
+        conditions = []
+        active = True
+        # Text lines are collected until the next directive, as macro
+        # arguments may span several lines.
+        run = []
+        for lineno, tokens in lines:
+            if not is_directive(tokens):
+                if active:
+                    run.extend(tokens)
+                continue
+
+            d = directive_name(tokens)
+            if d in ('if', 'ifdef', 'ifndef'):
+                if active:
+                    taken = self.evaluate(d, tokens[2:], lineno)
+                else:
+                    taken = False
+                conditions.append([active, taken, False])
+                active = active and taken
+            elif d in ('elif', 'elifdef', 'elifndef', 'else'):
+                if not conditions:
+                    self.error(lineno, '#%s without #if' % d)
+                    continue
+                condition = conditions[-1]
+                if condition[2]:
+                    self.error(lineno, '#%s after #else' % d)
+                if d == 'else':
+                    condition[2] = True
+                    active = condition[0] and not condition[1]
+                elif condition[0] and not condition[1]:
+                    active = self.evaluate(d[2:] or 'if', tokens[2:], lineno)
+                else:
+                    active = False
+                condition[1] = condition[1] or active
+            elif d == 'endif':
+                if not conditions:
+                    self.error(lineno, '#endif without #if')
+                    continue
+                active = conditions.pop()[0]
+            elif active:
+                self.flush(run)
+                self.directive(d, tokens, lineno)
+
+        self.flush(run)
+        if conditions:
+            self.error(lines[-1][0], 'unterminated conditional directive')
+
+    def directive(self, d, tokens, lineno):
+        if d == 'define':
+            self.do_define(tokens[2:], lineno)
+        elif d == 'undef':
+            if len(tokens) > 2:
+                self.macros.pop(tokens[2].text, None)
+        elif d in ('include', 'include_next', 'import'):
+            self.do_include(d, tokens[2:], lineno)
+        elif d == 'pragma':
+            if len(tokens) > 2 and tokens[2].text == 'once':
+                self.once.add(os.path.realpath(self.filename))
+        elif d == 'error':
+            self.error(lineno, '#error %s' % self.spell(tokens[2:]))
+        elif d == 'warning':
+            self.handle_error('%s:%d: warning: #warning %s' % \
+                (self.filename, lineno, self.spell(tokens[2:])))
+        elif d is None and len(tokens) > 1 and tokens[1].kind != 'number':
+            self.error(lineno, 'invalid preprocessing directive')
+        # #line, #ident, #sccs and #assert don't affect the token stream
+
+    def spell(self, tokens):
+        '''Return the text of `tokens` with their spacing.'''
+        parts = []
+        for i, t in enumerate(tokens):
+            if i and t.space:
+                parts.append(' ')
+            parts.append(t.text)
+        return ''.join(parts)
+
+    def do_define(self, tokens, lineno):
+        if not tokens or tokens[0].kind != 'ident':
+            self.error(lineno, 'macro names must be identifiers')
+            return
+        name = tokens[0].text
+        if name == 'defined':
+            self.error(lineno, '"defined" cannot be used as a macro name')
+            return
+
+        params = spellings = None
+        variadic = False
+        i = 1
+        if len(tokens) > 1 and tokens[1].text == '(' and not tokens[1].space:
+            params = []
+            spellings = []
+            i = 2
+            try:
+                if tokens[i].text == ')':
+                    i += 1
+                else:
+                    while True:
+                        t = tokens[i]
+                        if t.kind == 'ident':
+                            i += 1
+                            if tokens[i].text == '...':
+                                i += 1
+                                variadic = True
+                                spellings.append(t.text + '...')
+                            else:
+                                spellings.append(t.text)
+                            params.append(t.text)
+                        elif t.text == '...':
+                            i += 1
+                            variadic = True
+                            params.append('__VA_ARGS__')
+                            spellings.append('...')
+                        else:
+                            raise IndexError
+                        t = tokens[i]
+                        i += 1
+                        if t.text == ')':
+                            break
+                        if t.text != ',' or variadic:
+                            raise IndexError
+            except IndexError:
+                self.error(lineno, 'invalid macro parameter list for "%s"' % \
+                    name)
+                return
+
+        macro = Macro(name, params, variadic, tokens[i:], spellings)
+        self.macros[name] = macro
+        self.emit_define(macro, lineno)
+
+    def do_include(self, d, tokens, lineno):
+        name, quoted = self.header_name(tokens)
+        if name is None:
+            self.error(lineno, '#%s expects "FILENAME" or <FILENAME>' % d)
+            return
+
+        next_index = None
+        if d == 'include_next':
+            next_index = self.index
+        path, index = self.find_include(name, quoted, next_index)
+        if path is None:
+            self.error(lineno, '%s: No such file or directory' % name)
+            return
+
+        if d == 'import':
+            self.once.add(os.path.realpath(path))
+        self.include(path, index, lineno)
+
+    def header_name(self, tokens, expand=True):
+        '''Return (name, quoted) for the operand of #include, or (None,
+        None) if it isn't a header name.'''
+        if tokens and tokens[0].kind == 'string' and \
+           tokens[0].text[0] == '"':
+            return tokens[0].text[1:-1], True
+        if tokens and tokens[0].text == '<':
+            for i in xrange(1, len(tokens)):
+                if tokens[i].text == '>':
+                    return self.spell(tokens[1:i]), False
+            return None, None
+        if expand and tokens:
+            return self.header_name(self.expand(tokens), False)
+        return None, None
+
+    # ----------------------------------------------------------------------
+    # Conditions
+    # ----------------------------------------------------------------------
+
+    def evaluate(self, d, tokens, lineno):
+        '''Return the truth value of the condition of an #if, #ifdef or
+        #ifndef line.'''
+        if d in ('ifdef', 'ifndef'):
+            if not tokens or tokens[0].kind != 'ident':
+                self.error(lineno, 'no macro name given in #%s directive' % d)
+                return False
+            return self.is_defined(tokens[0].text) == (d == 'ifdef')
+
+        try:
+            # The operators can also come out of a macro expansion
+            tokens = self.replace_operators(tokens)
+            tokens = self.replace_operators(self.expand(tokens))
+            return bool(ExpressionEvaluator(tokens).evaluate())
+        except ExpressionError, e:
+            self.error(lineno, str(e))
+            return False
+
+    def is_defined(self, name):
+        return name in self.macros or name in _dynamic_macros or \
+               name in _builtin_operators
+
+    def replace_operators(self, tokens):
+        '''Replace `defined` and the __has_* operators in an #if line by
+        their values.'''
+        result = []
+        i = 0
+        n = len(tokens)
+        while i < n:
+            t = tokens[i]
+            if t.kind != 'ident' or (t.text != 'defined' and
+                                     t.text not in _builtin_operators):
+                result.append(t)
+                i += 1
+                continue
+
+            if t.text == 'defined':
+                j = i + 1
+                paren = j < n and tokens[j].text == '('
+                if paren:
+                    j += 1
+                if j >= n or tokens[j].kind != 'ident':
+                    raise ExpressionError('operator "defined" requires an ' \
+                        'identifier')
+                value = self.is_defined(tokens[j].text)
+                j += 1
+                if paren:
+                    if j >= n or tokens[j].text != ')':
+                        raise ExpressionError('missing \')\' after ' \
+                            '"defined"')
+                    j += 1
+            else:
+                if i + 1 >= n or tokens[i + 1].text != '(':
+                    raise ExpressionError('missing \'(\' after "%s"' % \
+                        t.text)
+                depth = 0
+                for j in xrange(i + 1, n):
+                    if tokens[j].text == '(':
+                        depth += 1
+                    elif tokens[j].text == ')':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                else:
+                    raise ExpressionError('missing \')\' after "%s"' % \
+                        t.text)
+                operand = tokens[i + 2:j]
+                j += 1
+                value = False
+                if t.text in ('__has_include', '__has_include_next'):
+                    name, quoted = self.header_name(operand)
+                    if name is None:
+                        raise ExpressionError('operator "%s" requires a ' \
+                            'header name' % t.text)
+                    next_index = None
+                    if t.text == '__has_include_next':
+                        next_index = self.index
+                    value = self.find_include(name, quoted,
+                                              next_index)[0] is not None
+                elif t.text == '__has_attribute' and len(operand) == 1:
+                    name = operand[0].text
+                    if name.startswith('__') and name.endswith('__'):
+                        name = name[2:-2]
+                    value = name in _gnu_attributes
+                elif t.text == '__has_builtin' and len(operand) == 1:
+                    value = operand[0].text in _gnu_builtins
+
+            result.append(PPToken('number', value and '1' or '0', t.space,
+                                  t.lineno))
+            i = j
+        return result
+
+    # ----------------------------------------------------------------------
+    # Macro expansion
+    # ----------------------------------------------------------------------
+
+    def expand(self, tokens):
+        '''Return `tokens` with all macros expanded.'''
+        macros = self.macros
+        result = []
+        stack = tokens[::-1]
+        while stack:
+            t = stack.pop()
+            if t.kind != 'ident':
+                result.append(t)
+                continue
+            name = t.text
+            macro = macros.get(name)
+            if macro is None:
+                if name in _dynamic_macros:
+                    t = self.dynamic_macro(t)
+                result.append(t)
+                continue
+            if t.hideset is not None and name in t.hideset:
+                result.append(t)
+                continue
+
+            if macro.params is None:
+                args = None
+                hideset = t.hideset
+            else:
+                if not stack or stack[-1].text != '(' or \
+                   stack[-1].kind != 'punct':
+                    result.append(t)
+                    continue
+                args, rparen = self.collect_arguments(stack, macro, t)
+                if args is None:
+                    result.append(t)
+                    continue
+                if t.hideset is None or rparen.hideset is None:
+                    hideset = None
+                else:
+                    hideset = t.hideset & rparen.hideset
+            if hideset is None:
+                hideset = frozenset((name,))
+            else:
+                hideset = hideset | frozenset((name,))
+
+            replacement = self.substitute(macro, args, hideset, t)
+            replacement.reverse()
+            stack.extend(replacement)
+        return result
+
+    def dynamic_macro(self, t):
+        if t.text == '__LINE__':
+            text, kind = str(t.lineno), 'number'
+        else:
+            text, kind = '"%s"' % self.filename.replace('\\', '\\\\'), \
+                         'string'
+        return PPToken(kind, text, t.space, t.lineno, t.hideset)
+
+    def collect_arguments(self, stack, macro, origin):
+        '''Pop the argument list of a call to `macro` off `stack`.  Return
+        the list of arguments and the closing parenthesis, or (None, None)
+        if this isn't a valid call, in which case `stack` is left as it
+        was.'''
+        popped = [stack.pop()]
+        args = [[]]
+        depth = 0
+        nparams = len(macro.params)
+        while stack:
+            t = stack.pop()
+            popped.append(t)
+            if t.kind == 'punct':
+                text = t.text
+                if text == '(':
+                    depth += 1
+                elif text == ')':
+                    if depth == 0:
+                        break
+                    depth -= 1
+                elif text == ',' and depth == 0 and \
+                     not (macro.variadic and len(args) == nparams):
+                    args.append([])
+                    continue
+            args[-1].append(t)
+        else:
+            popped.reverse()
+            stack.extend(popped)
+            return None, None
+
+        if nparams == 0 and args == [[]]:
+            args = []
+        elif macro.variadic and len(args) == nparams - 1:
+            args.append([])
+        if len(args) != nparams:
+            self.error(origin.lineno, 'macro "%s" passed %d arguments, but ' \
+                'takes %d' % (macro.name, len(args), nparams))
+            popped.reverse()
+            stack.extend(popped)
+            return None, None
+        return args, t
+
+    def substitute(self, macro, args, hideset, origin):
+        '''Return the replacement list of `macro` with `args` substituted
+        for its parameters.'''
+        body = macro.body
+        index = macro.param_index
+        expanded = {}
+        result = []
+        i = 0
+        n = len(body)
+        while i < n:
+            b = body[i]
+            if args is not None and b.kind == 'punct' and \
+               b.text in ('#', '%:') and i + 1 < n and \
+               body[i + 1].text in index:
+                result.append(self.stringize(args[index[body[i + 1].text]],
+                                             b.space))
+                i += 2
+                continue
+
+            if b.kind == 'punct' and b.text in ('##', '%:%:') and \
+               result and i + 1 < n:
+                rhs = body[i + 1]
+                i += 2
+                k = -1
+                if args is not None:
+                    k = index.get(rhs.text, -1)
+                if k < 0:
+                    rhs = [rhs.copy()]
+                else:
+                    rhs = [a.copy() for a in args[k]]
+                    if macro.variadic and k == len(args) - 1 and \
+                       result[-1].kind == 'punct' and result[-1].text == ',':
+                        # GNU extension: , ## __VA_ARGS__ swallows the comma
+                        # if there are no variable arguments
+                        if not rhs:
+                            result.pop()
+                        result.extend(rhs)
+                        continue
+                lhs = result.pop()
+                if not rhs:
+                    result.append(lhs)
+                elif lhs.kind == PLACEMARKER:
+                    result.extend(rhs)
+                else:
+                    result.extend(self.paste(lhs, rhs[0]))
+                    result.extend(rhs[1:])
+                continue
+
+            k = -1
+            if args is not None and b.kind == 'ident':
+                k = index.get(b.text, -1)
+            if k < 0:
+                result.append(b.copy())
+            else:
+                if i + 1 < n and body[i + 1].kind == 'punct' and \
+                   body[i + 1].text in ('##', '%:%:'):
+                    arg = args[k]
+                    if not arg:
+                        result.append(PPToken(PLACEMARKER, '', b.space,
+                                              origin.lineno))
+                else:
+                    arg = expanded.get(k)
+                    if arg is None:
+                        arg = expanded[k] = self.expand(args[k])
+                start = len(result)
+                result.extend([a.copy() for a in arg])
+                if len(result) > start:
+                    result[start].space = b.space
+            i += 1
+
+        lineno = origin.lineno
+        output = []
+        for t in result:
+            if t.kind == PLACEMARKER:
+                continue
+            if t.hideset is None:
+                t.hideset = hideset
+            else:
+                t.hideset = t.hideset | hideset
+            t.lineno = lineno
+            output.append(t)
+        if output:
+            output[0].space = origin.space
+        return output
+
+    def stringize(self, arg, space):
+        parts = []
+        for i, t in enumerate(arg):
+            if i and t.space:
+                parts.append(' ')
+            if t.kind in ('string', 'char'):
+                parts.append(t.text.replace('\\', '\\\\').replace('"', '\\"'))
+            else:
+                parts.append(t.text)
+        return PPToken('string', '"%s"' % ''.join(parts), space, 0)
+
+    def paste(self, lhs, rhs):
+        tokens = tokenize_line(lhs.text + rhs.text, lhs.lineno)
+        if len(tokens) == 1:
+            tokens[0].space = lhs.space
+            return tokens
+        self.error(lhs.lineno, 'pasting "%s" and "%s" does not give a valid ' \
+            'preprocessing token' % (lhs.text, rhs.text))
+        return [lhs, rhs]
+
+    # ----------------------------------------------------------------------
+    # Output
+    # ----------------------------------------------------------------------
+
+    def lex_spelling(self, text):
+        '''Return the (type, value) pairs the pplexer produces for `text`.'''
+        result = self.spellings.get(text)
+        if result is None:
+            result = []
+            self.lexer.input(text)
+            try:
+                while True:
+                    t = self.lexer.token()
+                    if t is None:
+                        break
+                    result.append((t.type, t.value))
+            except lex.LexError:
+                result = [('OTHER', text)]
+            self.spellings[text] = result
+        return result
+
+    def append(self, output, type, value, lineno):
+        t = lex.LexToken()
+        t.type = type
+        t.value = value
+        t.lineno = lineno
+        t.filename = self.filename
+        t.lexer = self.lexer
+        output.append(t)
+
+    def flush(self, run):
+        '''Expand the collected text lines and add them to the output.'''
+        if not run:
+            return
+        tokens = self.expand(run)
+        del run[:]
+
+        output = self.source
+        i = 0
+        n = len(tokens)
+        while i < n:
+            t = tokens[i]
+            kind = t.kind
+            if kind == 'ident':
+                if t.text == '_Pragma' and i + 3 < n and \
+                   tokens[i + 1].text == '(' and \
+                   tokens[i + 2].kind == 'string' and \
+                   tokens[i + 3].text == ')':
+                    i += 4
+                    continue
+                self.append(output, 'IDENTIFIER', t.text, t.lineno)
+            elif kind == 'other' or t.text in ('#', '##', '%:', '%:%:'):
+                self.append(output, 'OTHER', t.text, t.lineno)
+            elif t.text == '(':
+                self.append(output, t.space and '(' or 'LPAREN', '(',
+                            t.lineno)
+            else:
+                for type, value in self.lex_spelling(t.text):
+                    self.append(output, type, value, t.lineno)
+            i += 1
+
+    def emit_define(self, macro, lineno):
+        '''Add the tokens of `macro` as the pplexer would read them from a
+        #define line of `cpp -dD` output.'''
+        output = self.defines
+        self.append(output, 'PP_DEFINE', '#define', lineno)
+        if macro.params is None:
+            self.append(output, 'PP_DEFINE_NAME', macro.name, lineno)
+            params = ()
+        else:
+            self.append(output, 'PP_DEFINE_MACRO_NAME', macro.name, lineno)
+            self.append(output, 'LPAREN', '(', lineno)
+            for i, param in enumerate(macro.spellings):
+                if i:
+                    self.append(output, ',', ',', lineno)
+                if param.endswith('...'):
+                    if param != '...':
+                        self.append(output, 'IDENTIFIER', param[:-3], lineno)
+                    self.append(output, 'ELLIPSIS', '...', lineno)
+                else:
+                    self.append(output, 'PP_MACRO_PARAM', param, lineno)
+            self.append(output, ')', ')', lineno)
+            params = macro.spellings
+
+        for i, t in enumerate(macro.body):
+            kind = t.kind
+            if kind == 'ident':
+                if t.text in params:
+                    self.append(output, 'PP_MACRO_PARAM', t.text, lineno)
+                else:
+                    self.append(output, 'IDENTIFIER', t.text, lineno)
+            elif kind == 'other':
+                self.append(output, 'OTHER', t.text[0], lineno)
+            elif t.text in ('#', '%:'):
+                self.append(output, 'PP_STRINGIFY', t.text, lineno)
+            elif t.text in ('##', '%:%:'):
+                self.append(output, 'PP_IDENTIFIER_PASTE', t.text, lineno)
+            elif t.text == '(':
+                # cpp always puts a space between the name and the body
+                self.append(output, (i == 0 or t.space) and '(' or 'LPAREN',
+                            '(', lineno)
+            else:
+                for type, value in self.lex_spelling(t.text):
+                    self.append(output, type, value, lineno)
+        self.append(output, 'PP_END_DEFINE', '\n', lineno)
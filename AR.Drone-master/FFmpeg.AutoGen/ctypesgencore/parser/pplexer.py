@@ -50,7 +50,8 @@ def sub(s):
 # Token value types
 # --------------------------------------------------------------------------
 
-# Numbers represented as int and float types.
+# Numbers (PP_NUMBER) represented as plain int, long or float values.
+# String literals represented as RawStringLiteral.
 # For all other tokens, type is just str representation.
 
 class StringLiteral(str):
@@ -60,6 +61,38 @@ class StringLiteral(str):
         value = value[1:-1].decode('string_escape')
         return str.__new__(cls, value)
 
+    def __reduce__(self):
+        return (StringLiteral, ('"%s"' % self.encode('string_escape'),))
+
+class RawStringLiteral(object):
+    '''A string literal as it was lexed, quotes and escapes included.  Most
+    string literals come from system headers or from macros that are never
+    used, so they are only unescaped when `decoded` is first called.'''
+    __slots__ = ['text', 'value']
+
+    def __init__(self, text):
+        self.text = text
+        self.value = None
+
+    def decoded(self):
+        '''Return the value of the literal as a StringLiteral.'''
+        if self.value is None:
+            self.value = StringLiteral(self.text)
+        return self.value
+
+    def __str__(self):
+        return self.decoded()
+
+    def __reduce__(self):
+        return (RawStringLiteral, (self.text,))
+
+def integer_literal(value, is_long):
+    '''Return the integer `value` as a long if `is_long` is True, and as
+    an int if it fits in one otherwise.'''
+    if is_long:
+        return long(value)
+    return int(value)
+
 # --------------------------------------------------------------------------
 # Token declarations
 # --------------------------------------------------------------------------
@@ -118,19 +151,53 @@ punctuators = {
 }
 
 def punctuator_regex(punctuators):
-    punctuator_regexes = [v[0] for v in punctuators.values()]
-    punctuator_regexes.sort(lambda a, b: -cmp(len(a), len(b)))
-    return '(%s)' % '|'.join(punctuator_regexes)
+    # The punctuators are written as a trie, so that the regex engine only
+    # tries the ones that start with the character at hand, longest first
+    trie = {}
+    for value in punctuators:
+        node = trie
+        for c in value:
+            node = node.setdefault(c, {})
+        node[''] = {}
+    return '(%s)' % trie_regex(trie)
+
+def trie_regex(node):
+    '''Return a regex for the strings in the trie `node`, which matches the
+    longest of them.'''
+    alternatives = []
+    for c in sorted(node):
+        if c:
+            alternatives.append(re.escape(c) + trie_regex(node[c]))
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and '' not in node:
+        return alternatives[0]
+    regex = '(?:%s)' % '|'.join(alternatives)
+    if '' in node:
+        regex += '?'
+    return regex
 
 # Process line-number directives from the preprocessor
 # See http://docs.freebsd.org/info/cpp/cpp.info.Output.html
 DIRECTIVE = r'\#\s+(\d+)\s+"([^"]+)"[ \d]*\n'
 @TOKEN(DIRECTIVE)
 def t_ANY_directive(t):
+    # A flag of 1 after the file name means it is entered by an #include
+    graph = t.lexer.include_graph
+    if graph is not None and '1' in t.value[t.value.rindex('"')+1:].split():
+        graph.add(t.lexer.filename, t.groups[2])
     t.lexer.filename = t.groups[2]
-    t.lexer.lineno = int(t.groups[1])
+    t.lexer.lineno = int(t.groups[1]) + \
+        skipped_lines(t.lexer, t.lexpos + len(t.value))
     return None
 
+def skipped_lines(lexer, pos):
+    '''Return the number of lines of the preprocessor output that were
+    left out of the text being lexed right before position `pos`.'''
+    if lexer.line_skips:
+        return lexer.line_skips.get(pos, 0)
+    return 0
+
 @TOKEN(punctuator_regex(punctuators))
 def t_ANY_punctuator(t):
     t.type = punctuators[t.value][1]
@@ -140,30 +207,32 @@ IDENTIFIER = sub('{L}({L}|{D})*')
 @TOKEN(IDENTIFIER)
 def t_INITIAL_identifier(t):
     t.type = 'IDENTIFIER'
+    # Identifiers repeat a lot; keep one copy of each name
+    t.value = intern(t.value)
     return t
 
+def define_name(lexdata, end):
+    '''Return the type of the macro name that ends at `end` in `lexdata`,
+    and the list of its parameters, or None if it takes none.'''
+    # We need to look ahead and see if this macro takes parameters or not.
+    if end < len(lexdata) and lexdata[end] == '(':
+        # Look ahead and read macro parameter list
+        pos = end + 1
+        while lexdata[pos] not in '\n)':
+            pos+=1
+        params = lexdata[end+1 : pos]
+        paramlist = [x.strip() for x in params.split(",") if x.strip()]
+        return 'PP_DEFINE_MACRO_NAME', paramlist
+    return 'PP_DEFINE_NAME', None
+
 @TOKEN(IDENTIFIER)
 def t_DEFINE_identifier(t):
+    t.value = intern(t.value)
     if t.lexer.next_is_define_name:
         # This identifier is the name of a macro
-        # We need to look ahead and see if this macro takes parameters or not.
-        if t.lexpos + len(t.value) < t.lexer.lexlen and \
-            t.lexer.lexdata[t.lexpos + len(t.value)] == '(':
-
-            t.type = 'PP_DEFINE_MACRO_NAME'
-
-            # Look ahead and read macro parameter list
-            lexdata = t.lexer.lexdata
-            pos = t.lexpos + len(t.value) + 1
-            while lexdata[pos] not in '\n)':
-                pos+=1
-            params = lexdata[t.lexpos+len(t.value)+1 : pos]
-            paramlist = [x.strip() for x in params.split(",") if x.strip()]
-            t.lexer.macro_params = paramlist
-
-        else:
-            t.type = 'PP_DEFINE_NAME'
-
+        t.type, params = define_name(t.lexer.lexdata, t.lexpos + len(t.value))
+        if params is not None:
+            t.lexer.macro_params = params
         t.lexer.next_is_define_name = False
     elif t.value in t.lexer.macro_params:
         t.type = 'PP_MACRO_PARAM'
@@ -173,52 +242,49 @@ def t_DEFINE_identifier(t):
 
 FLOAT_LITERAL = sub(r"(?P<p1>{D}+)?(?P<dp>[.]?)(?P<p2>(?(p1){D}*|{D}+))" \
                     r"(?P<exp>(?:[Ee][+-]?{D}+)?)(?P<suf>{FS}?)(?!\w)")
-@TOKEN(FLOAT_LITERAL)
-def t_ANY_float(t):
-    t.type = 'PP_NUMBER'
-    m = t.lexer.lexmatch
-
+def float_value(m, s):
+    '''Return the value of the PP_NUMBER token for `s`, which FLOAT_LITERAL
+    matched with the match `m`.  Constants without a decimal point or an
+    exponent are integers.'''
     p1 = m.group("p1")
     dp = m.group("dp")
-    p2 = m.group("p2")
     exp = m.group("exp")
     suf = m.group("suf")
 
-    if dp or exp or (suf and suf in ("Ff")):
-        s = m.group(0)
+    if dp or exp or suf in ('F', 'f'):
         if suf:
             s = s[:-1]
-        # Attach a prefix so the parser can figure out if should become an
-        # integer, float, or long
-        t.value = "f" + s
-    elif (suf and suf in ("Ll")):
-        t.value = "l" + p1
-    else:
-        t.value = "i" + p1
-
-    return t
+        return float(s)
+    return integer_literal(long(p1), suf in ('L', 'l'))
 
-INT_LITERAL = sub(r"(?P<p1>(?:0x{H}+)|(?:{D}+))(?P<suf>{IS})")
-@TOKEN(INT_LITERAL)
-def t_ANY_int(t):
+@TOKEN(FLOAT_LITERAL)
+def t_ANY_float(t):
     t.type = 'PP_NUMBER'
-    m = t.lexer.lexmatch
-
-    if "L" in m.group(3) or "l" in m.group(2):
-        prefix = "l"
-    else:
-        prefix = "i"
+    t.value = float_value(t.lexer.lexmatch, t.value)
+    return t
 
-    g1 = m.group(2)
-    if g1.startswith("0x"):
+# The groups have other names than the ones of FLOAT_LITERAL, so that both
+# can be in one regex
+INT_LITERAL = sub(r"(?P<ip1>(?:0x{H}+)|(?:{D}+))(?P<isuf>{IS})")
+def int_value(digits, suffix):
+    '''Return the value of the PP_NUMBER token for the `digits` and
+    `suffix` INT_LITERAL matched.'''
+    if digits.startswith("0x"):
         # Convert base from hexadecimal
-        g1 = str(long(g1[2:],16))
-    elif g1[0]=="0":
+        value = long(digits[2:],16)
+    elif digits[0]=="0":
         # Convert base from octal
-        g1 = str(long(g1,8))
+        value = long(digits,8)
+    else:
+        value = long(digits)
 
-    t.value = prefix + g1
+    return integer_literal(value, "L" in suffix or "l" in digits)
 
+@TOKEN(INT_LITERAL)
+def t_ANY_int(t):
+    t.type = 'PP_NUMBER'
+    m = t.lexer.lexmatch
+    t.value = int_value(m.group("ip1"), m.group("isuf"))
     return t
 
 CHARACTER_CONSTANT = sub(r"L?'(\\.|[^\\'])+'")
@@ -231,12 +297,17 @@ STRING_LITERAL = sub(r'L?"(\\.|[^\\"])*"')
 @TOKEN(STRING_LITERAL)
 def t_ANY_string_literal(t):
     t.type = 'STRING_LITERAL'
-    t.value = StringLiteral(t.value)
+    t.value = RawStringLiteral(t.value)
     return t
 
 @TOKEN(r'\(')
 def t_ANY_lparen(t):
-    if t.lexpos == 0 or t.lexer.lexdata[t.lexpos-1] not in (' \t\f\v\n'):
+    if t.lexpos == 0:
+        # The text before this may have been given to the lexer separately
+        previous = getattr(t.lexer, 'lexprevious', None)
+    else:
+        previous = t.lexer.lexdata[t.lexpos-1]
+    if previous is None or previous not in (' \t\f\v\n'):
         t.type = 'LPAREN'
     else:
         t.type = '('
@@ -244,7 +315,7 @@ def t_ANY_lparen(t):
 
 @TOKEN(r'\n')
 def t_INITIAL_newline(t):
-    t.lexer.lineno += 1
+    t.lexer.lineno += 1 + skipped_lines(t.lexer, t.lexpos + 1)
     return None
 
 @TOKEN(r'\#define')
@@ -259,7 +330,7 @@ def t_INITIAL_pp_define(t):
 def t_DEFINE_newline(t):
     t.type = 'PP_END_DEFINE'
     t.lexer.begin("INITIAL")
-    t.lexer.lineno += 1
+    t.lexer.lineno += 1 + skipped_lines(t.lexer, t.lexpos + 1)
     del t.lexer.macro_params
 
     # Damage control in case the token immediately after the #define failed
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+'''
+Run several preprocessor processes at once.
+
+A PreprocessorPool starts a process for each job submitted to it, but never
+has more than a fixed number of them running.  Jobs are given an argument
+list rather than a shell command, and their input, if any, is piped into the
+process, so the caller doesn't need to write it to a file first.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import subprocess, threading
+
+class PreprocessorJob(object):
+    '''A command run by a PreprocessorPool.  Call `result` to wait for it to
+    finish; `returncode` is then its exit status.'''
+
+    def __init__(self, pool, argv, input=None):
+        self.argv = argv
+        self.input = input
+        self.output = None
+        self.errors = None
+        self.returncode = None
+        self.exception = None
+        self.thread = threading.Thread(target=self.run, args=(pool,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def run(self, pool):
+        pool.slots.acquire()
+        try:
+            try:
+                if self.input is None:
+                    stdin = None
+                else:
+                    stdin = subprocess.PIPE
+                process = subprocess.Popen(self.argv,
+                                           universal_newlines=True,
+                                           stdin = stdin,
+                                           stdout = subprocess.PIPE,
+                                           stderr = subprocess.PIPE)
+                self.output, self.errors = process.communicate(self.input)
+                self.returncode = process.returncode
+            except OSError, e:
+                self.exception = e
+        finally:
+            pool.slots.release()
+
+    def result(self):
+        '''Return the (output, errors) pair of the finished command.  Raises
+        the OSError if the command couldn't be started.'''
+        self.thread.join()
+        if self.exception is not None:
+            raise self.exception
+        return self.output, self.errors
+
+class PreprocessorPool(object):
+    '''Runs up to `size` commands at a time.'''
+
+    def __init__(self, size=4):
+        self.slots = threading.BoundedSemaphore(max(size, 1))
+
+    def submit(self, argv, input=None):
+        '''Start running `argv` with `input` on its standard input as soon as
+        there is a free slot, and return its PreprocessorJob.'''
+        return PreprocessorJob(self, argv, input)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+'''
+Parse the system headers once per compiler and target.
+
+Most of the preprocessor output for a set of headers usually comes from the
+C library: stdint.h, stddef.h, stdarg.h and the headers they include.  They
+are lexed and parsed on every run, only for
+remove_descriptions_in_system_headers to mark nearly everything in them
+if_needed.
+
+A Prelude keeps the handler calls the parser made for the system headers in
+one run, and the type names they declare.  Later runs leave the lines of the
+system headers out of the preprocessor output before it is lexed, and make
+the saved calls instead.
+
+The system header lines come in blocks, between the parts of the output from
+other files.  The calls are saved for each block, separately for its source
+lines and its #define lines, which are lexed after all source lines.  Where
+a block is left out, the first line of it is replaced by a marker that the
+preprocessor turns into a PP_PRELUDE token, whose value is the index of the
+calls to make.  CLexer declares the type names of those calls when it reads
+the token, and makes the calls when the parser is done with the declaration
+before the block, just as if the parser had read its lines.
+
+cpp marks the line number directives of system headers with flag 3, and
+with flags 1 and 3 where one is included.  Preludes are saved in a directory
+under a hash of all lines of the preprocessor output that come from system
+headers, so each is only used again for the same compiler, target, defines
+and system headers.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os, marshal, re
+
+import cdeclarations
+import incremental
+
+# Bump this if the layout of a prelude changes
+PRELUDE_FORMAT = 3
+
+# Line number directives, as in pplexer.DIRECTIVE, with their flags
+_directive_re = re.compile(r'^\#\s+(\d+)\s+"([^"]+)"(.*)$')
+
+# Identifiers that stand for left out blocks of system header lines
+MARKER_PREFIX = '__ctypesgen_prelude_'
+
+SOURCE, DEFINE = 0, 1
+
+class Prelude(object):
+    '''The handler calls and type names of the system headers.
+
+    `parts` holds a (type_names, calls) pair for the source lines and one
+    for the #define lines of each block of system header lines; the pairs of
+    block n are at 2n + SOURCE and 2n + DEFINE.  `signature` is the hash of
+    the lines the calls were made for.  `usable` is True once `match` found
+    a saved prelude for the lines in the preprocessor output of the current
+    run.  If there is none, the Prelude records the calls made for the
+    system headers, so that they can be saved for the next run.'''
+
+    def __init__(self, directory, salt=''):
+        self.directory = directory
+        # Anything besides the system header lines the calls depend on
+        self.salt = salt
+        self.signature = None
+        self.parts = []
+        self.files = set()
+        self.matched = False
+        self.usable = False
+        # Set if a call couldn't be told apart from its block
+        self.failed = False
+
+    def path(self):
+        return os.path.join(self.directory, self.signature + '.prelude')
+
+    def load(self):
+        '''Read the saved prelude for the current signature.  Return False
+        if there is none or it can't be used.'''
+        try:
+            f = open(self.path(), 'rb')
+            try:
+                entry = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return False
+
+        if entry.get('format') != PRELUDE_FORMAT or \
+           entry.get('signature') != self.signature:
+            return False
+        self.parts = entry['parts']
+        return True
+
+    def save(self):
+        incremental.save_entry(self.path(), {'format': PRELUDE_FORMAT,
+                                             'signature': self.signature,
+                                             'parts': self.parts})
+
+    def match(self, lines):
+        '''Find the blocks of system header lines in the preprocessor
+        output `lines`.
+
+        If there is a saved prelude for them, return a list telling for each
+        line whether to leave it out: True for the lines to leave out, except
+        for the first one of each block, which has a pair of marker lines to
+        put in the source and the #define lines instead.  Otherwise return
+        None, and start recording the calls made for the system headers.'''
+        h = incremental._digest()
+        h.update('format %d\0%s\0' % (PRELUDE_FORMAT, self.salt))
+        drop = []
+        files = set()
+        # Maps (file name, line number) to the (block, part) pairs of the
+        # line, for telling which part a call belongs to
+        locations = {}
+        blocks = 0
+        system = False
+        first = False
+        filename = None
+        lineno = 0
+        for line in lines:
+            if line.startswith('# '):
+                m = _directive_re.match(line)
+                if m:
+                    lineno = int(m.group(1))
+                    filename = m.group(2)
+                    flags = m.group(3).split()
+                    # Other files get flag 3 too where a macro from a
+                    # system header was expanded
+                    if '3' in flags and '1' in flags:
+                        files.add(filename)
+                    if '3' in flags and filename in files:
+                        if not system:
+                            blocks += 1
+                            first = True
+                            h.update('\2')
+                        system = True
+                    else:
+                        system = False
+                if system:
+                    h.update(line + '\n')
+                # The directives are kept for the line numbers
+                drop.append(False)
+                continue
+
+            if system:
+                h.update(line + '\n')
+                block = blocks - 1
+                if line.startswith('#define'):
+                    part = DEFINE
+                else:
+                    part = SOURCE
+                locations.setdefault((filename, lineno), []).append(
+                    (block, part))
+                if first:
+                    drop.append(('%s%d\n' % (MARKER_PREFIX, 2*block + SOURCE),
+                                 '%s%d\n' % (MARKER_PREFIX, 2*block + DEFINE)))
+                    first = False
+                else:
+                    drop.append(True)
+            else:
+                drop.append(False)
+            lineno += 1
+
+        self.signature = h.hexdigest()
+        self.matched = True
+        self.files = files
+        self.usable = self.load()
+        if self.usable:
+            return drop
+
+        self.failed = False
+        self.parts = [([], []) for i in range(2 * blocks)]
+        self.locations = locations
+        self.last_block = [0, 0]
+        return None
+
+    def mark(self, tokens):
+        '''Generate `tokens`, with the markers put in by `match` turned into
+        PP_PRELUDE tokens.'''
+        for t in tokens:
+            if t.type == 'IDENTIFIER' and t.value.startswith(MARKER_PREFIX):
+                t.type = 'PP_PRELUDE'
+                t.value = int(t.value[len(MARKER_PREFIX):])
+            yield t
+
+    def part(self, index):
+        '''Return the type names and the calls, as (name, args) pairs, of the
+        part of the prelude at `index`.'''
+        type_names, calls = self.parts[index]
+        return type_names, [incremental.load_call(call) for call in calls]
+
+    def record(self, name, args):
+        '''Called by the EventRecorder for each handler call.  The last two
+        arguments of all of them are the file name and line number.'''
+        if not self.matched or self.usable or args[-2] not in self.files:
+            return
+
+        # Calls are made in the order of the blocks, the ones for #define
+        # lines after all others
+        if name == 'handle_error':
+            parts = (SOURCE, DEFINE)
+        elif name == 'impl_handle_declaration':
+            parts = (SOURCE,)
+        else:
+            parts = (DEFINE,)
+        for block, part in self.locations.get(args[-2:], ()):
+            if part in parts and block >= self.last_block[part]:
+                break
+        else:
+            self.failed = True
+            return
+        self.last_block[part] = block
+
+        type_names, calls = self.parts[2*block + part]
+        if name == 'impl_handle_declaration' and \
+           args[0].storage == 'typedef' and args[0].declarator:
+            type_names.append(
+                cdeclarations.declarator_name(args[0].declarator))
+        calls.append(incremental.save_call(name, args))
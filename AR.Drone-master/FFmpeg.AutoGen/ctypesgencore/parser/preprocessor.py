@@ -11,28 +11,76 @@ Reference is C99:
 __docformat__ = 'restructuredtext'
 
 import os, re, shlex, sys, tokenize, lex, yacc, traceback, subprocess
+import threading, tempfile
+from cStringIO import StringIO
 import ctypes
 from lex import TOKEN
 import pplexer
+import bulklexer
+import ppcache
+import incremental
+import ppengine
+import pppool
+import tablecache
 
 # --------------------------------------------------------------------------
 # Lexers
 # --------------------------------------------------------------------------
 
+class LineMappedText(object):
+    '''The lines of one part of the preprocessor output, with a record of
+    where lines of the other part were left out.
+
+    `skips` maps the position of a line in the text to the number of lines
+    left out right before it.  PreprocessorLexer uses it to keep line
+    numbers as they were in the complete output.'''
+    def __init__(self):
+        self.lines = []
+        self.length = 0
+        self.skipped = 0
+        self.skips = {}
+
+    def append(self, line):
+        if self.skipped:
+            self.skips[self.length] = self.skipped
+            self.skipped = 0
+        self.lines.append(line)
+        self.length += len(line)
+
+    def skip(self):
+        self.skipped += 1
+
+    def text(self):
+        return "".join(self.lines)
+
 class PreprocessorLexer(lex.Lexer):
     def __init__(self):
         lex.Lexer.__init__(self)
         self.filename = '<input>'
         self.in_define = False
+        self.lexprevious = None
+        self.line_skips = {}
+        self.include_graph = None
 
-    def input(self, data, filename=None):
+    def input(self, data, filename=None, line_skips=None):
         if filename:
             self.filename = filename
         self.lasttoken = None
         self.input_stack = []
+        self.lexprevious = None
+        self.line_skips = line_skips or {}
+        if 0 in self.line_skips:
+            self.lineno += self.line_skips[0]
 
         lex.Lexer.input(self, data)
 
+    def continue_input(self, data):
+        '''Go on lexing with `data` as if it followed the text lexed so far,
+        keeping the current file name and line number.'''
+        if self.lexdata:
+            self.lexprevious = self.lexdata[-1]
+        lex.Lexer.input(self, data)
+
     def push_input(self, data, filename):
         self.input_stack.append(
             (self.lexdata, self.lexpos, self.filename, self.lineno))
@@ -114,91 +162,508 @@ class PreprocessorParser(object):
                              "__uint32_t=uint32_t",
                              "__uint64_t=uint64_t"]
 
+        self.defines += options.cpp_defines
+
         self.matches = []
         self.output = []
-        self.lexer = lex.lex(cls=PreprocessorLexer,
-                             optimize=1,
-                             lextab='lextab',
-                             outputdir=os.path.dirname(__file__),
-                             module=pplexer)
+        if options.table_cache_dir:
+            cache = tablecache.get_table_cache(options.table_cache_dir)
+            self.lexer = cache.lexer(PreprocessorLexer)
+        else:
+            self.lexer = lex.lex(cls=PreprocessorLexer,
+                                 optimize=1,
+                                 lextab='lextab',
+                                 outputdir=os.path.dirname(__file__),
+                                 module=pplexer)
 
         self.options = options
         self.cparser = cparser # An instance of CParser
-
-    def parse(self, filename):
-        """Parse a file and save its output"""
-
-        cmd = self.options.cpp
-        cmd += " -U __GNUC__ -dD"
+        self.engine = None
+        self.pool = None # Created when first needed
+        # The cache lookup and the preprocessor run (None on a cache hit)
+        # start() did for each file, as (cache, key, cached, job)
+        self.jobs = {}
+        self.segment_cache = None # Shared with other parsers by parse_many
+        self.prelude = None # The prelude of the system headers, if any
+        # The TokenBuffer of the output when the lexer left its line numbers
+        # to be looked up, otherwise None
+        self.line_map = None
+
+    def command(self):
+        """Return the preprocessor command as a list of arguments, without
+        the input file"""
+
+        if os.name == "nt":
+            # Backslashes are path separators on Windows, so the command is
+            # split in non-POSIX mode, which keeps the quotes around a
+            # quoted word, such as the path of a compiler under
+            # "C:\Program Files".  subprocess quotes the words again.
+            argv = []
+            for word in shlex.split(self.options.cpp, posix=False):
+                if len(word) > 1 and word[0] == word[-1] and word[0] in "\"'":
+                    word = word[1:-1]
+                argv.append(word)
+        else:
+            argv = shlex.split(self.options.cpp)
+        argv += ["-U", "__GNUC__", "-dD"]
 
         # This fixes Issue #6 where OS X 10.6+ adds a C extension that breaks
         # the parser.  Blocks shouldn't be needed for ctypesgen support anyway.
         if sys.platform == 'darwin':
-            cmd += " -U __BLOCKS__"
+            argv += ["-U", "__BLOCKS__"]
 
         for path in self.options.include_search_paths:
-            cmd += " -I%s" % path
+            argv.append("-I%s" % path)
         for define in self.defines:
-            cmd += ' "-D%s"' % define
-        cmd += ' "' + filename + '"'
-
-        self.cparser.handle_status(cmd)
-
-        pp = subprocess.Popen(cmd,
-                              shell = True,
-                              universal_newlines=True,
-                              stdout = subprocess.PIPE,
-                              stderr = subprocess.PIPE)
-        ppout, pperr = pp.communicate()
+            argv.append("-D%s" % define)
+        return argv
+
+    def lookup_cache(self, argv, filename, text):
+        """Return (cache, key, cached) for preprocessing `filename` with
+        `argv`, where `cached` is the (output, errors) pair of an earlier run
+        or None"""
+        if not self.options.preprocessor_cache_dir:
+            return None, None, None
+        cache = ppcache.PreprocessorCache(self.options.preprocessor_cache_dir)
+        key = cache.key(" ".join(argv), self.defines,
+                        self.options.include_search_paths, filename, text,
+                        argv[0])
+        return cache, key, cache.load(key, filename)
+
+    def add_input(self, argv, filename, text):
+        """Add the input file to `argv`; with `text`, cpp reads standard
+        input instead"""
+        if text is None:
+            return argv + [filename]
+        return argv + ["-"]
+
+    def start(self, filename, text=None):
+        """Start preprocessing a file in the background, so that parse()
+        only has to wait for the result.  See parse() for `text`."""
+
+        if self.options.preprocessor_engine == "python":
+            return
+        argv = self.command()
+        cache, key, cached = self.lookup_cache(argv, filename, text)
+        job = None
+        if cached is None:
+            job = self.get_pool().submit(self.add_input(argv, filename, text),
+                                         text)
+        self.jobs[filename] = (cache, key, cached, job)
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = pppool.PreprocessorPool(self.options.preprocessor_jobs)
+        return self.pool
+
+    def parse(self, filename, text=None):
+        """Parse a file and save its output.
+
+        If `text` is given it is used as the content of the file, and piped
+        into the preprocessor, so the file doesn't need to exist.  cpp calls
+        the file <stdin> then."""
+
+        self.line_map = None
+        if self.options.preprocessor_engine == "python":
+            self.parse_in_process(filename, text)
+            return
+
+        # Look for the output of an earlier run with the same input first,
+        # unless start() already did
+        ppout = None
+        argv = self.command()
+        started = self.jobs.pop(filename, None)
+        if started is None:
+            cache, key, cached = self.lookup_cache(argv, filename, text)
+            job = None
+        else:
+            cache, key, cached, job = started
+        if cached:
+            self.cparser.handle_status("Using cached preprocessor " \
+                "output for %s." % filename)
+            ppout, pperr = cached
+
+        argv = self.add_input(argv, filename, text)
+
+        if ppout is None:
+            self.cparser.handle_status(" ".join(argv))
+
+            if self.options.stream_preprocessor_output and job is None:
+                if text is None:
+                    stdin = None
+                else:
+                    stdin = subprocess.PIPE
+                # Unbuffered pipes make readline read a byte at a time
+                try:
+                    pp = subprocess.Popen(argv,
+                                          bufsize = -1,
+                                          universal_newlines=True,
+                                          stdin = stdin,
+                                          stdout = subprocess.PIPE,
+                                          stderr = subprocess.PIPE)
+                except OSError, e:
+                    self.cpp_failed(argv, filename, e)
+                    return
+                self.output = self.stream_process(pp, cache, key, filename,
+                                                  text)
+                return
+
+            if job is None:
+                job = self.get_pool().submit(argv, text)
+            try:
+                ppout, pperr = job.result()
+            except OSError, e:
+                self.cpp_failed(argv, filename, e)
+                return
+
+            # The output of a failed run names only the files it got to, so
+            # the cache couldn't tell when it would succeed
+            if cache and job.returncode == 0:
+                try:
+                    cache.store(key, filename, ppout, pperr)
+                except (IOError, OSError):
+                    self.cparser.handle_status("Couldn't save preprocessor " \
+                        "output to %s." % self.options.preprocessor_cache_dir)
 
         for line in pperr.split("\n"):
             if line:
                 self.cparser.handle_pp_error(line)
 
+        if self.options.save_preprocessed_headers:
+            self.cparser.handle_status("Saving preprocessed headers to %s." % \
+                self.options.save_preprocessed_headers)
+            try:
+                f = file(self.options.save_preprocessed_headers, "w")
+                f.write(ppout)
+                f.close()
+            except IOError:
+                self.cparser.handle_error("Couldn't save headers.", filename, 0)
+
+        self.lex_output(ppout)
+
+    def cpp_failed(self, argv, filename, e):
+        """Report that the preprocessor couldn't be started, and leave
+        nothing to parse"""
+        self.cparser.handle_error("Couldn't run the preprocessor %s: %s" % \
+            (argv[0], e.strerror or e), filename, 0)
+        self.output = []
+
+    def lex_output(self, ppout):
+        """Lex the preprocessor output `ppout` into self.output."""
+        if self.options.stream_preprocessor_output:
+            self.output = self.stream_lines(StringIO(ppout))
+            return
+
         # We separate lines that are #defines and lines that are source code
         # We put all the source lines first, then all the #define lines.
 
-        source_lines= []
-        define_lines = []
+        source = LineMappedText()
+        defines = LineMappedText()
+
+        lines = ppout.split("\n")
+        drop = None
+        if self.prelude is not None:
+            drop = self.prelude.match(lines)
 
-        for line in ppout.split("\n"):
+        for i, line in enumerate(lines):
             line = line + "\n"
             if line.startswith("# "):
                 # Line number information has to go with both groups
-                source_lines.append(line)
-                define_lines.append(line)
+                source.append(line)
+                defines.append(line)
+
+            elif drop and drop[i]:
+                # A system header line the prelude has the calls for.  The
+                # first of a block is replaced by markers for them.
+                if drop[i] is True:
+                    source.skip()
+                    defines.skip()
+                else:
+                    source.append(drop[i][0])
+                    defines.append(drop[i][1])
 
             elif line.startswith("#define"):
-                source_lines.append("\n")
-                define_lines.append(line)
+                source.skip()
+                defines.append(line)
 
             elif line.startswith("#"):
                 # It's a directive, but not a #define. Remove it
-                source_lines.append("\n")
-                define_lines.append("\n")
+                source.skip()
+                defines.skip()
 
             else:
-                source_lines.append(line)
-                define_lines.append("\n")
-
-        text = "".join(source_lines + define_lines)
+                source.append(line)
+                defines.skip()
+
+        if self.options.bulk_lexer and self.segment_cache is None:
+            # Manifests, token snapshots and parallel parses need the line
+            # of every token
+            lazy = self.options.lazy_line_numbers and \
+                not self.options.incremental_manifest and \
+                not self.options.save_token_snapshot and \
+                self.options.parser_jobs <= 1
+            tokens = bulklexer.TokenBuffer(lazy)
+            for text in (source, defines):
+                bulklexer.lex_text(self.lexer, text.text(), text.skips, tokens)
+            if lazy:
+                self.line_map = tokens
+            if drop:
+                tokens = self.prelude.mark(tokens)
+            self.output = tokens
+            return
 
+        self.output = []
+        for text in (source, defines):
+            if self.segment_cache is not None:
+                tokens = self.lex_shared(text)
+            else:
+                self.lexer.input(text.text(), line_skips=text.skips)
+                tokens = self.lex_input()
+            if drop:
+                tokens = self.prelude.mark(tokens)
+            self.output.extend(tokens)
+
+    def release_output(self):
+        """Let go of the tokens and the text of the last parse."""
+        self.output = []
+        self.line_map = None
+        self.lexer.input("")
+
+    def lex_shared(self, text):
+        """Generate the tokens of a LineMappedText, taking the tokens of the
+        lines after each line number directive from the segment cache.
+
+        The lines after a directive are lexed the same wherever they come
+        from, except for the file name and the line numbers.  So they are
+        only lexed the first time a parser sharing the cache sees them;
+        later ones get new tokens with the same types and values."""
+
+        lexer = self.lexer
+        cache = self.segment_cache.tokens
+        lines = text.lines
+        skips = text.skips
+
+        # Lines before the first directive
+        i = 0
+        pos = 0
+        while i < len(lines) and not lines[i].startswith("# "):
+            pos += len(lines[i])
+            i += 1
+        lexer.input("".join(lines[:i]), line_skips=skips)
+        for token in self.lex_input():
+            yield token
+
+        while i < len(lines):
+            # The directive sets the line number, including the lines left
+            # out right after it
+            directive = lines[i]
+            pos += len(directive)
+            i += 1
+            lexer.line_skips = {len(directive): skips.get(pos, 0)}
+            lexer.continue_input(directive)
+            for token in self.lex_input():
+                yield token
+
+            start = i
+            body_skips = []
+            offset = 0
+            while i < len(lines) and not lines[i].startswith("# "):
+                if offset and pos + offset in skips:
+                    body_skips.append((offset, skips[pos + offset]))
+                offset += len(lines[i])
+                i += 1
+            if pos + offset in skips:
+                body_skips.append((offset, skips[pos + offset]))
+            body = "".join(lines[start:i])
+            pos += offset
+
+            key = incremental.body_key(body, body_skips)
+            lineno = lexer.lineno
+            entry = cache.get(key)
+            if entry is None:
+                lexer.line_skips = dict(body_skips)
+                lexer.continue_input(body)
+                saved = []
+                for token in self.lex_input():
+                    saved.append((token.type, token.value,
+                                  token.lineno - lineno, token.lexpos))
+                    yield token
+                cache[key] = (saved, lexer.lineno - lineno)
+                continue
+
+            saved, lines_in_body = entry
+            filename = lexer.filename
+            for type, value, line, lexpos in saved:
+                token = lex.LexToken()
+                token.type = type
+                token.value = value
+                token.lineno = lineno + line
+                token.lexpos = lexpos
+                token.filename = filename
+                token.lexer = lexer
+                yield token
+            lexer.lineno = lineno + lines_in_body
+
+    def lex_input(self):
+        """Generate the tokens of the lexer's current input"""
+        while True:
+            token = self.lexer.token()
+            if token is None:
+                break
+            yield token
+
+    def stream_process(self, pp, cache, key, filename, text=None):
+        """Generate the tokens of the output of the running preprocessor
+        `pp` while it is still writing it.  `text` is written to its
+        standard input."""
+
+        # Drain stderr on the side so that cpp never blocks on a full pipe
+        errors = []
+        reader = threading.Thread(target=lambda: errors.extend(pp.stderr))
+        reader.setDaemon(True)
+        reader.start()
+
+        if text is not None:
+            def write_input():
+                pp.stdin.write(text)
+                pp.stdin.close()
+            writer = threading.Thread(target=write_input)
+            writer.setDaemon(True)
+            writer.start()
+
+        # The lines are written out as they go by, for the cache and for
+        # save_preprocessed_headers, instead of being kept in memory
+        sinks = []
+        saved = None
+        if cache:
+            saved = tempfile.TemporaryFile()
+            sinks.append(saved)
+        headers = None
         if self.options.save_preprocessed_headers:
             self.cparser.handle_status("Saving preprocessed headers to %s." % \
                 self.options.save_preprocessed_headers)
             try:
-                f = file(self.options.save_preprocessed_headers, "w")
-                f.write(text)
-                f.close()
+                headers = file(self.options.save_preprocessed_headers, "w")
+                sinks.append(headers)
             except IOError:
-                self.cparser.handle_error("Couldn't save headers.")
+                self.cparser.handle_error("Couldn't save headers.", filename, 0)
 
-        self.lexer.input(text)
-        self.output = []
+        lines = iter(pp.stdout.readline, "")
+        for token in self.stream_lines(lines, sinks):
+            yield token
 
-        while True:
-            token = self.lexer.token()
-            if token is not None:
-                self.output.append(token)
-            else:
-                break
+        pp.wait()
+        reader.join()
+        for line in errors:
+            line = line.rstrip("\n")
+            if line:
+                self.cparser.handle_pp_error(line)
+
+        if headers is not None:
+            try:
+                headers.close()
+            except IOError:
+                self.cparser.handle_error("Couldn't save headers.", filename, 0)
+
+        # As in parse(), the output of a failed run isn't cached
+        if cache and pp.returncode == 0:
+            # A cache entry is marshalled from a single string, so this is
+            # the one place the whole output is in memory at once
+            saved.seek(0)
+            ppout = saved.read()
+            try:
+                cache.store(key, filename, ppout, "".join(errors))
+            except (IOError, OSError):
+                self.cparser.handle_status("Couldn't save preprocessor " \
+                    "output to %s." % self.options.preprocessor_cache_dir)
+        if saved is not None:
+            saved.close()
+
+    def stream_lines(self, lines, sinks=()):
+        """Generate the tokens of preprocessed text, given as an iterable
+        of lines.
+
+        Source lines are lexed one at a time as they come in.  The #define
+        lines are written to a temporary file and lexed after the last
+        source line, which gives the same token order as parse() when it
+        has all the text.  Each line is also written to the files in
+        `sinks`."""
+
+        lexer = self.lexer
+        lexer.input("")
+
+        # Only the #define and line number lines go to the file.  `skips`
+        # maps the index of one of them to the number of lines left out
+        # right before it, like the skips of a LineMappedText.
+        defines = tempfile.TemporaryFile()
+        skips = {}
+        count = 0
+        skipped = 0
+        try:
+            for line in lines:
+                for sink in sinks:
+                    sink.write(line)
+                if not line.endswith("\n"):
+                    line += "\n"
+
+                if line.startswith("# ") or line.startswith("#define"):
+                    # Line number information has to go with both groups
+                    defines.write(line)
+                    if skipped:
+                        skips[count] = skipped
+                        skipped = 0
+                    count += 1
+                    if line[1] != " ":
+                        lexer.lineno += 1
+                        continue
+                elif line.startswith("#"):
+                    skipped += 1
+                    lexer.lineno += 1
+                    continue
+                else:
+                    skipped += 1
+
+                lexer.continue_input(line)
+                while True:
+                    token = lexer.token()
+                    if token is None:
+                        break
+                    yield token
+
+            defines.seek(0)
+            lexer.lineno = 1 + skips.get(0, 0)
+            lexer.input("")
+            for i, line in enumerate(defines):
+                # The lines left out after this one are counted at its end
+                after = skips.get(i + 1)
+                if after:
+                    lexer.line_skips = {len(line): after}
+                elif lexer.line_skips:
+                    lexer.line_skips = {}
+                lexer.continue_input(line)
+                while True:
+                    token = lexer.token()
+                    if token is None:
+                        break
+                    yield token
+        finally:
+            defines.close()
+
+    def parse_in_process(self, filename, text=None):
+        """Preprocess a file with ppengine instead of running cpp"""
+
+        if self.engine is None:
+            # The engine keeps the headers it has read, so keep it around
+            # for the next file
+            self.engine = ppengine.PreprocessorEngine(self.lexer,
+                self.cparser.handle_pp_error,
+                self.options.system_include_paths,
+                self.options.preprocessor_predefines)
+
+        self.cparser.handle_status("Preprocessing %s in-process." % filename)
+        if self.options.save_preprocessed_headers:
+            self.cparser.handle_status("Can't save preprocessed headers " \
+                "when preprocessing in-process.")
+
+        self.output = self.engine.preprocess(filename,
+            self.options.include_search_paths, self.defines, text)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+'''
+Keep the lexer and parser tables in a cache directory.
+
+By default the preprocessor lexer is set up from lextab.py and the C parser
+from parsetab.py, next to the grammar.  Neither file is checked against the
+grammar it was made from, and if one is missing it is written back to the
+package directory, which isn't always writable.
+
+A TableCache stores both sets of tables in one marshalled file instead,
+named after a hash of the grammar modules (pplexer.py and cgrammar.py) and
+of lex.py and yacc.py, which make the tables.  A change to any of them makes
+a new file, so the tables never get out of date.  If there is no file for
+the current hash, the tables are built from the grammar and saved, so only
+the first run pays for building them.  Files are written under a temporary
+name and renamed, so parallel runs sharing a directory never read half a
+file.  Loaded tables are kept for the rest of the process.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os, marshal, sys
+
+import lex
+import yacc
+import pplexer
+import cgrammar
+import incremental
+
+# Bump this if the layout of the cached tables changes
+TABLE_FORMAT = 1
+
+# The modules the tables are made from or with
+_modules = (pplexer, cgrammar, lex, yacc)
+
+# TableCache instances by directory
+_caches = {}
+
+def get_table_cache(directory):
+    '''Return the TableCache for `directory`, which is shared by all parsers
+    of the process.'''
+    directory = os.path.abspath(directory)
+    cache = _caches.get(directory)
+    if cache is None:
+        cache = _caches[directory] = TableCache(directory)
+    return cache
+
+def _source(module):
+    '''Return the source of `module`, or its compiled code if the source
+    isn't there.'''
+    path = module.__file__
+    if path.endswith('.pyc') or path.endswith('.pyo'):
+        if os.path.exists(path[:-1]):
+            path = path[:-1]
+    f = open(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+class TableCache(object):
+    '''The lexer and parser tables for the current grammar, saved in
+    `directory`.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.signature = None
+        self.lexer_tables = None
+        self.prototype = None
+
+    def path(self):
+        return os.path.join(self.directory, self.signature + '.tables')
+
+    def compute_signature(self):
+        h = incremental._digest()
+        h.update('format %d\0%s\0' % (TABLE_FORMAT, sys.version))
+        for module in _modules:
+            h.update('%s\0%s\0' % (module.__name__, _source(module)))
+        self.signature = h.hexdigest()
+
+    def load(self):
+        '''Read the tables saved for the current signature.  Return False if
+        there are none or they can't be used.'''
+        try:
+            f = open(self.path(), 'rb')
+            try:
+                entry = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return False
+
+        if entry.get('format') != TABLE_FORMAT or \
+           entry.get('signature') != self.signature:
+            return False
+        self.lexer_tables = entry['lexer']
+        self.prototype = yacc.prototype_from_tables(entry['parser'], cgrammar)
+        return True
+
+    def build(self):
+        '''Build the tables from the grammar, and save them.'''
+        self.lexer_tables = lex.lex(module=pplexer, optimize=0,
+                                    nowarn=1).tables()
+        # parsetab.py is only used if it was made from the current grammar,
+        # and nothing is written to the package directory
+        self.prototype = yacc.yacc(method='LALR', debug=False,
+                                   module=cgrammar, write_tables=False,
+                                   optimize=False)
+        try:
+            incremental.save_entry(self.path(), {
+                'format': TABLE_FORMAT,
+                'signature': self.signature,
+                'lexer': self.lexer_tables,
+                'parser': yacc.prototype_tables(self.prototype)})
+        except (IOError, OSError):
+            # Do without the cache if the directory can't be written
+            pass
+
+    def tables(self):
+        if self.signature is None:
+            self.compute_signature()
+            if not self.load():
+                self.build()
+
+    def lexer(self, cls):
+        '''Return a lexer of class `cls` for the pplexer rules.'''
+        self.tables()
+        lexer = cls()
+        lexer.lexoptimize = 1
+        lexer.lexmodule = pplexer
+        lexer.settables(self.lexer_tables, pplexer.__dict__)
+        return lexer
+
+    def parser_prototype(self):
+        '''Return a yacc.ParserPrototype for the cgrammar rules.'''
+        self.tables()
+        return self.prototype
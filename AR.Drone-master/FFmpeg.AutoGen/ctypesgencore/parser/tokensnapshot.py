@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+'''
+Save the preprocessor tokens of a run in a compact binary file.
+
+A snapshot lets a later run skip preprocessing and lexing altogether:
+TokenSnapshot reads the tokens straight from the file, and can be given to
+CLexer.input like any other token stream.  This makes it cheap to rerun
+only the parser and the code generator on the same input, and gives
+benchmarks a fixed input.
+
+The file starts with MAGIC and the length of a marshalled header, which
+holds the token count and three tables: the token types, the token values
+and the file names.  Each value is stored once, however often it occurs.
+After the header, padded to a multiple of 4 bytes, come the tokens, one
+fixed size record each: the index of its type, the index of its file, the
+index of its value and the difference between its line number and the one
+of the token before.  The records are read from a memory map of the file
+as the tokens are needed.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import marshal, mmap, struct
+
+import lex
+from pplexer import StringLiteral, RawStringLiteral
+
+MAGIC = 'CTGTOK3\n'
+
+# type, file, value, line number delta
+_record = struct.Struct('<HHIi')
+_length = struct.Struct('<I')
+
+# How each kind of token value is stored in the value table.  Strings are
+# stored as str, string literals as they were lexed, and numbers as they
+# are.
+_value_kinds = {str: 0, StringLiteral: 1, int: 2, long: 3, float: 4,
+                RawStringLiteral: 5}
+_number_kinds = (2, 3, 4)
+
+def save(path, tokens):
+    '''Write the preprocessor tokens `tokens` to a snapshot at `path`.'''
+    types = {}
+    files = {}
+    values = {}
+    records = []
+    lineno = 0
+    for t in tokens:
+        kind = _value_kinds.get(type(t.value))
+        if kind is None:
+            raise ValueError("Can't save token value %r" % t.value)
+        if kind in _number_kinds:
+            value = (kind, t.value)
+        elif kind == _value_kinds[RawStringLiteral]:
+            value = (kind, t.value.text)
+        else:
+            value = (kind, str(t.value))
+        records.append(_record.pack(types.setdefault(t.type, len(types)),
+                                    files.setdefault(t.filename, len(files)),
+                                    values.setdefault(value, len(values)),
+                                    t.lineno - lineno))
+        lineno = t.lineno
+
+    header = {'count': len(records),
+              'types': _table(types),
+              'files': _table(files),
+              'values': _table(values)}
+    header = marshal.dumps(header)
+    header += '\0' * (-(len(MAGIC) + _length.size + len(header)) % 4)
+
+    f = file(path, 'wb')
+    try:
+        f.write(MAGIC)
+        f.write(_length.pack(len(header)))
+        f.write(header)
+        f.write(''.join(records))
+    finally:
+        f.close()
+
+def _table(index):
+    '''Turn a dict of entries to their indexes into a list.'''
+    table = [None] * len(index)
+    for entry, i in index.items():
+        table[i] = entry
+    return table
+
+class TokenSnapshot(object):
+    '''The tokens of a snapshot saved by `save`.  Iterating over it creates
+    them one at a time.'''
+
+    def __init__(self, path):
+        f = file(path, 'rb')
+        try:
+            start = len(MAGIC) + _length.size
+            prefix = f.read(start)
+            if len(prefix) != start or not prefix.startswith(MAGIC):
+                raise ValueError('%s is not a token snapshot' % path)
+            length, = _length.unpack(prefix[len(MAGIC):])
+            header = marshal.loads(f.read(length))
+            self.count = header['count']
+            self.types = header['types']
+            self.files = header['files']
+            self.values = []
+            for kind, value in header['values']:
+                if kind == _value_kinds[StringLiteral]:
+                    value = StringLiteral('"%s"' %
+                                          value.encode('string_escape'))
+                elif kind == _value_kinds[RawStringLiteral]:
+                    value = RawStringLiteral(value)
+                elif kind not in _number_kinds:
+                    value = intern(value)
+                self.values.append(value)
+
+            self.offset = start + length
+            if self.count:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.map = None
+        finally:
+            f.close()
+        if self.count and \
+           len(self.map) < self.offset + self.count * _record.size:
+            raise ValueError('%s is truncated' % path)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        types = self.types
+        files = self.files
+        values = self.values
+        unpack = _record.unpack_from
+        size = _record.size
+        lineno = 0
+        for offset in xrange(self.offset, self.offset + self.count * size,
+                             size):
+            type, filename, value, delta = unpack(self.map, offset)
+            lineno += delta
+            t = lex.LexToken()
+            t.type = types[type]
+            t.value = values[value]
+            t.lineno = lineno
+            t.lexpos = 0
+            t.filename = files[filename]
+            yield t
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
@@ -112,7 +112,9 @@ class YaccSymbol:
 # grammar rule.   Index lookup and assignment actually assign the
 # .value attribute of the underlying YaccSymbol object.
 # The lineno() method returns the line number of a given
-# item (or 0 if not defined).   The linespan() method returns
+# item (or 0 if not defined).  A lexer can leave .lineno as None and have
+# it looked up from .lexpos by its line_number() method when lineno() is
+# called.   The linespan() method returns
 # a tuple of (startline,endline) representing the range of lines
 # for a symbol.  The lexspan() method returns a tuple (lexpos,endlexpos)
 # representing the range of positional information for a symbol.
@@ -137,7 +139,10 @@ class YaccProduction:
         return len(self.slice)
 
     def lineno(self,n):
-        return getattr(self.slice[n],"lineno",0)
+        lineno = getattr(self.slice[n],"lineno",0)
+        if lineno is None:
+            lineno = self.lexer.line_number(self.slice[n].lexpos)
+        return lineno
 
     def linespan(self,n):
         startline = getattr(self.slice[n],"lineno",0)
@@ -160,6 +165,99 @@ class YaccProduction:
         for i in range(0,n):
             self.pbstack.append(self.slice[-i-1])
 
+# A nonterminal without a position: the first symbol of its production
+# had none, or it has an empty production.  Like the symbols the parse()
+# method makes for these, it has no .lexpos.
+
+nopos = YaccSymbol()
+nopos.type = None
+nopos.lineno = 0
+
+# This class is the production object the parseopt() method passes to
+# grammar rules.  It is a list of the values of the symbols, so index lookup,
+# assignment and len() are those of a list.  One object is filled in again
+# for each reduction.  The symbols themselves are on the parser's symbol
+# stack, where a nonterminal is represented by the token it starts with (or
+# by nopos); .slice makes YaccSymbol objects out of them when it is asked
+# for.  Negative indexes count from the end of the production, not of the
+# stack, and there is no pushback() or .stack.
+
+class YaccListProduction(list):
+    __slots__ = ('parser','lexer','symstack','statestack','production')
+
+    def symbol(self,n):
+        # The shifted symbol, or the position of a nonterminal
+        if n:
+            return self.symstack[n-len(self)]
+        if len(self) == 1:
+            return nopos
+        sym = self.symstack[1-len(self)]
+        if sym.__class__ is YaccSymbol:
+            return nopos
+        return sym
+
+    def lineno(self,n):
+        sym = self.symbol(n)
+        lineno = getattr(sym,"lineno",0)
+        if lineno is None:
+            lineno = self.lexer.line_number(sym.lexpos)
+        return lineno
+
+    def linespan(self,n):
+        startline = getattr(self.symbol(n),"lineno",0)
+        return startline,startline
+
+    def lexpos(self,n):
+        return getattr(self.symbol(n),"lexpos",0)
+
+    def lexspan(self,n):
+        startpos = getattr(self.symbol(n),"lexpos",0)
+        return startpos,startpos
+
+    def get_symbol(self,n):
+        sym = self.symbol(n)
+        if n:
+            name = self.parser.state_symbols()[self.statestack[n-len(self)]]
+        else:
+            name = self.production.name
+        if sym.type != name:
+            pos = sym
+            sym = YaccSymbol()
+            sym.type = name
+            sym.value = self[n]
+            sym.lineno = pos.lineno
+            if pos is not nopos:
+                sym.filename = pos.filename
+                sym.lexpos = pos.lexpos
+        return sym
+
+    def get_slice(self):
+        return YaccSlice(self)
+    slice = property(get_slice)
+
+# The .slice of a YaccListProduction.  Its symbols are made as they are
+# looked up, as most rules only look at one of them.
+
+class YaccSlice(object):
+    __slots__ = ('production',)
+
+    def __init__(self,production):
+        self.production = production
+
+    def __getitem__(self,n):
+        production = self.production
+        if isinstance(n,slice):
+            return [production.get_symbol(i)
+                    for i in range(*n.indices(len(production)))]
+        if n < 0:
+            n += len(production)
+        if n < 0 or n >= len(production):
+            raise IndexError("slice index out of range")
+        return production.get_symbol(n)
+
+    def __len__(self):
+        return len(self.production)
+
 # The LR Parsing engine.   This is defined as a class so that multiple parsers
 # can exist in the same process.  A user never instantiates this directly.
 # Instead, the global yacc() function should be used to create a suitable Parser
@@ -173,12 +271,18 @@ class Parser:
         self.errorfunc   = None          # Error handling function
         self.action      = { }           # LR Action table
         self.goto        = { }           # LR goto table
+        self.codes       = { }           # Integer code of each grammar symbol
+        self.action_table = [ ]          # LR action table by state and code
+        self.goto_table  = [ ]           # LR goto table by state and code
+        self.prodcodes   = [ ]           # Code of the name of each production
+        self.statesymbols = None         # Symbol each state is entered with
         self.require     = { }           # Attribute require table
         self.method      = "Unknown LR"  # Table construction method used
 
         # <ah> 25 Jan 2007
         self.statestackstack = []
         self.symstackstack = []
+        self.valuestack = None           # Stack of values, for parseopt()
 
     def errok(self):
         self.errorcount = 0
@@ -191,6 +295,22 @@ class Parser:
         sym.parser = self # <tm> 25 June 2008
         self.symstack.append(sym)
         self.statestack.append(0)
+        if self.valuestack is not None:
+            self.valuestack[:] = [ None ]
+
+    def state_symbols(self):
+        '''Return a list of the name of the symbol each state is entered
+        with, by state.'''
+        if self.statesymbols is None:
+            names = dict([(code,name) for name,code in self.codes.items()])
+            symbols = [None] * len(self.action_table)
+            for table in (self.action_table, self.goto_table):
+                for row in table:
+                    for code in range(1,len(row)):
+                        if row[code] > 0:
+                            symbols[row[code]] = names[code]
+            self.statesymbols = symbols
+        return self.statesymbols
 
     def push_state(self):
         '''Save parser state and restart it.'''
@@ -207,10 +327,14 @@ class Parser:
 
     def parse(self,input=None,lexer=None,debug=0):
         lookahead = None                 # Current lookahead symbol
+        ltype = None                     # Type of the lookahead
+        lcode = 0                        # Code of the type of the lookahead
         lookaheadstack = [ ]             # Stack of lookahead symbols
-        actions = self.action            # Local reference to action table
-        goto    = self.goto              # Local reference to goto table
+        actions = self.action_table      # Local reference to action table
+        goto    = self.goto_table        # Local reference to goto table
+        codes   = self.codes             # Local reference to symbol codes
         prod    = self.productions       # Local reference to production list
+        prodcodes = self.prodcodes       # Local reference to production codes
         pslice  = YaccProduction(None)   # Production object passed to grammar rules
         pslice.parser = self             # Parser object
         self.errorcount = 0              # Used during error recovery
@@ -233,6 +357,7 @@ class Parser:
         self.statestack = statestack
         symstack   = [ ]                # Stack of grammar symbols
         self.symstack = symstack
+        self.valuestack = None
 
         pslice.stack = symstack         # Put in the production
         errtoken   = None               # Err token
@@ -259,13 +384,14 @@ class Parser:
                     lookahead = YaccSymbol()
                     lookahead.type = '$end'
                     lookahead.parser = self # <tm> 25 June 2008
+                ltype = lookahead.type
+                lcode = codes.get(ltype,0)
             if debug:
                 errorlead = ("%s . %s" % (" ".join([xx.type for xx in symstack][1:]), str(lookahead))).lstrip()
 
             # Check the action table
             s = statestack[-1]
-            ltype = lookahead.type
-            t = actions.get((s,ltype),None)
+            t = actions[s][lcode]
 
             if debug > 1:
                 print 'action', t
@@ -330,7 +456,7 @@ class Parser:
                         lookahead = None
 
                     symstack.append(sym)
-                    statestack.append(goto[statestack[-1],pname])
+                    statestack.append(goto[statestack[-1]][prodcodes[-t]])
                     continue
 
                 if t == 0:
@@ -373,6 +499,9 @@ class Parser:
                             # returned token is the next lookahead
                             lookahead = tok
                             errtoken = None
+                            if lookahead:
+                                ltype = lookahead.type
+                                lcode = codes.get(ltype,0)
                             continue
                     else:
                         if errtoken:
@@ -393,7 +522,7 @@ class Parser:
                 # entire parse has been rolled back and we're completely hosed.   The token is
                 # discarded and we just keep going.
 
-                if len(statestack) <= 1 and lookahead.type != '$end':
+                if len(statestack) <= 1 and ltype != '$end':
                     lookahead = None
                     errtoken = None
                     # Nuke the pushback stack
@@ -404,11 +533,11 @@ class Parser:
                 # at the end of the file. nuke the top entry and generate an error token
 
                 # Start nuking entries on the stack
-                if lookahead.type == '$end':
+                if ltype == '$end':
                     # Whoa. We're really hosed here. Bail out
                     return
 
-                if lookahead.type != 'error':
+                if ltype != 'error':
                     sym = symstack[-1]
                     if sym.type == 'error':
                         # Hmmm. Error is on top of stack, we'll just nuke input
@@ -422,9 +551,207 @@ class Parser:
                     t.value = lookahead
                     lookaheadstack.append(lookahead)
                     lookahead = t
+                    ltype = 'error'
+                    lcode = codes.get(ltype,0)
+                else:
+                    symstack.pop()
+                    statestack.pop()
+
+                continue
+
+            # Call an error function here
+            raise RuntimeError("yacc: internal parser error!!!\n")
+
+    def parseopt(self,input=None,lexer=None):
+        '''Parse like parse(), without the debugging output and with less
+        work for each token.
+
+        The values of the symbols are kept on a stack of their own, and the
+        symbol stack only holds the tokens that were shifted, so neither a
+        shift nor a reduction allocates a symbol.  The integer code of the
+        lookahead is looked up once, not for every action.  Grammar rules are
+        passed a YaccListProduction, which has no pushback().'''
+        lookahead = None                 # Current lookahead symbol
+        ltype = None                     # Type of the lookahead
+        lcode = 0                        # Integer code of the lookahead
+        lookaheadstack = [ ]             # Stack of lookahead symbols
+        actions = self.action_table      # Local reference to action table
+        goto    = self.goto_table        # Local reference to goto table
+        codes   = self.codes             # Local reference to symbol codes
+        prod    = self.productions       # Local reference to production list
+        prodcodes = self.prodcodes       # Local reference to production codes
+        self.errorcount = 0              # Used during error recovery
+
+        # If no lexer was given, we will try to use the lex module
+        if not lexer:
+            import lex
+            lexer = lex.lexer
+
+        # If input was supplied, pass to lexer
+        if input:
+            lexer.input(input)
+
+        # Tokenize function
+        get_token = lexer.token
+
+        # The start state is assumed to be (0,$end)
+        sym = YaccSymbol()
+        sym.type = '$end'
+        sym.parser = self
+        statestack = [ 0 ]              # Stack of parsing states
+        self.statestack = statestack
+        symstack   = [ sym ]            # Stack of tokens and positions
+        self.symstack = symstack
+        valuestack = [ None ]           # Stack of symbol values
+        self.valuestack = valuestack
+
+        pslice  = YaccListProduction()  # Production object passed to grammar rules
+        pslice.parser = self
+        pslice.lexer = lexer
+        pslice.symstack = symstack
+        pslice.statestack = statestack
+        errtoken   = None               # Err token
+
+        while True:
+            if not lookahead:
+                if not lookaheadstack:
+                    lookahead = get_token()     # Get the next token
+                else:
+                    lookahead = lookaheadstack.pop()
+                if not lookahead:
+                    lookahead = YaccSymbol()
+                    lookahead.type = '$end'
+                    lookahead.parser = self
+                ltype = lookahead.type
+                lcode = codes.get(ltype,0)
+
+            # Check the action table
+            t = actions[statestack[-1]][lcode]
+
+            if t is not None:
+                if t > 0:
+                    # shift a symbol on the stack
+                    if ltype == '$end':
+                        # Error, end of input
+                        sys.stderr.write("yacc: Parse error. EOF\n")
+                        return
+                    statestack.append(t)
+                    symstack.append(lookahead)
+                    valuestack.append(lookahead.value)
+                    lookahead = None
+
+                    # Decrease error count on successful shift
+                    if self.errorcount > 0:
+                        self.errorcount -= 1
+
+                    continue
+
+                if t < 0:
+                    # reduce a symbol on the stack, emit a production
+                    p = prod[-t]
+                    plen = p.len
+
+                    # The children stay on the stacks while the rule runs
+                    pslice[:] = valuestack[-plen-1:]
+                    pslice[0] = None
+                    pslice.production = p
+                    p.func(pslice)
+
+                    # A nonterminal takes the position of its first symbol
+                    if plen:
+                        sym = symstack[-plen]
+                        if sym.__class__ is YaccSymbol:
+                            sym = nopos
+                    else:
+                        sym = nopos
+                    if plen == 1:
+                        valuestack[-1] = pslice[0]
+                        symstack[-1] = sym
+                        statestack[-1] = goto[statestack[-2]][prodcodes[-t]]
+                    else:
+                        if plen:
+                            del valuestack[-plen:]
+                            del symstack[-plen:]
+                            del statestack[-plen:]
+                        valuestack.append(pslice[0])
+                        symstack.append(sym)
+                        statestack.append(goto[statestack[-1]][prodcodes[-t]])
+                    continue
+
+                if t == 0:
+                    return valuestack[-1]
+
+            if t == None:
+                # A syntax error, recovered from as parse() does
+                if not self.errorcount:
+                    self.errorcount = error_count
+                    errtoken = lookahead
+
+                    if self.errorfunc:
+                        global errok,token,restart
+                        errok = self.errok        # Set some special functions available in error recovery
+                        token = get_token
+                        restart = self.restart
+                        tok = self.errorfunc(errtoken)
+                        del errok, token, restart   # Delete special functions
+
+                        if not self.errorcount:
+                            # User must have done some kind of panic
+                            # mode recovery on their own.  The
+                            # returned token is the next lookahead
+                            lookahead = tok
+                            errtoken = None
+                            if lookahead:
+                                ltype = lookahead.type
+                                lcode = codes.get(ltype,0)
+                            continue
+                    else:
+                        if errtoken:
+                            if hasattr(errtoken,"lineno"): lineno = lookahead.lineno
+                            else: lineno = 0
+                            if lineno:
+                                sys.stderr.write("yacc: Syntax error at line %d, token=%s\n" % (lineno, errtoken.type))
+                            else:
+                                sys.stderr.write("yacc: Syntax error, token=%s" % errtoken.type)
+                        else:
+                            sys.stderr.write("yacc: Parse error in input. EOF\n")
+                            return
+
+                else:
+                    self.errorcount = error_count
+
+                # case 1: the entire parse has been rolled back.  The token
+                # is discarded and we just keep going.
+                if len(statestack) <= 1 and ltype != '$end':
+                    lookahead = None
+                    errtoken = None
+                    # Nuke the pushback stack
+                    del lookaheadstack[:]
+                    continue
+
+                # case 2: at the end of the file.  Bail out
+                if ltype == '$end':
+                    return
+
+                if ltype != 'error':
+                    if symstack[-1].type == 'error':
+                        # Error is on top of stack, we'll just nuke input
+                        # symbol and continue
+                        lookahead = None
+                        continue
+                    t = YaccSymbol()
+                    t.type = 'error'
+                    if hasattr(lookahead,"lineno"):
+                        t.lineno = lookahead.lineno
+                    t.value = lookahead
+                    lookaheadstack.append(lookahead)
+                    lookahead = t
+                    ltype = 'error'
+                    lcode = codes.get(ltype,0)
                 else:
                     symstack.pop()
                     statestack.pop()
+                    valuestack.pop()
 
                 continue
 
@@ -2234,8 +2561,119 @@ class ParserPrototype(object):
         parser.goto   = self.goto
         parser.method = self.method
         parser.require = self.require
+        if not hasattr(self, 'codes'):
+            self.codes, self.action_table, self.goto_table, self.prodcodes = \
+                code_tables(self.action, self.goto, self.productions)
+        parser.codes = self.codes
+        parser.action_table = self.action_table
+        parser.goto_table = self.goto_table
+        parser.prodcodes = self.prodcodes
         return parser
 
+# -----------------------------------------------------------------------------
+# code_tables()
+#
+# Numbers the grammar symbols and turns the action and goto tables, which are
+# dictionaries keyed by (state,symbol) tuples, into lists with a list for
+# each state that is indexed by the code of a symbol.  The parser then looks
+# up actions without building and hashing a tuple for each one.  Code 0 isn't
+# used by any symbol, so unknown symbols can be looked up as 0 to get None.
+# Returns a tuple (codes,action_table,goto_table,prodcodes), where prodcodes
+# has the code of the name of each production.
+# -----------------------------------------------------------------------------
+
+def code_tables(action,goto,productions):
+    symbols = { }
+    states = 0
+    for table in (action,goto):
+        for state,name in table.keys():
+            symbols[name] = 1
+            states = max(states,state+1)
+    names = symbols.keys()
+    names.sort()
+    codes = { }
+    for name in names:
+        codes[name] = len(codes) + 1
+
+    action_table = [ ]
+    goto_table = [ ]
+    for i in range(states):
+        action_table.append([None] * (len(codes) + 1))
+        goto_table.append([None] * (len(codes) + 1))
+    for (state,name),value in action.items():
+        action_table[state][codes[name]] = value
+    for (state,name),value in goto.items():
+        goto_table[state][codes[name]] = value
+
+    prodcodes = [ ]
+    for p in productions:
+        if p:
+            prodcodes.append(codes.get(p.name,0))
+        else:
+            prodcodes.append(0)
+    return codes,action_table,goto_table,prodcodes
+
+# -----------------------------------------------------------------------------
+# prototype_tables()
+#
+# Returns the tables of a ParserPrototype as a dictionary of strings, numbers,
+# tuples, lists and dictionaries, which can be marshalled.  The productions
+# are stored as in a parsetab file, with the names of their functions, and
+# the action and goto tables only as made by code_tables(), which is all the
+# parser uses.  prototype_from_tables() makes a ParserPrototype from such a
+# dictionary, looking up the functions in module, without building the
+# grammar again.  Its action and goto dictionaries are left empty.
+# -----------------------------------------------------------------------------
+
+def prototype_tables(prototype):
+    productions = [ ]
+    for p in prototype.productions:
+        if not p:
+            productions.append(None)
+        elif getattr(p,"func",None):
+            productions.append((p.name,p.len,p.func.__name__,p.file,p.line))
+        else:
+            productions.append((p.name,p.len,None,None,None))
+    if not hasattr(prototype,'codes'):
+        prototype.codes, prototype.action_table, prototype.goto_table, \
+            prototype.prodcodes = code_tables(prototype.action, prototype.goto,
+                                              prototype.productions)
+    return { 'productions'  : productions,
+             'method'       : prototype.method,
+             'codes'        : prototype.codes,
+             'action_table' : prototype.action_table,
+             'goto_table'   : prototype.goto_table,
+             'prodcodes'    : prototype.prodcodes }
+
+def prototype_from_tables(tables,module):
+    ldict = module.__dict__
+    productions = [ ]
+    for p in tables['productions']:
+        if not p:
+            productions.append(None)
+        else:
+            m = MiniProduction()
+            m.name = p[0]
+            m.len  = p[1]
+            m.file = p[3]
+            m.line = p[4]
+            if p[2]:
+                m.func = ldict[p[2]]
+            productions.append(m)
+
+    g = ParserPrototype("xyzzy")
+    g.productions = productions
+    g.errorfunc = ldict.get('p_error')
+    g.action = { }
+    g.goto   = { }
+    g.method = tables['method']
+    g.require = { }
+    g.codes = tables['codes']
+    g.action_table = tables['action_table']
+    g.goto_table = tables['goto_table']
+    g.prodcodes = tables['prodcodes']
+    return g
+
 # yacc_cleanup function.  Delete all of the global variables
 # used during table construction
 
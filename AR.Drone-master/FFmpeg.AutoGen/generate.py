@@ -477,9 +477,54 @@ class Options:
                'FFmpeg/include/libswscale/swscale.h']
     other_headers = []
     cpp = 'gcc -v -E'
+    # Extra NAME=VALUE defines for the preprocessor
+    cpp_defines = []
     include_search_paths = ['./FFmpeg/include']
     all_headers = True
     save_preprocessed_headers = False
+    # Where to save the preprocessor tokens, and where to read them from
+    # instead of running the preprocessor
+    save_token_snapshot = None
+    token_snapshot = None
+    preprocessor_cache_dir = None
+    stream_preprocessor_output = False
+    # Lex the preprocessor output in one pass into arrays of token fields
+    bulk_lexer = False
+    # With bulk_lexer, only work out the line numbers of the tokens that
+    # end up in a declaration or an error message
+    lazy_line_numbers = False
+    # How many cpp processes parse_many() runs at once
+    preprocessor_jobs = 4
+    # 'cpp' runs the cpp command above, 'python' preprocesses in-process.
+    # The two only give the same output when system_include_paths and
+    # preprocessor_predefines are the search path and macros of that cpp
+    preprocessor_engine = 'cpp'
+    system_include_paths = []
+    preprocessor_predefines = None
+    # e.g. './FFmpeg.AutoGen/FFmpegInvoke.manifest' to only reparse the
+    # headers that changed since the last run
+    incremental_manifest = None
+    # With a manifest, reparse only the declarations that changed in a
+    # changed header, rather than all of it
+    incremental_declarations = False
+    # e.g. './FFmpeg.AutoGen/prelude' to parse the system headers only once
+    # for this compiler and target
+    system_header_prelude_dir = None
+    # e.g. './FFmpeg.AutoGen/tables' to keep the lexer and parser tables
+    # there instead of in lextab.py and parsetab.py
+    table_cache_dir = None
+    # Parse with yacc's parseopt() driver, which keeps plain values on its
+    # stacks instead of a symbol object for each one
+    optimized_parser = False
+    # How many processes parse chunks of the preprocessed headers at once;
+    # 1 parses them in this process
+    parser_jobs = 1
+    # Give the parser function bodies as {} and leave out __attribute__ and
+    # asm, which only inline helpers and compiler hints have in them
+    skip_function_bodies = False
+    # Only build the types of declarations of headers outside
+    # output_only_from_paths where one of the output refers to them
+    early_path_filter = False
     other_known_names = []
     builtin_symbols = False
     exclude_symbols = []
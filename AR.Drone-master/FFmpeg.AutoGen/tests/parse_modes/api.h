@@ -0,0 +1,98 @@
+/* A small API in the style of the FFmpeg headers */
+#include "types.h"
+
+#define API_MAKE_TAG(a, b, c, d) ((a) | ((b) << 8) | ((c) << 16) | ((d) << 24))
+#define API_MAX(a, b) ((a) > (b) ? (a) : (b))
+#define API_ERROR(e) (-(e))
+#define API_EOF API_ERROR(API_MAKE_TAG('E', 'O', 'F', ' '))
+
+typedef struct Buffer {
+    uint8_t *data;
+    size_t size;
+    int refcount;
+} Buffer;
+
+typedef struct Packet {
+    Buffer *buf;
+    Timestamp pts;
+    Timestamp dts;
+    uint8_t *data;
+    int size;
+    int stream_index;
+    int flags;
+    struct {
+        uint8_t *data;
+        int size;
+    } side_data[4];
+    int64_t duration;
+} Packet;
+
+typedef union Value {
+    int64_t i64;
+    double dbl;
+    const char *str;
+    Rational q;
+} Value;
+
+typedef struct Option {
+    const char *name;
+    const char *help;
+    int offset;
+    enum {
+        OPTION_INT,
+        OPTION_DOUBLE,
+        OPTION_STRING
+    } type;
+    Value default_val;
+    double min;
+    double max;
+    unsigned flags : 4;
+    unsigned deprecated : 1;
+} Option;
+
+typedef struct Codec {
+    const char *name;
+    MediaType type;
+    int id;
+    int capabilities;
+    const Rational *supported_framerates;
+    const int *supported_samplerates;
+    const Option *options;
+    int (*init)(struct CodecContext *ctx);
+    int (*decode)(struct CodecContext *ctx, void *out, int *got, Packet *pkt);
+    int (*close)(struct CodecContext *ctx);
+    void (*flush)(struct CodecContext *ctx);
+} Codec;
+
+typedef struct CodecContext {
+    const Codec *codec;
+    void *priv_data;
+    int bit_rate;
+    int width, height;
+    Rational time_base;
+    Rational sample_aspect_ratio;
+    int sample_rate;
+    int channels;
+    uint64_t channel_layout;
+    int (*get_buffer)(struct CodecContext *s, Buffer *buf, int flags);
+    void (*log)(void *ctx, int level, const char *fmt, ...);
+} CodecContext;
+
+unsigned api_version(void);
+const char *api_configuration(void);
+Codec *api_find_decoder(int id);
+Codec *api_find_decoder_by_name(const char *name);
+CodecContext *api_alloc_context(const Codec *codec);
+void api_free_context(CodecContext **ctx);
+int api_open(CodecContext *ctx, const Codec *codec, void **options);
+int api_decode(CodecContext *ctx, void *out, int *got, const Packet *pkt);
+Packet *api_packet_alloc(void);
+void api_packet_free(Packet **pkt);
+int api_packet_ref(Packet *dst, const Packet *src);
+void api_packet_unref(Packet *pkt);
+int api_rescale(int64_t a, Rational bq, Rational cq);
+Rational api_mul_q(Rational b, Rational c);
+double api_q2d(Rational a);
+int api_log(void *ctx, int level, const char *fmt, ...);
+extern const char *const api_media_names[MEDIA_NB];
+extern int api_log_level;
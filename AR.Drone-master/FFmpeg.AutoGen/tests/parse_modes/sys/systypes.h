@@ -0,0 +1,28 @@
+#ifndef SYSTYPES_H
+#define SYSTYPES_H
+
+typedef signed char int8_t;
+typedef short int16_t;
+typedef int int32_t;
+typedef long long int64_t;
+typedef unsigned char uint8_t;
+typedef unsigned short uint16_t;
+typedef unsigned int uint32_t;
+typedef unsigned long long uint64_t;
+typedef unsigned long size_t;
+
+#define INT8_MAX 127
+#define INT32_MAX 2147483647
+#define UINT64_MAX 18446744073709551615ULL
+
+typedef struct {
+    int quot;
+    int rem;
+} div_t;
+
+typedef struct sys_file SYS_FILE;
+SYS_FILE *sys_open(const char *path, const char *mode);
+int sys_close(SYS_FILE *file);
+div_t div(int numer, int denom);
+
+#endif
@@ -0,0 +1,33 @@
+/* Types the API header builds on */
+#ifndef TYPES_H
+#define TYPES_H
+
+#include <systypes.h>
+
+#define API_VERSION_MAJOR 3
+#define API_VERSION_MINOR 14
+#define API_VERSION ((API_VERSION_MAJOR << 16) | API_VERSION_MINOR)
+#define API_SCALE 1.00000000000001
+#define API_NAME "api\tname"
+
+typedef struct Rational {
+    int num;
+    int den;
+} Rational;
+
+enum {
+    API_FLAG_NONE = 0,
+    API_FLAG_FAST = 1 << 0,
+    API_FLAG_SAFE = 1 << 1
+};
+
+typedef enum MediaType {
+    MEDIA_UNKNOWN = -1,
+    MEDIA_VIDEO,
+    MEDIA_AUDIO,
+    MEDIA_NB
+} MediaType;
+
+typedef int64_t Timestamp;
+
+#endif
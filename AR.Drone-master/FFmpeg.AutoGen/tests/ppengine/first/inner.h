@@ -0,0 +1,3 @@
+#define INNER_FIRST 1
+int first_inner;
+#include_next <inner.h>
@@ -0,0 +1,7 @@
+#ifndef GUARDED_H
+#define GUARDED_H
+
+#define GUARDED_VALUE (1 << 2)
+int guarded;
+
+#endif /* GUARDED_H */
@@ -0,0 +1,14 @@
+/* Headers protected by an include guard or #pragma once are only read
+   once */
+#include "guarded.h"
+#include "once.h"
+#include "guarded.h"
+#include "once.h"
+
+#if defined(GUARDED_H) && GUARDED_VALUE > 2 && !defined(MISSING)
+int guarded_seen = GUARDED_VALUE;
+#elif GUARDED_VALUE
+int guarded_wrong;
+#else
+int guarded_none;
+#endif
@@ -0,0 +1,4 @@
+/* #include_next finds the next header of the same name on the path */
+#include <inner.h>
+
+int outer = INNER_FIRST + INNER_SECOND;
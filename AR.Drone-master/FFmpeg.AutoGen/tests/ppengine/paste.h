@@ -0,0 +1,19 @@
+/* Token pasting and stringizing */
+#define CAT(a, b) a ## b
+#define XCAT(a, b) CAT(a, b)
+#define STR(x) #x
+#define XSTR(x) STR(x)
+#define PREFIX av_
+#define FIELD(type, name) type field_ ## name;
+#define VERSION_MAJOR 58
+#define VERSION_MINOR 18
+
+int CAT(av_, log)(int level);
+int XCAT(PREFIX, free)(void *ptr);
+const char *version = XSTR(VERSION_MAJOR.VERSION_MINOR);
+const char *name = STR(  spaced   out  );
+struct fields {
+    FIELD(int, width)
+    FIELD(unsigned long, height)
+};
+int CAT(, empty) = CAT(1, 0) + CAT(0x, 1F);
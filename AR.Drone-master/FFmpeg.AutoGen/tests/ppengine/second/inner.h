@@ -0,0 +1,2 @@
+#define INNER_SECOND 2
+int second_inner;
@@ -0,0 +1,15 @@
+/* Variadic macros, including the GNU forms */
+#define CALL(f, ...) f(__VA_ARGS__)
+#define LOG(fmt, ...) printf(fmt, ##__VA_ARGS__)
+#define NAMED(fmt, args...) printf(fmt, args)
+#define COUNT(...) count(0, ##__VA_ARGS__)
+#define FIRST(x, ...) x
+#define WRAP(...) { __VA_ARGS__ }
+
+int a = CALL(f, 1, 2, 3);
+int b = CALL(g);
+void c(void) { LOG("x"); LOG("%d %d", 1, 2); }
+void d(void) { NAMED("%s", "y"); }
+int e = COUNT() + COUNT(1, 2);
+int g = FIRST(4, 5, 6);
+int h[] = WRAP(1, (2, 3), 4);
@@ -0,0 +1,214 @@
+'''
+Checks that the ways of reusing earlier work give the same descriptions as
+a plain parse of the same headers, before and after they are edited: a
+parallel parse, the replay of an incremental manifest and the replay of a
+system header prelude.  The headers are copied from tests/parse_modes; the
+ones in its sys directory are system headers.  Needs gcc.  Run from the
+FFmpeg.AutoGen directory with
+
+    python -m unittest discover tests
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+from ctypesgencore import ctypedescs
+from ctypesgencore.options import get_default_options
+from ctypesgencore.parser.datacollectingparser import DataCollectingParser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'parse_modes')
+
+
+class QuietParser(DataCollectingParser):
+    '''Keeps the errors and status messages instead of printing them.'''
+
+    def __init__(self, headers, options):
+        DataCollectingParser.__init__(self, headers, options)
+        self.errors = []
+        self.statuses = []
+
+    def handle_error(self, message, filename, lineno):
+        self.errors.append('%s:%d: %s' % (filename, lineno, message))
+
+    def handle_pp_error(self, message):
+        self.errors.append(message)
+
+    def handle_status(self, message):
+        self.statuses.append(message)
+
+
+def spelling(item):
+    '''Return the Python spelling of a type or expression of a
+    description.'''
+    if hasattr(item, 'py_string'):
+        try:
+            return item.py_string()
+        except TypeError:
+            return item.py_string(True)
+    return repr(item)
+
+
+def describe(data):
+    '''Return a list of strings that tells apart any two different
+    DescriptionCollections.'''
+    result = []
+    for kind, desc in data.output_order:
+        if kind in ('typedef', 'variable'):
+            detail = spelling(desc.ctype)
+        elif kind == 'function':
+            detail = '%s(%s)%s' % (spelling(desc.restype),
+                                   ', '.join(map(spelling, desc.argtypes)),
+                                   desc.variadic)
+        elif kind in ('struct', 'struct-body', 'enum'):
+            detail = repr([(name, spelling(member))
+                           for name, member in desc.members or []])
+        elif kind == 'constant':
+            detail = spelling(desc.value)
+        elif kind == 'macro':
+            detail = '%r %s %r' % (desc.params, spelling(desc.expr),
+                                   desc.errors)
+        else:
+            detail = ''
+        result.append('%s %s %s %s' % (kind, desc.casual_name(), desc.src,
+                                       detail))
+    return result
+
+
+@unittest.skipUnless(find_executable('gcc'), 'needs gcc to preprocess')
+class ParseModesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'headers')
+        shutil.copytree(FIXTURES, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, name, text):
+        f = open(self.path(name), 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+    def edit(self, name, old, new):
+        f = open(self.path(name))
+        try:
+            text = f.read()
+        finally:
+            f.close()
+        self.assertTrue(old in text)
+        self.write(name, text.replace(old, new, 1))
+
+    def parse(self, headers=('api.h',), **settings):
+        '''Return the description of a parse of `headers` with the options
+        `settings`.  The parser is left in self.parser.'''
+        options = get_default_options()
+        # Only the system headers of the fixtures, and no compiler
+        # predefines
+        options.cpp = 'gcc -E -undef -nostdinc -isystem %s' % \
+            self.path('sys')
+        options.no_python_types = True
+        for name, value in settings.items():
+            setattr(options, name, value)
+        ctypedescs.last_tagnum = 0
+        parser = QuietParser([self.path(h) for h in headers], options)
+        parser.parse()
+        self.assertEqual(parser.errors, [])
+        self.parser = parser
+        return describe(parser.data())
+
+    def reported(self, start):
+        '''Return the status message of the last parse starting with
+        `start`, or None.'''
+        for message in self.parser.statuses:
+            if message.startswith(start):
+                return message
+        return None
+
+    def edit_headers(self):
+        '''Make changes to the fixtures that move lines and anonymous type
+        numbers, and change values.'''
+        self.edit('types.h', '#define API_VERSION_MINOR 14',
+                  'enum { API_EXTRA_FLAG = 4 };\n'
+                  '#define API_VERSION_MINOR 15')
+        self.edit('types.h', '1.00000000000001', '1.00000000000002')
+        self.edit('api.h', '    int flags;\n',
+                  '    int flags;\n    struct { int x, y; } origin;\n')
+        self.edit('api.h', 'int api_log_level;',
+                  'int api_log_level;\ntypedef Timestamp Duration;\n'
+                  'Duration api_duration(const Packet *pkt);')
+
+    def test_parallel(self):
+        for edited in (False, True):
+            if edited:
+                self.edit_headers()
+            expected = self.parse()
+            self.assertEqual(self.parse(parser_jobs=2), expected)
+            # The calls of the worker processes were used
+            self.assertTrue(self.parser.lexer.skipped > 0)
+
+    def check_manifest(self, declarations):
+        manifest = dict(incremental_manifest=self.path('manifest'),
+                        incremental_declarations=declarations)
+        expected = self.parse()
+        self.assertEqual(self.parse(**manifest), expected)
+        self.assertEqual(self.parse(**manifest), expected)
+        self.assertTrue(self.reported('No headers changed'))
+
+        self.edit_headers()
+        expected = self.parse()
+        self.assertEqual(self.parse(**manifest), expected)
+        self.assertTrue(self.reported('2 of 3 headers changed'))
+        self.assertTrue(self.reported('Reused the declarations of'))
+
+    def test_manifest(self):
+        self.check_manifest(False)
+
+    def test_manifest_declarations(self):
+        self.check_manifest(True)
+
+    def test_prelude(self):
+        prelude = dict(system_header_prelude_dir=self.path('prelude'))
+        expected = self.parse()
+        self.assertEqual(self.parse(**prelude), expected)
+        self.assertEqual(self.parse(**prelude), expected)
+        self.assertTrue(self.reported('Using the prelude'))
+
+        self.edit_headers()
+        expected = self.parse()
+        self.assertEqual(self.parse(**prelude), expected)
+        self.assertTrue(self.reported('Using the prelude'))
+
+        # Another system header needs another prelude
+        self.edit('sys/systypes.h', 'typedef int int32_t;',
+                  'typedef int int32_t;\ntypedef long ssize_t;')
+        expected = self.parse()
+        self.assertEqual(self.parse(**prelude), expected)
+        self.assertTrue(self.reported('No prelude'))
+        self.assertEqual(self.parse(**prelude), expected)
+        self.assertTrue(self.reported('Using the prelude'))
+
+    def test_manifest_sees_edited_float(self):
+        # str() of both values is 1.0
+        self.write('float.h', '#define X 1.00000000000001\n'
+                              'int f(void);\n')
+        manifest = dict(incremental_manifest=self.path('manifest'),
+                        incremental_declarations=True)
+        self.parse(['float.h'], **manifest)
+        self.write('float.h', '#define X 1.00000000000002\n'
+                              'int f(void);\n')
+        expected = self.parse(['float.h'])
+        self.assertTrue([d for d in expected if '1.00000000000002' in d])
+        self.assertEqual(self.parse(['float.h'], **manifest), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
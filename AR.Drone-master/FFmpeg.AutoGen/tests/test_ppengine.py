@@ -0,0 +1,91 @@
+'''
+Checks that the in-process preprocessor (preprocessor_engine = "python")
+gives the same tokens as lexing the output of `cpp -dD`, for the headers in
+tests/ppengine.  Needs gcc.  Run from the FFmpeg.AutoGen directory with
+
+    python -m unittest discover tests
+'''
+
+import os
+import unittest
+from distutils.spawn import find_executable
+
+from ctypesgencore.options import get_default_options
+from ctypesgencore.parser import cparser, pplexer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'ppengine')
+
+
+class QuietParser(cparser.CParser):
+    '''Keeps the preprocessor errors instead of printing them.'''
+
+    def __init__(self, options):
+        cparser.CParser.__init__(self, options)
+        self.pp_errors = []
+
+    def handle_pp_error(self, message):
+        self.pp_errors.append(message)
+
+    def handle_status(self, message):
+        pass
+
+
+def preprocess(name, engine, include_paths=()):
+    '''Return the errors and the tokens of the fixture header `name` as
+    (file, line, type, value) tuples, leaving out the tokens of predefined
+    macros.'''
+    options = get_default_options()
+    # No system headers or compiler predefines on either side
+    options.cpp = 'gcc -E -undef -nostdinc'
+    options.preprocessor_engine = engine
+    options.preprocessor_predefines = []
+    options.include_search_paths = [os.path.join(FIXTURES, path)
+                                    for path in include_paths]
+
+    parser = QuietParser(options)
+    pp = parser.preprocessor_parser
+    pp.parse(os.path.join(FIXTURES, name))
+    tokens = []
+    for t in pp.output:
+        filename = os.path.normpath(os.path.abspath(t.filename))
+        if not filename.startswith(FIXTURES):
+            continue
+        value = t.value
+        if isinstance(value, pplexer.RawStringLiteral):
+            value = value.text
+        tokens.append((os.path.relpath(filename, FIXTURES), t.lineno,
+                       t.type, value))
+    return parser.pp_errors, tokens
+
+
+@unittest.skipUnless(find_executable('gcc'), 'needs gcc to compare with')
+class EngineMatchesCppTest(unittest.TestCase):
+
+    def check(self, name, include_paths=()):
+        cpp_errors, expected = preprocess(name, 'cpp', include_paths)
+        self.assertEqual(cpp_errors, [])
+        errors, tokens = preprocess(name, 'python', include_paths)
+        self.assertEqual(errors, [])
+        self.assertTrue(expected)
+        for i, (token, cpp_token) in enumerate(zip(tokens, expected)):
+            self.assertEqual(token, cpp_token,
+                             'token %d: %r, cpp gives %r' % (i, token,
+                                                             cpp_token))
+        self.assertEqual(len(tokens), len(expected))
+
+    def test_pasting(self):
+        self.check('paste.h')
+
+    def test_variadic(self):
+        self.check('variadic.h')
+
+    def test_include_next(self):
+        self.check('include_next.h', ['first', 'second'])
+
+    def test_include_guards(self):
+        self.check('guards.h')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+'''
+Checks of the values the preprocessor lexer gives numeric constants.  Run
+from the FFmpeg.AutoGen directory with
+
+    python -m unittest discover tests
+'''
+
+import unittest
+
+from ctypesgencore.options import get_default_options
+from ctypesgencore.parser import cparser
+
+
+def lex_numbers(text):
+    '''Return the values of the PP_NUMBER tokens of the source line
+    `text`.'''
+    parser = cparser.CParser(get_default_options())
+    parser.preprocessor_parser.lex_output('# 1 "<test>"\n%s\n' % text)
+    return [t.value for t in parser.preprocessor_parser.output
+            if t.type == 'PP_NUMBER']
+
+
+class NumberValueTest(unittest.TestCase):
+
+    def check(self, text, value, kind):
+        result, = lex_numbers(text)
+        self.assertEqual(result, value)
+        self.assertTrue(type(result) is kind,
+                        '%s lexed as %r' % (text, type(result)))
+
+    def test_floats(self):
+        self.check('1.5', 1.5, float)
+        self.check('1e3', 1000.0, float)
+
+    def test_float_suffixes(self):
+        self.check('1.5f', 1.5, float)
+        self.check('1.5F', 1.5, float)
+        self.check('1.5L', 1.5, float)
+
+    def test_integers(self):
+        self.check('10', 10, int)
+        self.check('0x10', 16, int)
+        self.check('0x10U', 16, int)
+
+    def test_long_integers(self):
+        self.check('10L', 10, long)
+        self.check('0x10UL', 16, long)
+        self.check('0x10ULL', 16, long)
+        self.check('0x8000000000000000', 0x8000000000000000, long)
+
+
+if __name__ == '__main__':
+    unittest.main()